@@ -3,7 +3,7 @@ Agent Lightning Integration for LINE Calendar Bot
 """
 
 from .config import AgentLightningConfig, TASK_TYPES, PROMPT_TEMPLATES
-from .collector import DataCollector, get_collector, Interaction
+from .collector import DataCollector, SQLiteCollector, create_collector, get_collector, Interaction
 from .optimizer import AgentOptimizer, LineCalendarAgent
 
 __version__ = "1.0.0"
@@ -12,6 +12,8 @@ __all__ = [
     "TASK_TYPES",
     "PROMPT_TEMPLATES",
     "DataCollector",
+    "SQLiteCollector",
+    "create_collector",
     "get_collector",
     "Interaction",
     "AgentOptimizer",
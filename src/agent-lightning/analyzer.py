@@ -0,0 +1,116 @@
+"""
+Response Analyzer
+/api/analyze の応答分析を内容ハッシュをキーにした LRU キャッシュ付きで行う
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import AgentLightningConfig
+from features import ResponseFeatures, extract_batch_features
+from metrics import ANALYZE_CACHE_REQUESTS, REWARDS
+from optimizer import AgentOptimizer, sample_key
+
+
+def reward_level(reward: float) -> str:
+    return "excellent" if reward > 0.7 else "good" if reward > 0.3 else "needs_improvement" if reward > 0 else "poor"
+
+
+class ResponseAnalyzer:
+    """
+    応答を分析して報酬を推定する
+
+    結果は (task_type, user_message, bot_response) のハッシュをキーにした
+    LRU キャッシュ（最大 analyze_cache_size 件）に保持する。テンプレートから
+    生成された同じ応答の再分析はキャッシュから返し、キャッシュに無い応答は
+    特徴量をまとめて取り出して、報酬と分析結果の両方をそこから求める。
+    """
+
+    def __init__(self, optimizer: AgentOptimizer, config: Optional[AgentLightningConfig] = None):
+        self.config = config or optimizer.config
+        self.capacity = self.config.analyze_cache_size
+        self._scorer = optimizer.create_batch_scorer()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def analyze(self, user_message: str, bot_response: str, task_type: Optional[str] = None) -> Dict[str, Any]:
+        """1件の応答を分析"""
+        return self.analyze_batch([{
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "task_type": task_type,
+        }])[0]
+
+    def analyze_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        複数の応答をまとめて分析
+
+        Args:
+            items: user_message, bot_response, task_type (optional) を持つ辞書のリスト
+
+        Returns:
+            items と同じ順序の分析結果
+        """
+        keys = [sample_key(item["user_message"], item["bot_response"], item.get("task_type")) for item in items]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+                else:
+                    missing.setdefault(key, []).append(i)
+            hits = len(items) - sum(len(positions) for positions in missing.values())
+            self.hits += hits
+            self.misses += len(items) - hits
+        ANALYZE_CACHE_REQUESTS.inc(hits, result="hit")
+        ANALYZE_CACHE_REQUESTS.inc(len(items) - hits, result="miss")
+
+        if missing:
+            responses = [items[positions[0]]["bot_response"] for positions in missing.values()]
+            features = extract_batch_features(responses)
+            rewards = self._scorer.score_features(features).tolist()
+            analyzed = {}
+            for j, ((key, positions), reward) in enumerate(zip(missing.items(), rewards)):
+                analyzed[key] = self._analysis(features[j], reward)
+                for i in positions:
+                    results[i] = analyzed[key]
+            with self._lock:
+                for key, analysis in analyzed.items():
+                    self._cache[key] = analysis
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+
+        for analysis in results:
+            REWARDS.observe(analysis["reward"], source="analyze")
+        # キャッシュ内の辞書を呼び出し元が書き換えないようコピーして返す
+        return [dict(analysis) for analysis in results]
+
+    @staticmethod
+    def _analysis(features: ResponseFeatures, reward: float) -> Dict[str, Any]:
+        return {
+            "reward": reward,
+            "reward_level": reward_level(reward),
+            "response_length": features.length,
+            "has_success_indicator": features.has_success,
+            "has_error_indicator": features.has_error,
+            "has_emoji": features.has_emoji,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの件数とヒット率"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -4,16 +4,36 @@ Agent Lightning API Server
 Node.js LINE Bot から呼び出すための REST API
 """
 
-import json
 import os
+import signal
+import sys
+import time
+import zlib
 from datetime import datetime
-from typing import Optional
-from flask import Flask, request, jsonify
+from typing import Any, Dict, Iterable, Iterator
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 
+from analyzer import ResponseAnalyzer
 from config import AgentLightningConfig, TASK_TYPES
-from collector import DataCollector, get_collector
-from optimizer import AgentOptimizer, LineCalendarAgent
+from dedup import normalize_dedup_mode
+from collector import get_collector
+from optimizer import AgentOptimizer
+from profiling import normalize_profile_mode
+from prompts import prompt_etag
+from telemetry import get_emitter
+from jobs import JOB_FAILED, NO_TRAINING_DATA, JobQueueFull, OptimizationJobManager
+from metrics import (
+    ANALYZE_CACHE_ENTRIES,
+    COLLECTOR_DISK_BYTES,
+    COLLECTOR_INTERACTIONS,
+    COLLECTOR_MEMORY_BYTES,
+    COLLECTOR_WINDOW_INTERACTIONS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    REGISTRY,
+    TELEMETRY_EVENTS,
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -22,7 +42,61 @@ CORS(app)
 config = AgentLightningConfig.from_env()
 collector = get_collector()
 optimizer = AgentOptimizer(config)
-agent = LineCalendarAgent(config)
+# /api/prompt と最適化で同じプロンプトストアを使う
+agent = optimizer.agent
+jobs = OptimizationJobManager(optimizer, collector, config)
+analyzer = ResponseAnalyzer(optimizer, config)
+
+RECORD_REQUIRED_FIELDS = ["user_id", "task_type", "user_message", "bot_response"]
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    """ルートごとのリクエスト数とレイテンシを記録"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        # ラベルの種類が増えないよう、URL ではなくルートのパターンを使う
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    return response
+
+
+def _collect_storage_metrics():
+    """スクレイプ時にコレクターのゲージを更新"""
+    metrics = collector.storage_metrics()
+    COLLECTOR_INTERACTIONS.set(metrics["interactions"])
+    COLLECTOR_WINDOW_INTERACTIONS.set(metrics["window_interactions"])
+    COLLECTOR_MEMORY_BYTES.set(metrics["memory_bytes"])
+    for kind, size in metrics["disk_bytes"].items():
+        COLLECTOR_DISK_BYTES.set(size, kind=kind)
+
+
+ANALYZE_CACHE_ENTRIES.set_function(lambda: analyzer.stats()["size"])
+TELEMETRY_EVENTS.set_function(lambda: {
+    (name,): value
+    for name, value in get_emitter(config).stats().items()
+    if isinstance(value, (int, float))
+})
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Prometheus 形式のメトリクス
+
+    値はこのプロセス内のもの。複数ワーカーで動かす場合はワーカーごとに集計される。
+    """
+    try:
+        _collect_storage_metrics()
+    except Exception as e:
+        print(f"Warning: Failed to collect storage metrics: {e}")
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/health", methods=["GET"])
@@ -31,6 +105,7 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "agent-lightning",
+        "data_ready": collector.is_ready(),
         "timestamp": datetime.now().isoformat(),
     })
 
@@ -52,8 +127,7 @@ def record_interaction():
     """
     data = request.json
 
-    required_fields = ["user_id", "task_type", "user_message", "bot_response"]
-    for field in required_fields:
+    for field in RECORD_REQUIRED_FIELDS:
         if field not in data:
             return jsonify({"error": f"Missing required field: {field}"}), 400
 
@@ -75,6 +149,45 @@ def record_interaction():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/record/batch", methods=["POST"])
+def record_interactions():
+    """
+    複数のインタラクションをまとめて記録
+
+    Request Body:
+    {
+        "interactions": [
+            {"user_id": ..., "task_type": ..., "user_message": ..., "bot_response": ..., "context": ..., "reward": ...},
+            ...
+        ]
+    }
+    """
+    data = request.json or {}
+    items = data.get("interactions")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing interactions"}), 400
+    if len(items) > config.record_batch_limit:
+        return jsonify({"error": f"Too many interactions (max {config.record_batch_limit})"}), 413
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({"error": f"interactions[{i}] must be an object"}), 400
+        for field in RECORD_REQUIRED_FIELDS:
+            if field not in item:
+                return jsonify({"error": f"Missing required field: {field} (interactions[{i}])"}), 400
+
+    try:
+        interaction_ids = collector.record_interactions(items)
+
+        return jsonify({
+            "success": True,
+            "interaction_ids": interaction_ids,
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/reward", methods=["POST"])
 def set_reward():
     """
@@ -116,98 +229,300 @@ def get_statistics():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/training-data", methods=["GET"])
+def query_training_data():
+    """
+    トレーニングデータを絞り込んでページ単位で取得
+
+    Query Parameters:
+        task_type: タスクの種類 (optional)
+        user_id: ユーザーID (optional)
+        since: この時刻以降 (ISO 8601, optional)
+        until: この時刻より前 (ISO 8601, optional)
+        min_reward: 最小報酬値 (optional)
+        max_reward: 最大報酬値 (optional)
+        cursor: 前のページの next_cursor (optional)
+        limit: 1ページの件数 (optional, default: 100)
+    """
+    limit = request.args.get("limit", 100, type=int)
+    if not 0 < limit <= config.query_max_limit:
+        return jsonify({"error": f"limit must be between 1 and {config.query_max_limit}"}), 400
+
+    try:
+        page = collector.query_training_data(
+            task_type=request.args.get("task_type"),
+            user_id=request.args.get("user_id"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            min_reward=request.args.get("min_reward", type=float),
+            max_reward=request.args.get("max_reward", type=float),
+            cursor=request.args.get("cursor"),
+            limit=limit,
+        )
+        return jsonify({
+            "data": page["data"],
+            "count": len(page["data"]),
+            "next_cursor": page["next_cursor"],
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/telemetry", methods=["GET"])
+def get_telemetry():
+    """Agent Lightning 発行キューのカウンター (queued / sent / dropped など) を取得"""
+    return jsonify(get_emitter(config).stats())
+
+
 @app.route("/api/prompt", methods=["GET"])
 def get_prompt():
     """
     最適化済みプロンプトを取得
 
+    ETag を返すので、If-None-Match を付けたリクエストはプロンプトが
+    変わっていなければ 304 Not Modified になる。
+
     Query Parameters:
         task_type: タスクの種類 (optional)
     """
     task_type = request.args.get("task_type")
 
     try:
-        prompt = agent.get_system_prompt(task_type)
-        return jsonify({
-            "task_type": task_type or "default",
-            "prompt": prompt,
-            "is_optimized": task_type in agent.optimized_prompts if task_type else False,
-        })
+        prompt, is_optimized, version = agent.prompt_store.get(task_type)
+        if not is_optimized:
+            prompt = agent.system_prompt
+        etag = prompt_etag(task_type, version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                "task_type": task_type or "default",
+                "prompt": prompt,
+                "is_optimized": is_optimized,
+                "version": version,
+            })
+        response.set_etag(etag)
+        # キャッシュしてよいが、使う前に毎回 If-None-Match で確認する
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _parse_num_iterations(data: Dict[str, Any]) -> int:
+    """
+    /api/optimize の num_iterations を取り出す（省略時は 100）
+
+    Raises:
+        ValueError: 正の整数でない場合
+    """
+    num_iterations = data.get("num_iterations", 100)
+    if isinstance(num_iterations, bool) or not isinstance(num_iterations, int) or num_iterations <= 0:
+        raise ValueError("num_iterations must be a positive integer")
+    return num_iterations
+
+
 @app.route("/api/optimize", methods=["POST"])
 def run_optimization():
     """
-    最適化を実行
+    最適化ジョブを投入
+
+    最適化はバックグラウンドで実行され、すぐに job_id を返す。
+    進捗は GET /api/optimize/jobs/<job_id> で確認する。
 
     Request Body:
     {
         "num_iterations": int (optional, default: 100),
-        "min_reward": float (optional)
+        "min_reward": float (optional),
+        "profile": "phases" | "cprofile" | bool (optional, default: AGL_OPTIMIZATION_PROFILE),
+        "full": bool (optional, default: false) - true の場合はチェックポイントを使わずに全件を処理
+        "wait": bool (optional, default: false) - true の場合は完了まで待って結果を返す
     }
     """
     data = request.json or {}
-    num_iterations = data.get("num_iterations", 100)
+    try:
+        num_iterations = _parse_num_iterations(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     min_reward = data.get("min_reward")
 
+    profile = None
+    if "profile" in data:
+        try:
+            profile = normalize_profile_mode(data["profile"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
     try:
-        training_data = collector.get_training_data(min_reward=min_reward)
+        job = jobs.submit(
+            num_iterations=num_iterations,
+            min_reward=min_reward,
+            profile=profile,
+            full_recompute=bool(data.get("full")),
+        )
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+
+    if not data.get("wait"):
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+        }), 202
 
-        if not training_data:
+    job.done_event.wait()
+    if job.status == JOB_FAILED:
+        if job.error == NO_TRAINING_DATA:
             return jsonify({
-                "error": "No training data available",
+                "error": job.error,
                 "suggestion": "Record some interactions first using /api/record"
             }), 400
+        return jsonify({"error": job.error, "job_id": job.id}), 500
 
-        results = optimizer.run_optimization(
-            training_data,
-            num_iterations=num_iterations,
-        )
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "results": job.result,
+    })
 
-        return jsonify({
-            "success": True,
-            "results": {
-                "num_samples": results["num_samples"],
-                "best_reward": results["best_reward"],
-                "avg_final_reward": results["avg_final_reward"],
-                "start_time": results["start_time"],
-                "end_time": results["end_time"],
-            },
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/optimize/jobs", methods=["GET"])
+def list_optimization_jobs():
+    """最適化ジョブの一覧を取得（新しい順）"""
+    return jsonify({
+        "jobs": [job.to_dict() for job in jobs.list()],
+    })
+
+
+@app.route("/api/optimize/jobs/<job_id>", methods=["GET"])
+def get_optimization_job(job_id: str):
+    """最適化ジョブの状態と進捗を取得"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/optimize/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_optimization_job(job_id: str):
+    """最適化ジョブをキャンセル"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "cancel_requested": job.cancel_event.is_set(),
+    })
 
 
 @app.route("/api/export", methods=["GET"])
 def export_data():
-    """トレーニングデータをエクスポート"""
+    """
+    トレーニングデータをエクスポート
+
+    Query Parameters:
+        format: json | jsonl | jsonl.gz (optional, default: json / ストリーミング時は jsonl)
+        stream: true の場合はファイルに保存せず chunked レスポンスとして返す (optional)
+        min_reward: 最小報酬値 (optional)
+        dedup: off | drop | weight - ほぼ同じインタラクションの扱い (optional, default: AGL_DEDUP_MODE)
+    """
+    stream = request.args.get("stream", "false").lower() == "true"
+    fmt = request.args.get("format")
+    min_reward = request.args.get("min_reward", type=float)
+    dedup = request.args.get("dedup")
+
     try:
-        output_path = collector.export_for_training()
-        training_data = collector.get_training_data()
+        dedup = normalize_dedup_mode(dedup) if dedup else None
+        if stream:
+            fmt = fmt or "jsonl"
+            if fmt not in ("jsonl", "jsonl.gz"):
+                return jsonify({"error": f"Unsupported stream format: {fmt}"}), 400
+
+            lines = collector.iter_export_lines(min_reward=min_reward, dedup=dedup)
+            if fmt == "jsonl.gz":
+                return Response(
+                    stream_with_context(_gzip_chunks(lines)),
+                    mimetype="application/gzip",
+                    headers={"Content-Disposition": "attachment; filename=export.jsonl.gz"},
+                )
+            return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+        export = collector.export_training_data(fmt=fmt, min_reward=min_reward, dedup=dedup)
 
         return jsonify({
             "success": True,
-            "output_path": output_path,
-            "num_samples": len(training_data),
-            "statistics": collector.get_statistics(),
+            "output_path": export["output_path"],
+            "format": export["format"],
+            "num_samples": export["total_samples"],
+            "duplicates": export["duplicates"],
+            "statistics": export["statistics"],
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _gzip_chunks(lines: Iterable[str]) -> Iterator[bytes]:
+    """行を gzip 圧縮しながら逐次返す"""
+    compressor = zlib.compressobj(wbits=31)
+    for line in lines:
+        chunk = compressor.compress(line.encode("utf-8"))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
 @app.route("/api/history", methods=["GET"])
 def get_optimization_history():
-    """最適化履歴を取得"""
+    """
+    最適化履歴の要約を取得（報酬の推移は /api/history/<run_id> で取得）
+
+    Query Parameters:
+        sort: start_time | end_time | best_reward | avg_final_reward | num_samples (optional, default: start_time)
+        order: asc | desc (optional, default: desc)
+        offset: 読み飛ばす件数 (optional, default: 0)
+        limit: 1ページの件数 (optional, default: 100)
+    """
+    limit = request.args.get("limit", 100, type=int)
+    offset = request.args.get("offset", 0, type=int)
+    order = request.args.get("order", "desc")
+    if not 0 < limit <= config.query_max_limit:
+        return jsonify({"error": f"limit must be between 1 and {config.query_max_limit}"}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must not be negative"}), 400
+    if order not in ("asc", "desc"):
+        return jsonify({"error": f"Unsupported order: {order}"}), 400
+
     try:
-        history = optimizer.get_optimization_history()
-        return jsonify({
-            "history": history,
-            "total_runs": len(history),
-        })
+        page = optimizer.get_optimization_history(
+            sort_by=request.args.get("sort", "start_time"),
+            descending=order == "desc",
+            offset=offset,
+            limit=limit,
+        )
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/history/<run_id>", methods=["GET"])
+def get_optimization_result(run_id: str):
+    """最適化結果の詳細（イテレーションごとの報酬を含む）を取得"""
+    try:
+        results = optimizer.get_optimization_result(run_id)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    if results is None:
+        return jsonify({"error": f"Optimization run {run_id} not found"}), 404
+    return jsonify(results)
 
 
 @app.route("/api/task-types", methods=["GET"])
@@ -236,24 +551,46 @@ def analyze_response():
         return jsonify({"error": "Missing user_message or bot_response"}), 400
 
     try:
-        reward_fn = optimizer.create_reward_function()
-        reward = reward_fn(
-            data["user_message"],
-            data["bot_response"],
-            {"task_type": data.get("task_type")},
-        )
+        analysis = analyzer.analyze(data["user_message"], data["bot_response"], data.get("task_type"))
+        return jsonify(analysis)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # 詳細な分析
-        analysis = {
-            "reward": reward,
-            "reward_level": "excellent" if reward > 0.7 else "good" if reward > 0.3 else "needs_improvement" if reward > 0 else "poor",
-            "response_length": len(data["bot_response"]),
-            "has_success_indicator": any(kw in data["bot_response"] for kw in ["完了", "登録", "作成", "設定"]),
-            "has_error_indicator": any(kw in data["bot_response"] for kw in ["エラー", "失敗", "できません"]),
-            "has_emoji": any(e in data["bot_response"] for e in ["✅", "📅", "⏰", "📝", "🔔"]),
-        }
 
-        return jsonify(analysis)
+@app.route("/api/analyze/batch", methods=["POST"])
+def analyze_responses():
+    """
+    複数の応答をまとめて分析
+
+    Request Body:
+    {
+        "items": [
+            {"user_message": "string", "bot_response": "string", "task_type": "string" (optional)},
+            ...
+        ]
+    }
+
+    Response の results は items と同じ順序。cache は分析キャッシュの累計。
+    """
+    data = request.json or {}
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing items"}), 400
+    if len(items) > config.analyze_batch_limit:
+        return jsonify({"error": f"Too many items (max {config.analyze_batch_limit})"}), 413
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or "user_message" not in item or "bot_response" not in item:
+            return jsonify({"error": f"Missing user_message or bot_response (items[{i}])"}), 400
+
+    try:
+        results = analyzer.analyze_batch(items)
+        return jsonify({
+            "results": results,
+            "count": len(results),
+            "cache": analyzer.stats(),
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -265,6 +602,9 @@ def main():
     print(f"  Port: {config.api_port}")
     print(f"  Data directory: {config.data_dir}")
 
+    # Cloud Run の停止時 (SIGTERM) にも atexit でスナップショットを保存する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     app.run(
         host=config.api_host,
         port=config.api_port,
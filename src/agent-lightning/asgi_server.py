@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Agent Lightning ASGI Server
+api_server.py と同じルート・レスポンスを Starlette で提供する非同期版
+
+記録はグループコミットの Future を await するので、コミット待ちの
+リクエストがスレッドを占有しない。その他のディスク I/O や集計は
+スレッドプールで実行する。コレクター・最適化・ジョブなどのインスタンスは
+api_server.py のものを共有する。
+
+起動: uvicorn asgi_server:app --host 0.0.0.0 --port 8081
+"""
+
+import asyncio
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from api_server import (
+    RECORD_REQUIRED_FIELDS,
+    _collect_storage_metrics,
+    _gzip_chunks,
+    _parse_num_iterations,
+    agent,
+    analyzer,
+    collector,
+    config,
+    jobs,
+    optimizer,
+)
+from config import TASK_TYPES
+from dedup import normalize_dedup_mode
+from jobs import JOB_FAILED, NO_TRAINING_DATA, JobQueueFull
+from metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, REGISTRY
+from profiling import normalize_profile_mode
+from prompts import prompt_etag
+from telemetry import get_emitter
+
+
+def error(message: str, status_code: int, **extra: Any) -> JSONResponse:
+    return JSONResponse({"error": message, **extra}, status_code=status_code)
+
+
+async def json_body(request: Request) -> Tuple[Optional[Dict[str, Any]], Optional[JSONResponse]]:
+    """リクエストボディの JSON オブジェクト（不正なら 400 のレスポンス）"""
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return None, error("Invalid JSON body", 400)
+    if not isinstance(data, dict):
+        return None, error("JSON body must be an object", 400)
+    return data, None
+
+
+def query_arg(request: Request, name: str, default: Any = None, type: Any = None) -> Any:
+    """Flask の request.args.get と同じく、変換できない値は default として扱う"""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    if type is None:
+        return value
+    try:
+        return type(value)
+    except ValueError:
+        return default
+
+
+async def health_check(request: Request) -> Response:
+    """ヘルスチェック"""
+    return JSONResponse({
+        "status": "healthy",
+        "service": "agent-lightning",
+        "data_ready": collector.is_ready(),
+        "timestamp": datetime.now().isoformat(),
+    })
+
+
+async def get_metrics(request: Request) -> Response:
+    """Prometheus 形式のメトリクス"""
+    try:
+        await run_in_threadpool(_collect_storage_metrics)
+    except Exception as e:
+        print(f"Warning: Failed to collect storage metrics: {e}")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+async def record_interaction(request: Request) -> Response:
+    """インタラクションを記録（コミットをスレッドを使わずに待つ）"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+
+    for field in RECORD_REQUIRED_FIELDS:
+        if field not in data:
+            return error(f"Missing required field: {field}", 400)
+
+    try:
+        interaction_ids, future = collector.submit_interactions([data])
+        await asyncio.wrap_future(future)
+        return JSONResponse({
+            "success": True,
+            "interaction_id": interaction_ids[0],
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def record_interactions(request: Request) -> Response:
+    """複数のインタラクションをまとめて記録"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+    items = data.get("interactions")
+
+    if not isinstance(items, list) or not items:
+        return error("Missing interactions", 400)
+    if len(items) > config.record_batch_limit:
+        return error(f"Too many interactions (max {config.record_batch_limit})", 413)
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return error(f"interactions[{i}] must be an object", 400)
+        for field in RECORD_REQUIRED_FIELDS:
+            if field not in item:
+                return error(f"Missing required field: {field} (interactions[{i}])", 400)
+
+    try:
+        interaction_ids, future = collector.submit_interactions(items)
+        await asyncio.wrap_future(future)
+        return JSONResponse({
+            "success": True,
+            "interaction_ids": interaction_ids,
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def set_reward(request: Request) -> Response:
+    """インタラクションに報酬を設定"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+
+    if "interaction_id" not in data or "reward" not in data:
+        return error("Missing interaction_id or reward", 400)
+
+    try:
+        await run_in_threadpool(
+            collector.set_reward,
+            interaction_id=data["interaction_id"],
+            reward=data["reward"],
+            feedback=data.get("feedback"),
+        )
+        return JSONResponse({"success": True})
+    except ValueError as e:
+        return error(str(e), 404)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_statistics(request: Request) -> Response:
+    """データ統計を取得"""
+    try:
+        return JSONResponse(await run_in_threadpool(collector.get_statistics))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def query_training_data(request: Request) -> Response:
+    """トレーニングデータを絞り込んでページ単位で取得"""
+    limit = query_arg(request, "limit", 100, int)
+    if not 0 < limit <= config.query_max_limit:
+        return error(f"limit must be between 1 and {config.query_max_limit}", 400)
+
+    try:
+        page = await run_in_threadpool(
+            collector.query_training_data,
+            task_type=query_arg(request, "task_type"),
+            user_id=query_arg(request, "user_id"),
+            since=query_arg(request, "since"),
+            until=query_arg(request, "until"),
+            min_reward=query_arg(request, "min_reward", type=float),
+            max_reward=query_arg(request, "max_reward", type=float),
+            cursor=query_arg(request, "cursor"),
+            limit=limit,
+        )
+        return JSONResponse({
+            "data": page["data"],
+            "count": len(page["data"]),
+            "next_cursor": page["next_cursor"],
+        })
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_telemetry(request: Request) -> Response:
+    """Agent Lightning 発行キューのカウンターを取得"""
+    return JSONResponse(get_emitter(config).stats())
+
+
+async def get_prompt(request: Request) -> Response:
+    """最適化済みプロンプトを取得（ETag / If-None-Match 対応）"""
+    task_type = query_arg(request, "task_type")
+
+    try:
+        prompt, is_optimized, version = agent.prompt_store.get(task_type)
+        if not is_optimized:
+            prompt = agent.system_prompt
+        etag = prompt_etag(task_type, version)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse({
+            "task_type": task_type or "default",
+            "prompt": prompt,
+            "is_optimized": is_optimized,
+            "version": version,
+        }, headers=headers)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/").strip('"') == etag for tag in tags)
+
+
+async def run_optimization(request: Request) -> Response:
+    """最適化ジョブを投入"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+    try:
+        num_iterations = _parse_num_iterations(data)
+    except ValueError as e:
+        return error(str(e), 400)
+    min_reward = data.get("min_reward")
+
+    profile = None
+    if "profile" in data:
+        try:
+            profile = normalize_profile_mode(data["profile"])
+        except ValueError as e:
+            return error(str(e), 400)
+
+    try:
+        # ジョブの投入・取得・キャンセルは jobs.json をロックして読み書きするのでスレッドプールで行う
+        job = await run_in_threadpool(
+            jobs.submit,
+            num_iterations=num_iterations,
+            min_reward=min_reward,
+            profile=profile,
+            full_recompute=bool(data.get("full")),
+        )
+    except JobQueueFull as e:
+        return error(str(e), 429)
+
+    if not data.get("wait"):
+        return JSONResponse({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+        }, status_code=202)
+
+    await run_in_threadpool(job.done_event.wait)
+    if job.status == JOB_FAILED:
+        if job.error == NO_TRAINING_DATA:
+            return error(job.error, 400, suggestion="Record some interactions first using /api/record")
+        return error(job.error, 500, job_id=job.id)
+
+    return JSONResponse({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "results": job.result,
+    })
+
+
+async def list_optimization_jobs(request: Request) -> Response:
+    """最適化ジョブの一覧を取得（新しい順）"""
+    return JSONResponse({
+        "jobs": [job.to_dict() for job in await run_in_threadpool(jobs.list)],
+    })
+
+
+async def get_optimization_job(request: Request) -> Response:
+    """最適化ジョブの状態と進捗を取得"""
+    job_id = request.path_params["job_id"]
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        return error(f"Job {job_id} not found", 404)
+    return JSONResponse(job.to_dict())
+
+
+async def cancel_optimization_job(request: Request) -> Response:
+    """最適化ジョブをキャンセル"""
+    job_id = request.path_params["job_id"]
+    job = await run_in_threadpool(jobs.cancel, job_id)
+    if job is None:
+        return error(f"Job {job_id} not found", 404)
+    return JSONResponse({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "cancel_requested": job.cancel_event.is_set(),
+    })
+
+
+async def export_data(request: Request) -> Response:
+    """トレーニングデータをエクスポート（ストリーミングはスレッドプールで読み進める）"""
+    stream = query_arg(request, "stream", "false").lower() == "true"
+    fmt = query_arg(request, "format")
+    min_reward = query_arg(request, "min_reward", type=float)
+    dedup = query_arg(request, "dedup")
+
+    try:
+        dedup = normalize_dedup_mode(dedup) if dedup else None
+        if stream:
+            fmt = fmt or "jsonl"
+            if fmt not in ("jsonl", "jsonl.gz"):
+                return error(f"Unsupported stream format: {fmt}", 400)
+
+            lines = collector.iter_export_lines(min_reward=min_reward, dedup=dedup)
+            if fmt == "jsonl.gz":
+                return StreamingResponse(
+                    _gzip_chunks(lines),
+                    media_type="application/gzip",
+                    headers={"Content-Disposition": "attachment; filename=export.jsonl.gz"},
+                )
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        export = await run_in_threadpool(collector.export_training_data, fmt=fmt, min_reward=min_reward, dedup=dedup)
+        return JSONResponse({
+            "success": True,
+            "output_path": export["output_path"],
+            "format": export["format"],
+            "num_samples": export["total_samples"],
+            "duplicates": export["duplicates"],
+            "statistics": export["statistics"],
+        })
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_optimization_history(request: Request) -> Response:
+    """最適化履歴の要約を取得"""
+    limit = query_arg(request, "limit", 100, int)
+    offset = query_arg(request, "offset", 0, int)
+    order = query_arg(request, "order", "desc")
+    if not 0 < limit <= config.query_max_limit:
+        return error(f"limit must be between 1 and {config.query_max_limit}", 400)
+    if offset < 0:
+        return error("offset must not be negative", 400)
+    if order not in ("asc", "desc"):
+        return error(f"Unsupported order: {order}", 400)
+
+    try:
+        page = await run_in_threadpool(
+            optimizer.get_optimization_history,
+            sort_by=query_arg(request, "sort", "start_time"),
+            descending=order == "desc",
+            offset=offset,
+            limit=limit,
+        )
+        return JSONResponse(page)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_optimization_result(request: Request) -> Response:
+    """最適化結果の詳細を取得"""
+    run_id = request.path_params["run_id"]
+    try:
+        results = await run_in_threadpool(optimizer.get_optimization_result, run_id)
+    except Exception as e:
+        return error(str(e), 500)
+    if results is None:
+        return error(f"Optimization run {run_id} not found", 404)
+    return JSONResponse(results)
+
+
+async def get_task_types(request: Request) -> Response:
+    """利用可能なタスクタイプを取得"""
+    return JSONResponse({
+        "task_types": TASK_TYPES,
+    })
+
+
+async def analyze_response(request: Request) -> Response:
+    """応答を分析して報酬を推定"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+
+    if "user_message" not in data or "bot_response" not in data:
+        return error("Missing user_message or bot_response", 400)
+
+    try:
+        return JSONResponse(analyzer.analyze(data["user_message"], data["bot_response"], data.get("task_type")))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def analyze_responses(request: Request) -> Response:
+    """複数の応答をまとめて分析（キャッシュに無い応答の採点はスレッドプールで行う）"""
+    data, invalid = await json_body(request)
+    if invalid:
+        return invalid
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return error("Missing items", 400)
+    if len(items) > config.analyze_batch_limit:
+        return error(f"Too many items (max {config.analyze_batch_limit})", 413)
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or "user_message" not in item or "bot_response" not in item:
+            return error(f"Missing user_message or bot_response (items[{i}])", 400)
+
+    try:
+        results = await run_in_threadpool(analyzer.analyze_batch, items)
+        return JSONResponse({
+            "results": results,
+            "count": len(results),
+            "cache": analyzer.stats(),
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+class RequestMetricsMiddleware:
+    """
+    ルートごとのリクエスト数とレイテンシを記録する ASGI ミドルウェア
+
+    ルートのラベルは api_server.py と揃えて /api/optimize/jobs/<job_id> の形にする。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            label = _PATH_PARAM.sub(r"<\1>", route.path) if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=label, method=scope["method"])
+            HTTP_REQUESTS.inc(route=label, method=scope["method"], status=str(status))
+
+
+_PATH_PARAM = re.compile(r"\{(\w+)(?::\w+)?\}")
+
+routes = [
+    Route("/health", health_check, methods=["GET"]),
+    Route("/metrics", get_metrics, methods=["GET"]),
+    Route("/api/record", record_interaction, methods=["POST"]),
+    Route("/api/record/batch", record_interactions, methods=["POST"]),
+    Route("/api/reward", set_reward, methods=["POST"]),
+    Route("/api/stats", get_statistics, methods=["GET"]),
+    Route("/api/training-data", query_training_data, methods=["GET"]),
+    Route("/api/telemetry", get_telemetry, methods=["GET"]),
+    Route("/api/prompt", get_prompt, methods=["GET"]),
+    Route("/api/optimize", run_optimization, methods=["POST"]),
+    Route("/api/optimize/jobs", list_optimization_jobs, methods=["GET"]),
+    Route("/api/optimize/jobs/{job_id}", get_optimization_job, methods=["GET"]),
+    Route("/api/optimize/jobs/{job_id}/cancel", cancel_optimization_job, methods=["POST"]),
+    Route("/api/export", export_data, methods=["GET"]),
+    Route("/api/history", get_optimization_history, methods=["GET"]),
+    Route("/api/history/{run_id}", get_optimization_result, methods=["GET"]),
+    Route("/api/task-types", get_task_types, methods=["GET"]),
+    Route("/api/analyze", analyze_response, methods=["POST"]),
+    Route("/api/analyze/batch", analyze_responses, methods=["POST"]),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+    ],
+)
+
+
+def main():
+    """uvicorn でサーバーを起動"""
+    import uvicorn
+
+    print("Starting Agent Lightning ASGI Server...")
+    print(f"  Host: {config.api_host}")
+    print(f"  Port: {config.api_port}")
+    print(f"  Data directory: {config.data_dir}")
+
+    uvicorn.run(app, host=config.api_host, port=config.api_port)
+
+
+if __name__ == "__main__":
+    main()
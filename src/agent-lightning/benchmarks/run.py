@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Agent Lightning Benchmarks
+コレクター・最適化・API のホットパスを計測し、コミット間で比較できる JSON に保存する
+
+使い方（src/agent-lightning で実行）:
+    python3 benchmarks/run.py --scale 10000
+    python3 benchmarks/run.py --only record_interaction,get_statistics
+    python3 benchmarks/run.py --compare benchmarks/results/<前回の結果>.json
+
+AGL_* の環境変数（AGL_STORAGE, AGL_FSYNC など）はそのまま反映される。
+データは一時ディレクトリに作り、終了時に削除する。
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODULE_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+# 比較表に出す指標（大きいほど良いもの / 小さいほど良いもの）
+HIGHER_IS_BETTER = ("ops_per_sec",)
+LOWER_IS_BETTER = ("seconds", "p50_ms", "p95_ms", "p99_ms", "memory_mb")
+
+
+def summarize(latencies_ns: List[int], seconds: float, ops: Optional[int] = None) -> Dict[str, Any]:
+    """1回ごとの所要時間からスループットとパーセンタイルを計算"""
+    ops = ops if ops is not None else len(latencies_ns)
+    result: Dict[str, Any] = {
+        "ops": ops,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(ops / seconds, 2) if seconds > 0 else None,
+    }
+    if latencies_ns:
+        ordered = sorted(latencies_ns)
+
+        def percentile(p: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] / 1e6, 4)
+
+        result.update({
+            "mean_ms": round(sum(ordered) / len(ordered) / 1e6, 4),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(ordered[-1] / 1e6, 4),
+        })
+    return result
+
+
+def measure(fn: Callable[[Any], Any], items: Iterable[Any], ops_per_call: int = 1) -> Dict[str, Any]:
+    """items の各要素で fn を呼び、呼び出しごとの所要時間を計測"""
+    latencies: List[int] = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter_ns()
+        fn(item)
+        latencies.append(time.perf_counter_ns() - t0)
+    seconds = time.perf_counter() - start
+    return summarize(latencies, seconds, ops=len(latencies) * ops_per_call)
+
+
+def timed(fn: Callable[[], Any], ops: int = 1) -> Dict[str, Any]:
+    """fn を1回だけ呼んで所要時間を計測"""
+    start = time.perf_counter()
+    fn()
+    return summarize([], time.perf_counter() - start, ops=ops)
+
+
+class BenchmarkContext:
+    """ベンチマーク間で共有する設定と一時ディレクトリ"""
+
+    def __init__(self, args: argparse.Namespace):
+        from config import AgentLightningConfig
+
+        self.args = args
+        self.root = Path(tempfile.mkdtemp(prefix="agl-bench-"))
+        # コレクターの atexit（スナップショット保存）より後に消すため、最初に登録する
+        atexit.register(shutil.rmtree, self.root, ignore_errors=True)
+        self.config = replace(AgentLightningConfig.from_env(), data_dir=str(self.root / "collector"))
+        self.rng = random.Random(args.seed)
+        self.collector = None
+        # 共有のコレクターに記録済みのインタラクションID
+        self.ids: List[str] = []
+
+    def items(self, n: int, seed_offset: int = 0) -> List[Dict[str, Any]]:
+        from synthetic import generate_interactions
+        return list(generate_interactions(n, seed=self.args.seed + seed_offset, users=self.args.users))
+
+    def populated_collector(self):
+        """scale 件以上を記録済みの共有コレクター（未記録ならここで記録し、閉じていれば開き直す）"""
+        if self.collector is None:
+            from collector import create_collector
+            self.collector = create_collector(self.config)
+            self.collector.wait_ready()
+        if not self.ids:
+            self.ids = self.collector.record_interactions(self.items(self.args.scale))
+        return self.collector
+
+    def close_collector(self):
+        """共有のコレクターを閉じる（セグメント保存先ではスナップショットも保存される）"""
+        if self.collector is not None:
+            self.dispose(self.collector)
+            self.collector = None
+
+    @staticmethod
+    def dispose(collector):
+        collector.close()
+        atexit.unregister(collector.close)
+
+
+def bench_record_interaction(ctx: BenchmarkContext) -> Dict[str, Any]:
+    from collector import create_collector
+    ctx.collector = create_collector(ctx.config)
+    return measure(lambda item: ctx.ids.append(ctx.collector.record_interaction(**item)), ctx.items(ctx.args.scale))
+
+
+def bench_record_interactions_batch(ctx: BenchmarkContext) -> Dict[str, Any]:
+    collector = ctx.populated_collector()
+    items = ctx.items(ctx.args.scale, seed_offset=1)
+    size = ctx.args.batch_size
+    batches = [items[i:i + size] for i in range(0, len(items), size)]
+    result = measure(lambda batch: ctx.ids.extend(collector.record_interactions(batch)), batches, ops_per_call=size)
+    result["batch_size"] = size
+    return result
+
+
+def bench_set_reward(ctx: BenchmarkContext) -> Dict[str, Any]:
+    collector = ctx.populated_collector()
+    # メモリ上のウィンドウ内外の両方に当たるように全体から抜き出す
+    targets = ctx.rng.sample(ctx.ids, min(len(ctx.ids), ctx.args.rewards))
+    return measure(lambda interaction_id: collector.set_reward(interaction_id, ctx.rng.uniform(-1, 1)), targets)
+
+
+def bench_get_statistics(ctx: BenchmarkContext) -> Dict[str, Any]:
+    collector = ctx.populated_collector()
+    return measure(lambda _: collector.get_statistics(), range(ctx.args.repeat))
+
+
+def bench_query_training_data(ctx: BenchmarkContext) -> Dict[str, Any]:
+    collector = ctx.populated_collector()
+    cursor = None
+    pages = 0
+    latencies: List[int] = []
+    start = time.perf_counter()
+    while pages < ctx.args.repeat:
+        t0 = time.perf_counter_ns()
+        page = collector.query_training_data(task_type="calendar_create", cursor=cursor, limit=100)
+        latencies.append(time.perf_counter_ns() - t0)
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_export_for_training(ctx: BenchmarkContext) -> Dict[str, Any]:
+    collector = ctx.populated_collector()
+    results = {}
+    for fmt in ("json", "jsonl"):
+        output = ctx.root / f"export.{fmt}"
+        start = time.perf_counter()
+        export = collector.export_training_data(str(output), fmt=fmt)
+        results[fmt] = summarize([], time.perf_counter() - start, ops=export["total_samples"])
+        results[fmt]["bytes"] = output.stat().st_size
+    return results
+
+
+def bench_load_existing_data(ctx: BenchmarkContext) -> Dict[str, Any]:
+    from collector import create_collector
+    ctx.populated_collector()
+    ctx.close_collector()
+
+    results = {}
+    variants = [("snapshot", True), ("full", False)] if ctx.config.storage == "segments" else [("open", True)]
+    for name, snapshot in variants:
+        config = replace(ctx.config, snapshot_enabled=snapshot)
+        start = time.perf_counter()
+        collector = create_collector(config)
+        constructed = time.perf_counter() - start
+        collector.wait_ready()
+        results[name] = summarize([], time.perf_counter() - start, ops=len(ctx.ids))
+        results[name]["constructor_seconds"] = round(constructed, 6)
+        ctx.dispose(collector)
+    return results
+
+
+def bench_load_memory(ctx: BenchmarkContext) -> Dict[str, Any]:
+    from collector import create_collector
+    ctx.populated_collector()
+    ctx.close_collector()
+
+    tracemalloc.start()
+    collector = create_collector(replace(ctx.config, snapshot_enabled=False))
+    collector.wait_ready()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ctx.dispose(collector)
+    return {
+        "interactions": len(ctx.ids),
+        "memory_mb": round(current / 1e6, 3),
+        "peak_mb": round(peak / 1e6, 3),
+        "bytes_per_interaction": round(current / max(1, len(ctx.ids)), 1),
+    }
+
+
+def bench_run_optimization(ctx: BenchmarkContext) -> Dict[str, Any]:
+    from optimizer import AgentOptimizer
+    training_data = ctx.populated_collector().get_training_data()
+    optimizer = AgentOptimizer(ctx.config)
+    results = {}
+    # 1回目は報酬キャッシュが空、2回目はキャッシュ済み
+    for name in ("cold", "warm"):
+        start = time.perf_counter()
+        optimizer.run_optimization(training_data, num_iterations=ctx.args.iterations)
+        results[name] = summarize([], time.perf_counter() - start, ops=len(training_data) * ctx.args.iterations)
+        results[name]["samples"] = len(training_data)
+        results[name]["iterations"] = ctx.args.iterations
+    return results
+
+
+def bench_api(ctx: BenchmarkContext) -> Dict[str, Any]:
+    # api_server はインポート時に環境変数から設定を読む
+    os.environ["AGL_DATA_DIR"] = str(ctx.root / "api")
+    import api_server
+
+    client = api_server.app.test_client()
+    items = ctx.items(ctx.args.api_requests, seed_offset=2)
+    ids: List[str] = []
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path}: {response.status_code} {response.get_data(as_text=True)}")
+        return response
+
+    def record(item):
+        ids.append(check(client.post("/api/record", json=item)).get_json()["interaction_id"])
+
+    results = {
+        "POST /api/record": measure(record, items),
+        "POST /api/record/batch": measure(
+            lambda batch: check(client.post("/api/record/batch", json={"interactions": batch})),
+            [items[i:i + ctx.args.batch_size] for i in range(0, len(items), ctx.args.batch_size)],
+            ops_per_call=ctx.args.batch_size,
+        ),
+        "POST /api/reward": measure(
+            lambda interaction_id: check(client.post("/api/reward", json={"interaction_id": interaction_id, "reward": 1.0})),
+            ids,
+        ),
+        "GET /health": measure(lambda _: check(client.get("/health")), range(ctx.args.repeat)),
+        "GET /api/stats": measure(lambda _: check(client.get("/api/stats")), range(ctx.args.repeat)),
+        "GET /api/training-data": measure(
+            lambda _: check(client.get("/api/training-data?limit=100&task_type=task_create")),
+            range(ctx.args.repeat),
+        ),
+        "POST /api/analyze": measure(
+            lambda item: check(client.post("/api/analyze", json={
+                "user_message": item["user_message"],
+                "bot_response": item["bot_response"],
+                "task_type": item["task_type"],
+            })),
+            items[:ctx.args.repeat],
+        ),
+        "GET /api/export?stream=true": timed(
+            lambda: check(client.get("/api/export?stream=true&format=jsonl")).get_data(),
+            ops=len(ids) * 2,
+        ),
+    }
+    ctx.dispose(api_server.collector)
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[BenchmarkContext], Dict[str, Any]]] = {
+    "record_interaction": bench_record_interaction,
+    "record_interactions_batch": bench_record_interactions_batch,
+    "set_reward": bench_set_reward,
+    "get_statistics": bench_get_statistics,
+    "query_training_data": bench_query_training_data,
+    "export_for_training": bench_export_for_training,
+    "run_optimization": bench_run_optimization,
+    "load_existing_data": bench_load_existing_data,
+    "load_memory": bench_load_memory,
+    "api": bench_api,
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=MODULE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """{"a": {"b": {"ops_per_sec": 1}}} -> {"a.b.ops_per_sec": 1}（比較対象の指標のみ）"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif key in HIGHER_IS_BETTER + LOWER_IS_BETTER and isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """前回の結果との比較表を表示（+ は改善、- は悪化）"""
+    now = flatten(current["results"])
+    before = flatten(baseline["results"])
+    print(f"\nComparison with {baseline['meta'].get('git_commit')} ({baseline['meta'].get('created_at')})")
+    print(f"{'metric':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        if not old:
+            continue
+        ratio = new / old
+        better = ratio if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else 1 / ratio if ratio else float("inf")
+        print(f"{name:<60} {old:>12.4g} {new:>12.4g} {(better - 1) * 100:>+7.1f}%")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Agent Lightning benchmarks")
+    parser.add_argument("--scale", type=int, default=10000, help="記録するインタラクション数")
+    parser.add_argument("--users", type=int, default=500, help="合成データのユーザー数")
+    parser.add_argument("--seed", type=int, default=42, help="合成データの乱数シード")
+    parser.add_argument("--rewards", type=int, default=2000, help="set_reward の呼び出し回数")
+    parser.add_argument("--repeat", type=int, default=200, help="読み込み系の呼び出し回数")
+    parser.add_argument("--batch-size", type=int, default=100, help="バッチ記録の1回あたりの件数")
+    parser.add_argument("--iterations", type=int, default=5, help="run_optimization のイテレーション数")
+    parser.add_argument("--api-requests", type=int, default=1000, help="API ベンチマークの記録件数")
+    parser.add_argument("--only", help="実行するベンチマーク（カンマ区切り）: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--output", help="結果の出力先（デフォルト: benchmarks/results/<commit>_<日時>.json）")
+    parser.add_argument("--compare", help="比較する前回の結果 JSON")
+    parser.add_argument("--real-agl", action="store_true", help="スタブではなくインストール済みの agentlightning を使う")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark: {', '.join(unknown)}")
+
+    sys.path.insert(0, str(MODULE_DIR))
+    sys.path.insert(0, str(BENCH_DIR))
+    if not args.real_agl:
+        sys.path.insert(0, str(BENCH_DIR / "stub"))
+
+    ctx = BenchmarkContext(args)
+    results: Dict[str, Any] = {}
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        results[name] = BENCHMARKS[name](ctx)
+    ctx.close_collector()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "agentlightning": "installed" if args.real_agl else "stub",
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "config": {key: value for key, value in asdict(ctx.config).items() if key != "data_dir"},
+        },
+        "results": results,
+    }
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{report['meta']['git_commit'] or 'nogit'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+agentlightning stub
+ベンチマークをオフラインで実行するための最小限の代替モジュール
+（発行処理のコストを計測に含めないよう、何もしない）
+"""
+
+
+class Tracer:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def emit_step(**kwargs):
+    pass
+
+
+def emit_reward(**kwargs):
+    pass
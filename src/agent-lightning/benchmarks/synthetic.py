@@ -0,0 +1,92 @@
+"""
+Synthetic LINE Interactions
+ベンチマーク用に日本語の LINE インタラクションを再現可能な乱数で生成
+"""
+
+import random
+from typing import Any, Dict, Iterator, Optional
+
+TITLES = ["会議", "打ち合わせ", "歯医者", "ランチ", "美容院", "ジム", "飲み会", "面談", "買い物", "レポート提出"]
+PLACES = ["渋谷", "新宿", "会議室A", "オンライン", "駅前のカフェ", "本社"]
+DAYS = ["今日", "明日", "明後日", "来週の月曜", "金曜日", "週末"]
+
+# task_type ごとの (ユーザーメッセージ, 成功時の応答, 失敗時の応答)
+TEMPLATES = {
+    "calendar_create": (
+        "{day}の{hour}時に{title}を入れて",
+        "✅ {day}の{hour}:00に「{title}」を登録しました📅",
+        "申し訳ありません、日時を認識できませんでした。もう一度教えてください。",
+    ),
+    "calendar_query": (
+        "{day}の予定を教えて",
+        "📅 {day}の予定です\n・{hour}:00 {title}（{place}）",
+        "{day}の予定は見つかりません",
+    ),
+    "task_create": (
+        "{title}をタスクに追加して、期限は{day}",
+        "📝 タスク「{title}」を追加しました（期限: {day}）",
+        "エラーが発生しました",
+    ),
+    "task_complete": (
+        "{title}終わった",
+        "✅ タスク「{title}」を完了にしました👍",
+        "該当するタスクが見つかりません",
+    ),
+    "reminder_set": (
+        "{day}の{hour}時に{title}をリマインドして",
+        "🔔 {day}の{hour}:00に「{title}」をリマインドします⏰",
+        "リマインダーの設定に失敗しました",
+    ),
+    "general_query": (
+        "{place}までどれくらいかかる？",
+        "{place}までは電車で約{minutes}分です。{title}の前に余裕を持って出発しましょう。",
+        "すみません、わかりません",
+    ),
+    "error_handling": (
+        "さっきのやつキャンセルして",
+        "「{title}」の予定を削除しました",
+        "エラー: 対象の予定を特定できませんでした。予定名を教えてください。",
+    ),
+}
+
+
+def generate_interactions(
+    n: int,
+    seed: int = 0,
+    users: int = 500,
+    failure_rate: float = 0.15,
+    reward_rate: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    record_interaction の引数になる辞書を n 件生成
+
+    Args:
+        n: 生成する件数
+        seed: 乱数シード（同じ値なら同じデータ列になる）
+        users: ユーザー数
+        failure_rate: 失敗応答の割合
+        reward_rate: 指定した場合、この割合で記録時に reward を付ける
+    """
+    rng = random.Random(seed)
+    task_types = list(TEMPLATES)
+    for _ in range(n):
+        task_type = rng.choice(task_types)
+        message, success, failure = TEMPLATES[task_type]
+        values = {
+            "day": rng.choice(DAYS),
+            "hour": rng.randint(8, 21),
+            "title": rng.choice(TITLES),
+            "place": rng.choice(PLACES),
+            "minutes": rng.randint(5, 60),
+        }
+        failed = rng.random() < failure_rate
+        item = {
+            "user_id": f"U{rng.randrange(users):08x}",
+            "task_type": task_type,
+            "user_message": message.format(**values),
+            "bot_response": (failure if failed else success).format(**values),
+            "context": {"day": values["day"], "hour": values["hour"]} if task_type.startswith("calendar") else {},
+        }
+        if reward_rate is not None and rng.random() < reward_rate:
+            item["reward"] = -0.5 if failed else round(rng.uniform(0.3, 1.0), 2)
+        yield item
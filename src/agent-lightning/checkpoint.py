@@ -0,0 +1,138 @@
+"""
+Optimization Checkpoints
+増分最適化のウォーターマークと報酬の累計を保存する
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from storage import FileLock
+
+# ウォーターマークの形式（変わったら既存のチェックポイントは使わず全件を再計算する）
+CHECKPOINT_FORMAT = 2
+
+
+def checkpoint_key(min_reward: Optional[float]) -> str:
+    """min_reward ごとにチェックポイントを分けるためのキー"""
+    return "all" if min_reward is None else f"min_reward={float(min_reward)!r}"
+
+
+@dataclass
+class OptimizationCheckpoint:
+    """
+    最適化のチェックポイント
+
+    watermark までのインタラクションを処理済みとして、その件数と報酬の
+    合計を持つ（重複を weight でまとめた場合は weight で重み付けした値）。
+    サンプルごとの報酬は AgentOptimizer の報酬キャッシュ (reward_cache.json) に
+    内容ハッシュで保存されている。
+    """
+    min_reward: Optional[float] = None
+    watermark: Optional[int] = None  # 処理済みのコミット順の位置 (get_training_data_after を参照)
+    num_samples: int = 0
+    reward_sum: float = 0.0
+    fingerprint: Optional[str] = None  # 報酬関数と重複除去の設定
+    run_id: Optional[str] = None
+    updated_at: Optional[str] = None
+
+    @property
+    def avg_reward(self) -> float:
+        return self.reward_sum / self.num_samples if self.num_samples else 0.0
+
+    def merge(
+        self,
+        rewards: List[float],
+        watermark: Optional[int],
+        run_id: str,
+        weights: Optional[List[int]] = None,
+    ) -> "OptimizationCheckpoint":
+        """差分の報酬（weights を指定した場合は重み付き）を足した新しいチェックポイント"""
+        weights = weights if weights is not None else [1] * len(rewards)
+        return replace(
+            self,
+            watermark=watermark if watermark is not None else self.watermark,
+            num_samples=self.num_samples + sum(weights),
+            reward_sum=self.reward_sum + sum(w * r for w, r in zip(weights, rewards)),
+            run_id=run_id,
+            updated_at=datetime.now().isoformat(),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OptimizationCheckpoint":
+        # 知らない項目は無視する（足りない fingerprint は不一致として全件を再計算）
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+
+class CheckpointStore:
+    """
+    optimization_results/checkpoints.json に min_reward ごとのチェックポイントを保存
+
+    複数のワーカーや同時実行のジョブが同じチェックポイントを進めないよう、
+    保存時には読み込んだときのウォーターマークのままかを確認する。
+    """
+
+    def __init__(self, results_dir: Path):
+        self.results_dir = Path(results_dir)
+        self.path = self.results_dir / "checkpoints.json"
+        self._file_lock = FileLock(self.results_dir / "checkpoints.lock")
+
+    def load(self, min_reward: Optional[float], fingerprint: str) -> Optional[OptimizationCheckpoint]:
+        """
+        チェックポイントを読み込む
+
+        報酬関数や重複除去の設定が変わっている場合は累計が使えないので None を返す。
+        """
+        data = self._read().get(checkpoint_key(min_reward))
+        if data is None:
+            return None
+        checkpoint = OptimizationCheckpoint.from_dict(data)
+        if checkpoint.fingerprint != fingerprint:
+            print("Settings changed since the last checkpoint, recomputing from scratch")
+            return None
+        return checkpoint
+
+    def save(self, checkpoint: OptimizationCheckpoint, base_watermark: Optional[int]) -> bool:
+        """
+        チェックポイントを保存
+
+        Args:
+            checkpoint: 保存するチェックポイント
+            base_watermark: 実行開始時に読み込んだウォーターマーク（全件の再計算なら None）
+
+        Returns:
+            保存したか（他の実行が先にチェックポイントを進めていた場合は False）
+        """
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        key = checkpoint_key(checkpoint.min_reward)
+        with self._file_lock:
+            checkpoints = self._read()
+            current = checkpoints.get(key)
+            if base_watermark is not None:
+                if (current or {}).get("watermark") != base_watermark:
+                    print(f"Warning: Checkpoint {key} was advanced by another run, not saving")
+                    return False
+            checkpoints[key] = checkpoint.to_dict()
+
+            tmp_file = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.path)
+        return True
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Failed to load optimization checkpoints: {e}")
+            return {}
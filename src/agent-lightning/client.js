@@ -11,6 +11,8 @@ const AGL_API_URL = process.env.AGL_API_URL || 'http://localhost:8081';
 class AgentLightningClient {
   constructor(baseUrl = AGL_API_URL) {
     this.baseUrl = baseUrl;
+    // エンドポイント -> { etag, data }（cachedRequest 用）
+    this.etagCache = new Map();
   }
 
   /**
@@ -36,14 +38,50 @@ class AgentLightningClient {
 
       return data;
     } catch (error) {
-      // Agent Lightning サーバーが起動していない場合は静かに失敗
-      if (error.cause?.code === 'ECONNREFUSED') {
-        console.log('[AgentLightning] Server not available, skipping...');
-        return null;
+      return this.handleError(error);
+    }
+  }
+
+  /**
+   * ETag を使って GET し、変更が無ければ (304) 前回の結果を返す
+   */
+  async cachedRequest(endpoint) {
+    const url = `${this.baseUrl}${endpoint}`;
+    const cached = this.etagCache.get(endpoint);
+
+    try {
+      const response = await fetch(url, {
+        headers: cached ? { 'If-None-Match': cached.etag } : {},
+      });
+
+      if (response.status === 304 && cached) {
+        return cached.data;
+      }
+
+      const data = await response.json();
+
+      if (!response.ok) {
+        throw new Error(data.error || `HTTP ${response.status}`);
       }
-      console.error('[AgentLightning] API Error:', error.message);
+
+      const etag = response.headers.get('ETag');
+      if (etag) {
+        this.etagCache.set(endpoint, { etag, data });
+      }
+      return data;
+    } catch (error) {
+      return this.handleError(error);
+    }
+  }
+
+  handleError(error) {
+    // Agent Lightning サーバーが起動していない場合は静かに失敗
+    if (error.cause?.code === 'ECONNREFUSED') {
+      console.log('[AgentLightning] Server not available, skipping...');
       return null;
     }
+    console.error('[AgentLightning] API Error:', error.message);
+    return null;
   }
 
   /**
@@ -77,6 +115,26 @@ class AgentLightningClient {
     });
   }
 
+  /**
+   * 複数のインタラクションをまとめて記録
+   * @param {Array<Object>} interactions - recordInteraction と同じ形式のオブジェクトの配列
+   */
+  async recordInteractions(interactions) {
+    return this.request('/api/record/batch', {
+      method: 'POST',
+      body: JSON.stringify({
+        interactions: interactions.map(({ userId, taskType, userMessage, botResponse, context, reward }) => ({
+          user_id: userId,
+          task_type: taskType,
+          user_message: userMessage,
+          bot_response: botResponse,
+          context,
+          reward,
+        })),
+      }),
+    });
+  }
+
   /**
    * 報酬を設定
    * @param {string} interactionId - インタラクションID
@@ -102,12 +160,37 @@ class AgentLightningClient {
   }
 
   /**
-   * 最適化済みプロンプトを取得
+   * トレーニングデータを絞り込んでページ単位で取得
+   * 次のページは戻り値の next_cursor を cursor に渡して取得する
+   */
+  async getTrainingData({ taskType, userId, since, until, minReward, maxReward, cursor, limit } = {}) {
+    const params = new URLSearchParams();
+    const filters = {
+      task_type: taskType,
+      user_id: userId,
+      since,
+      until,
+      min_reward: minReward,
+      max_reward: maxReward,
+      cursor,
+      limit,
+    };
+    for (const [key, value] of Object.entries(filters)) {
+      if (value !== undefined && value !== null) {
+        params.set(key, String(value));
+      }
+    }
+    const query = params.toString();
+    return this.request(`/api/training-data${query ? `?${query}` : ''}`);
+  }
+
+  /**
+   * 最適化済みプロンプトを取得（ETag でキャッシュし、変更があったときだけ本文を受け取る）
    * @param {string} [taskType] - タスクの種類
    */
   async getPrompt(taskType) {
     const params = taskType ? `?task_type=${encodeURIComponent(taskType)}` : '';
-    return this.request(`/api/prompt${params}`);
+    return this.cachedRequest(`/api/prompt${params}`);
   }
 
   /**
@@ -128,26 +211,95 @@ class AgentLightningClient {
   }
 
   /**
-   * 最適化を実行
+   * 複数の応答をまとめて分析
+   * @param {Array<{userMessage: string, botResponse: string, taskType?: string}>} items
+   * @returns {Promise<{results: Object[], count: number, cache: Object}>} results は items と同じ順序
+   */
+  async analyzeResponses(items) {
+    return this.request('/api/analyze/batch', {
+      method: 'POST',
+      body: JSON.stringify({
+        items: items.map(({ userMessage, botResponse, taskType }) => ({
+          user_message: userMessage,
+          bot_response: botResponse,
+          task_type: taskType,
+        })),
+      }),
+    });
+  }
+
+  /**
+   * 最適化ジョブを投入
    * @param {Object} [options]
    * @param {number} [options.numIterations] - イテレーション数
    * @param {number} [options.minReward] - 最小報酬値
+   * @param {string|boolean} [options.profile] - プロファイリング ('phases' | 'cprofile' | true)
+   * @param {boolean} [options.full] - チェックポイントを使わずに全件を処理
+   * @param {boolean} [options.wait] - 完了まで待って結果を受け取る
    */
-  async runOptimization({ numIterations, minReward } = {}) {
+  async runOptimization({ numIterations, minReward, profile, full, wait } = {}) {
     return this.request('/api/optimize', {
       method: 'POST',
       body: JSON.stringify({
         num_iterations: numIterations,
         min_reward: minReward,
+        profile,
+        full,
+        wait,
       }),
     });
   }
 
   /**
-   * 最適化履歴を取得
+   * 最適化ジョブの状態と進捗を取得
+   * @param {string} jobId - ジョブID
+   */
+  async getOptimizationJob(jobId) {
+    return this.request(`/api/optimize/jobs/${encodeURIComponent(jobId)}`);
+  }
+
+  /**
+   * 最適化ジョブ一覧を取得
+   */
+  async listOptimizationJobs() {
+    return this.request('/api/optimize/jobs');
+  }
+
+  /**
+   * 最適化ジョブをキャンセル
+   * @param {string} jobId - ジョブID
+   */
+  async cancelOptimizationJob(jobId) {
+    return this.request(`/api/optimize/jobs/${encodeURIComponent(jobId)}/cancel`, {
+      method: 'POST',
+    });
+  }
+
+  /**
+   * 最適化履歴の要約を取得
+   * @param {Object} [options]
+   * @param {string} [options.sort] - start_time | end_time | best_reward | avg_final_reward | num_samples
+   * @param {string} [options.order] - asc | desc
+   * @param {number} [options.offset] - 読み飛ばす件数（前のページの next_offset）
+   * @param {number} [options.limit] - 1ページの件数
+   */
+  async getOptimizationHistory({ sort, order, offset, limit } = {}) {
+    const params = new URLSearchParams();
+    for (const [key, value] of Object.entries({ sort, order, offset, limit })) {
+      if (value !== undefined && value !== null) {
+        params.set(key, String(value));
+      }
+    }
+    const query = params.toString();
+    return this.request(`/api/history${query ? `?${query}` : ''}`);
+  }
+
+  /**
+   * 最適化結果の詳細（イテレーションごとの報酬を含む）を取得
+   * @param {string} runId - 実行ID
    */
-  async getOptimizationHistory() {
-    return this.request('/api/history');
+  async getOptimizationResult(runId) {
+    return this.request(`/api/history/${encodeURIComponent(runId)}`);
   }
 
   /**
@@ -3,20 +3,49 @@ Training Data Collector for LINE Calendar Bot
 ユーザーインタラクションデータを収集してAgent Lightning用にフォーマット
 """
 
+import atexit
+import base64
+import binascii
+import gzip
+import itertools
 import json
 import os
-from datetime import datetime
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass, asdict
-import agentlightning as agl
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, asdict, fields, replace
 
 from config import AgentLightningConfig, TASK_TYPES
+from dedup import DEDUP_DROP, DEDUP_OFF, NearDuplicateDetector, normalize_dedup_mode
+from storage import (
+    FileLock,
+    GroupCommitWriter,
+    RunningStats,
+    Segment,
+    SegmentedLog,
+    TimeIndex,
+    file_signature,
+    read_snapshot,
+    write_snapshot,
+)
+from metrics import DISK_WRITE_SECONDS, REWARDS
+from sqlite_store import SQLiteStore
+from telemetry import get_emitter
 
 
-@dataclass
+@dataclass(slots=True)
 class Interaction:
-    """ユーザーインタラクションデータ"""
+    """
+    ユーザーインタラクションデータ
+
+    メモリ上のウィンドウに max_samples 件並ぶので、__dict__ を持たない
+    slots クラスにしている。値の種類が少ない user_id / task_type は
+    intern して同じ文字列オブジェクトを共有する。
+    """
     id: str
     timestamp: str
     user_id: str
@@ -27,30 +56,95 @@ class Interaction:
     reward: Optional[float] = None
     feedback: Optional[str] = None
 
+    def __post_init__(self):
+        if type(self.user_id) is str:
+            self.user_id = sys.intern(self.user_id)
+        if type(self.task_type) is str:
+            self.task_type = sys.intern(self.task_type)
+
+
+INTERACTION_FIELDS = [f.name for f in fields(Interaction)]
+
+# export_training_data が対応する出力形式
+EXPORT_FORMATS = ("json", "jsonl", "jsonl.gz")
+
+# storage_metrics でメモリ使用量を見積もるときの標本数
+MEMORY_SAMPLE_SIZE = 100
+
+# TimeIndex のキー (timestamp, id) のタプル1つ分のサイズ
+TIME_INDEX_KEY_BYTES = sys.getsizeof(("", ""))
+
 
-class DataCollector:
+@dataclass
+class InteractionQuery:
+    """query_training_data の絞り込み条件（時刻は isoformat の文字列）"""
+    task_type: Optional[str] = None
+    user_id: Optional[str] = None
+    since: Optional[str] = None  # この時刻以降
+    until: Optional[str] = None  # この時刻より前
+    min_reward: Optional[float] = None
+    max_reward: Optional[float] = None
+
+    def matches(self, interaction: Interaction) -> bool:
+        if self.task_type is not None and interaction.task_type != self.task_type:
+            return False
+        if self.user_id is not None and interaction.user_id != self.user_id:
+            return False
+        if self.since is not None and interaction.timestamp < self.since:
+            return False
+        if self.until is not None and interaction.timestamp >= self.until:
+            return False
+        if self.min_reward is not None or self.max_reward is not None:
+            if interaction.reward is None:
+                return False
+            if self.min_reward is not None and interaction.reward < self.min_reward:
+                return False
+            if self.max_reward is not None and interaction.reward > self.max_reward:
+                return False
+        return True
+
+
+class BaseCollector:
     """
-    LINE Bot のインタラクションデータを収集
-    Agent Lightning のトレーニングデータとして使用
+    インタラクションデータを収集するコレクターの共通部分
+
+    記録・報酬設定・集計・エクスポートの API を提供する。保存先は
+    サブクラスが _commit_interactions / set_reward / iter_interactions /
+    get_statistics で実装する（AGL_STORAGE で選択）。
     """
 
     def __init__(self, config: Optional[AgentLightningConfig] = None):
         self.config = config or AgentLightningConfig.from_env()
         self.data_dir = Path(self.config.data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.interactions: List[Interaction] = []
-        self._load_existing_data()
+        self._emitter = get_emitter(self.config)
+        # ワーカープロセス間で共有するロック
+        self._file_lock = FileLock(self.data_dir / "collector.lock")
+        # 起動時のデータ読み込みが終わるまでは読み込み系の処理を待たせる
+        self._ready = threading.Event()
+        self._clock_lock = threading.Lock()
+        self._last_timestamp: Optional[datetime] = None
 
-    def _load_existing_data(self):
-        """既存のデータを読み込む"""
-        data_file = self.data_dir / "interactions.jsonl"
-        if data_file.exists():
-            with open(data_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    if line.strip():
-                        data = json.loads(line)
-                        self.interactions.append(Interaction(**data))
-            print(f"Loaded {len(self.interactions)} existing interactions")
+    def _start_writer(self):
+        """グループコミットライターを起動（サブクラスの __init__ の最後に呼ぶ）"""
+        self._writer = GroupCommitWriter(
+            self._commit_interactions,
+            interval=self.config.group_commit_interval_ms / 1000,
+            max_batch=self.config.group_commit_max_batch,
+        )
+        atexit.register(self.close)
+
+    def close(self):
+        """未コミットの書き込みを反映"""
+        self._writer.close()
+
+    def is_ready(self) -> bool:
+        """起動時のデータ読み込みが完了しているか"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """起動時のデータ読み込み完了を待つ"""
+        return self._ready.wait(timeout)
 
     def record_interaction(
         self,
@@ -75,44 +169,109 @@ class DataCollector:
         Returns:
             interaction_id: 記録されたインタラクションのID
         """
-        interaction_id = f"{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        return self.record_interactions([{
+            "user_id": user_id,
+            "task_type": task_type,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "context": context,
+            "reward": reward,
+        }])[0]
 
-        interaction = Interaction(
-            id=interaction_id,
-            timestamp=datetime.now().isoformat(),
-            user_id=user_id,
-            task_type=task_type,
-            user_message=user_message,
-            bot_response=bot_response,
-            context=context or {},
-            reward=reward,
-        )
+    def record_interactions(self, items: List[Dict[str, Any]]) -> List[str]:
+        """
+        複数のインタラクションをまとめて記録
 
-        self.interactions.append(interaction)
-        self._save_interaction(interaction)
+        グループコミットライター経由で書き込み、ディスクにコミットされて
+        から ID を返す。同時に届いた書き込みは1回の fsync にまとめられる。
 
-        # Agent Lightningにイベントを発行
-        try:
-            agl.emit_step(
-                name=f"line_bot_{task_type}",
-                input=user_message,
-                output=bot_response,
+        Args:
+            items: record_interaction と同じキーを持つ辞書のリスト
+
+        Returns:
+            記録されたインタラクションのIDのリスト（items と同じ順序）
+        """
+        interaction_ids, future = self.submit_interactions(items)
+        future.result()
+        return interaction_ids
+
+    def submit_interactions(self, items: List[Dict[str, Any]]) -> Tuple[List[str], Future]:
+        """
+        複数のインタラクションの書き込みを依頼し、コミットを待たずに返す
+
+        非同期サーバーがスレッドを占有せずにコミットを待てるようにする。
+        ステップの発行はコミット後にライタースレッドで行う。
+
+        Returns:
+            (インタラクションのIDのリスト, コミット完了で解決される Future)
+        """
+        interactions = []
+        for item in items:
+            now = self._next_timestamp()
+            interactions.append(Interaction(
+                id=f"{item['user_id']}_{now.strftime('%Y%m%d%H%M%S%f')}",
+                timestamp=now.isoformat(),
+                user_id=item["user_id"],
+                task_type=item["task_type"],
+                user_message=item["user_message"],
+                bot_response=item["bot_response"],
+                context=item.get("context") or {},
+                reward=item.get("reward"),
+            ))
+
+        future = self._writer.submit(interactions)
+        future.add_done_callback(lambda f: f.exception() is None and self._on_committed(interactions))
+        return [interaction.id for interaction in interactions], future
+
+    def _on_committed(self, interactions: List[Interaction]):
+        """コミット済みのインタラクションを発行し、記録時の報酬を分布に加える"""
+        self._emit_steps(interactions)
+        for interaction in interactions:
+            if interaction.reward is not None:
+                REWARDS.observe(interaction.reward, source="record")
+
+    def _next_timestamp(self) -> datetime:
+        """
+        記録時刻を払い出す
+
+        同じマイクロ秒に複数記録されてもIDが重複しないよう、
+        前回より必ず後の時刻を返す。
+        """
+        with self._clock_lock:
+            now = datetime.now()
+            if self._last_timestamp is not None and now <= self._last_timestamp:
+                now = self._last_timestamp + timedelta(microseconds=1)
+            self._last_timestamp = now
+            return now
+
+    def _emit_steps(self, interactions: List[Interaction]):
+        """コミット済みのインタラクションを Agent Lightning の発行キューに積む"""
+        for interaction in interactions:
+            self._emitter.emit_step(
+                name=f"line_bot_{interaction.task_type}",
+                input=interaction.user_message,
+                output=interaction.bot_response,
                 metadata={
-                    "user_id": user_id,
-                    "task_type": task_type,
+                    "user_id": interaction.user_id,
+                    "task_type": interaction.task_type,
                     "timestamp": interaction.timestamp,
                 }
             )
-        except Exception as e:
-            print(f"Warning: Failed to emit step to Agent Lightning: {e}")
 
-        return interaction_id
+    def _emit_reward(self, interaction_id: str, reward: float, feedback: Optional[str]):
+        """設定された報酬を分布に加え、Agent Lightning の発行キューに積む"""
+        REWARDS.observe(reward, source="feedback")
+        self._emitter.emit_reward(
+            reward=reward,
+            metadata={
+                "interaction_id": interaction_id,
+                "feedback": feedback,
+            }
+        )
 
-    def _save_interaction(self, interaction: Interaction):
-        """インタラクションをファイルに保存"""
-        data_file = self.data_dir / "interactions.jsonl"
-        with open(data_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(asdict(interaction), ensure_ascii=False) + "\n")
+    def _commit_interactions(self, interactions: List[Interaction]):
+        """グループコミットライターから呼ばれ、バッチを保存先に書き込む"""
+        raise NotImplementedError
 
     def set_reward(self, interaction_id: str, reward: float, feedback: Optional[str] = None):
         """
@@ -122,35 +281,146 @@ class DataCollector:
             interaction_id: インタラクションID
             reward: 報酬値 (-1.0 ~ 1.0)
             feedback: オプションのフィードバックテキスト
+
+        Raises:
+            ValueError: インタラクションが見つからない場合
         """
-        for interaction in self.interactions:
-            if interaction.id == interaction_id:
-                interaction.reward = reward
-                interaction.feedback = feedback
+        raise NotImplementedError
 
-                # Agent Lightningに報酬を発行
-                try:
-                    agl.emit_reward(
-                        reward=reward,
-                        metadata={
-                            "interaction_id": interaction_id,
-                            "feedback": feedback,
-                        }
-                    )
-                except Exception as e:
-                    print(f"Warning: Failed to emit reward to Agent Lightning: {e}")
-
-                self._update_data_file()
-                return
+    def iter_interactions(self, min_reward: Optional[float] = None) -> Iterator[Interaction]:
+        """
+        インタラクションを古い順に返す
+
+        Args:
+            min_reward: 最小報酬値（これ以上の報酬を持つものだけ返す）
+        """
+        raise NotImplementedError
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """データ統計を取得"""
+        raise NotImplementedError
+
+    def _query(self, query: InteractionQuery, after: Optional[Tuple[str, str]], limit: int) -> List[Interaction]:
+        """条件に合うインタラクションを (timestamp, id) の昇順に after より後ろから最大 limit 件返す"""
+        raise NotImplementedError
+
+    def storage_metrics(self) -> Dict[str, Any]:
+        """
+        /metrics 用に保存先の状態を取得（プロセス間ロックは取らない）
+
+        Returns:
+            interactions（総件数）, window_interactions（メモリ上の件数）,
+            memory_bytes（メモリ上のウィンドウの推定サイズ）,
+            disk_bytes（ファイルの種類 -> バイト数）を含む辞書
+        """
+        raise NotImplementedError
+
+    def query_training_data(
+        self,
+        task_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        min_reward: Optional[float] = None,
+        max_reward: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """
+        インタラクションを絞り込んでページ単位で取得
+
+        記録時刻 (timestamp, id) の昇順に返す。次のページは返された
+        next_cursor を cursor に渡して取得する（最後のページでは None）。
+
+        Args:
+            task_type: タスクの種類
+            user_id: ユーザーID
+            since: この時刻以降（ISO 8601）
+            until: この時刻より前（ISO 8601）
+            min_reward: 最小報酬値
+            max_reward: 最大報酬値
+            cursor: 前のページの next_cursor
+            limit: 1ページの最大件数
 
-        raise ValueError(f"Interaction {interaction_id} not found")
+        Returns:
+            data（インタラクションの辞書のリスト）と next_cursor を含む辞書
+
+        Raises:
+            ValueError: 時刻やカーソルの形式が不正な場合
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        query = InteractionQuery(
+            task_type=task_type,
+            user_id=user_id,
+            since=_normalize_time(since),
+            until=_normalize_time(until),
+            min_reward=min_reward,
+            max_reward=max_reward,
+        )
+        after = _decode_cursor(cursor) if cursor else None
+
+        # 1件多く取って次のページがあるか判定する
+        page = self._query(query, after, limit + 1)
+        next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return {
+            "data": [asdict(interaction) for interaction in page[:limit]],
+            "next_cursor": next_cursor,
+        }
+
+    def iter_training_data(
+        self,
+        min_reward: Optional[float] = None,
+        dedup: str = DEDUP_OFF,
+        summary: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        トレーニング用データを1件ずつ返す
+
+        Args:
+            min_reward: 最小報酬値（これ以上の報酬を持つデータのみ返す）
+            dedup: ほぼ同じインタラクションの扱い (off / drop / weight、dedup.py を参照)。
+                weight ではまとめた件数を数えてから返すのでデータを2回読む
+            summary: 渡された場合、読み終えたときに duplicates（除いた件数）を設定する
+        """
+        if dedup == DEDUP_OFF:
+            for interaction in self.iter_interactions(min_reward):
+                yield _training_record(interaction)
+            return
 
-    def _update_data_file(self):
-        """データファイルを更新"""
-        data_file = self.data_dir / "interactions.jsonl"
-        with open(data_file, "w", encoding="utf-8") as f:
-            for interaction in self.interactions:
-                f.write(json.dumps(asdict(interaction), ensure_ascii=False) + "\n")
+        detector = NearDuplicateDetector.from_config(self.config)
+
+        def assign(interaction: Interaction) -> str:
+            return detector.assign(
+                interaction.id,
+                interaction.user_message,
+                interaction.bot_response,
+                interaction.task_type or "",
+            )
+
+        duplicates = 0
+        if dedup == DEDUP_DROP:
+            for interaction in self.iter_interactions(min_reward):
+                if assign(interaction) == interaction.id:
+                    yield _training_record(interaction)
+                else:
+                    duplicates += 1
+        else:
+            weights: Dict[str, int] = {}
+            for interaction in self.iter_interactions(min_reward):
+                representative = assign(interaction)
+                weights[representative] = weights.get(representative, 0) + 1
+            # 1回目の後に記録されたものは次のエクスポートに回す
+            for interaction in self.iter_interactions(min_reward):
+                weight = weights.get(interaction.id)
+                if weight is not None:
+                    record = _training_record(interaction)
+                    record["weight"] = weight
+                    yield record
+            duplicates = sum(weights.values()) - len(weights)
+
+        if summary is not None:
+            summary["duplicates"] = duplicates
 
     def get_training_data(self, min_reward: Optional[float] = None) -> List[Dict[str, Any]]:
         """
@@ -162,47 +432,144 @@ class DataCollector:
         Returns:
             Agent Lightning用にフォーマットされたトレーニングデータ
         """
-        training_data = []
+        return list(self.iter_training_data(min_reward))
 
-        for interaction in self.interactions:
-            if min_reward is not None and (interaction.reward is None or interaction.reward < min_reward):
-                continue
+    def get_training_data_after(
+        self,
+        after: Optional[int] = None,
+        min_reward: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        ウォーターマークより後にコミットされたトレーニングデータを取得
 
-            training_data.append({
-                "input": interaction.user_message,
-                "output": interaction.bot_response,
-                "task_type": interaction.task_type,
-                "reward": interaction.reward or 0.0,
-                "context": interaction.context,
-            })
+        ウォーターマークは記録時刻ではなくコミット順の位置（セグメントログ上の
+        件数、SQLite では seq）。記録時刻はグループコミットライターに渡す前に
+        払い出し、ワーカーごとにも別々に払い出すので、時刻の順とコミットの順は
+        入れ替わることがある。時刻をウォーターマークにすると、後からコミット
+        された古い時刻のインタラクションを取りこぼす。
 
-        return training_data
+        各レコードには get_training_data の項目に加えて id と timestamp を含む。
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """データ統計を取得"""
-        stats = {
-            "total_interactions": len(self.interactions),
-            "interactions_by_task": {},
-            "average_reward": 0.0,
-            "rewarded_count": 0,
-        }
+        Args:
+            after: 前回返されたウォーターマーク（None なら全件）
+            min_reward: 最小報酬値
 
-        total_reward = 0.0
-        rewarded = 0
+        Returns:
+            (トレーニングデータのリスト（コミット順）, 読み込み時点までコミットされた位置)
+        """
+        interactions, watermark = self._committed_after(after or 0, min_reward)
+        return [_training_record(interaction, with_id=True) for interaction in interactions], watermark
 
-        for interaction in self.interactions:
-            task_type = interaction.task_type
-            stats["interactions_by_task"][task_type] = stats["interactions_by_task"].get(task_type, 0) + 1
+    def _committed_after(
+        self,
+        position: int,
+        min_reward: Optional[float],
+    ) -> Tuple[Iterator[Interaction], int]:
+        """コミット順の位置 position より後ろのインタラクションと、読み込み時点の最後の位置"""
+        raise NotImplementedError
 
-            if interaction.reward is not None:
-                total_reward += interaction.reward
-                rewarded += 1
+    def iter_export_lines(
+        self,
+        min_reward: Optional[float] = None,
+        summary: Optional[Dict[str, Any]] = None,
+        dedup: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        エクスポートを NDJSON の行として1行ずつ生成
 
-        if rewarded > 0:
-            stats["average_reward"] = total_reward / rewarded
-            stats["rewarded_count"] = rewarded
+        先頭行はメタデータ ({"metadata": {...}})、末尾行は件数などのサマリー
+        ({"summary": {...}})、その間が1行1件のトレーニングデータ。
 
-        return stats
+        Args:
+            min_reward: 最小報酬値
+            summary: 渡された場合、書き出し完了時にサマリーの内容で更新する
+            dedup: ほぼ同じインタラクションの扱い (off / drop / weight、省略時は AGL_DEDUP_MODE)
+        """
+        summary = summary if summary is not None else {}
+        dedup = normalize_dedup_mode(dedup or self.config.dedup_mode)
+        yield json.dumps({
+            "metadata": {
+                "exported_at": datetime.now().isoformat(),
+                "min_reward": min_reward,
+                "dedup": dedup,
+                "statistics": self.get_statistics(),
+            },
+        }, ensure_ascii=False) + "\n"
+
+        total = 0
+        for record in self.iter_training_data(min_reward, dedup=dedup, summary=summary):
+            total += 1
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+        summary.update({
+            "total_samples": total,
+            "completed_at": datetime.now().isoformat(),
+        })
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    def export_training_data(
+        self,
+        output_path: Optional[str] = None,
+        fmt: Optional[str] = None,
+        min_reward: Optional[float] = None,
+        dedup: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        トレーニングデータをストリーミングでファイルに書き出す
+
+        データセット全体をメモリに載せずに1パスで書き出す（dedup が weight の場合は2パス）。
+
+        Args:
+            output_path: 出力パス（デフォルトは training_data/export.<fmt>）
+            fmt: json / jsonl / jsonl.gz（省略時は拡張子から判定、既定は json）
+            min_reward: 最小報酬値
+            dedup: ほぼ同じインタラクションの扱い (off / drop / weight、省略時は AGL_DEDUP_MODE)
+
+        Returns:
+            output_path, format, total_samples, duplicates, statistics を含む辞書
+        """
+        fmt = fmt or _format_from_path(output_path) or "json"
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        dedup = normalize_dedup_mode(dedup or self.config.dedup_mode)
+        output_path = output_path or str(self.data_dir / f"export.{fmt}")
+
+        summary: Dict[str, Any] = {}
+        statistics = self.get_statistics()
+
+        if fmt == "json":
+            # 従来の {"metadata": ..., "data": [...]} 形式。件数は最後に分かるので metadata を後ろに置く
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write('{"data": [\n')
+                total = 0
+                for record in self.iter_training_data(min_reward, dedup=dedup, summary=summary):
+                    if total:
+                        f.write(",\n")
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    total += 1
+                metadata = {
+                    "exported_at": datetime.now().isoformat(),
+                    "total_samples": total,
+                    "dedup": dedup,
+                    "duplicates": summary.get("duplicates", 0),
+                    "statistics": statistics,
+                }
+                f.write('\n], "metadata": ' + json.dumps(metadata, ensure_ascii=False) + "}\n")
+            summary["total_samples"] = total
+        else:
+            opener = gzip.open if fmt == "jsonl.gz" else open
+            with opener(output_path, "wt", encoding="utf-8") as f:
+                for line in self.iter_export_lines(min_reward, summary=summary, dedup=dedup):
+                    f.write(line)
+
+        print(f"Exported {summary['total_samples']} samples to {output_path}")
+        return {
+            "output_path": output_path,
+            "format": fmt,
+            "total_samples": summary["total_samples"],
+            "duplicates": summary.get("duplicates", 0),
+            "statistics": statistics,
+        }
 
     def export_for_training(self, output_path: Optional[str] = None) -> str:
         """
@@ -214,35 +581,834 @@ class DataCollector:
         Returns:
             エクスポートされたファイルパス
         """
-        output_path = output_path or str(self.data_dir / "export.json")
-        training_data = self.get_training_data()
+        return self.export_training_data(output_path)["output_path"]
 
-        export_data = {
-            "metadata": {
-                "exported_at": datetime.now().isoformat(),
-                "total_samples": len(training_data),
-                "statistics": self.get_statistics(),
+
+class DataCollector(BaseCollector):
+    """
+    LINE Bot のインタラクションデータを収集
+    Agent Lightning のトレーニングデータとして使用
+
+    データは training_data/segments/ 以下のセグメントログに追記され (AGL_STORAGE=segments)、
+    メモリ上には直近 max_samples 件のみを保持する。
+    それより古いデータは必要なときにディスクから遅延読み込みする。
+
+    起動時はスナップショット (snapshot.bin) を一括で読み込み、
+    それ以降に追記されたログの末尾はバックグラウンドで再生する。
+
+    スレッドセーフで、同じデータディレクトリを複数のワーカープロセスで
+    共有できる。ディスクへの書き込みはプロセス間ロック (collector.lock)
+    の中で行い、その前に他のプロセスが追記したインタラクションと報酬を
+    取り込む (_sync)。
+    """
+
+    def __init__(self, config: Optional[AgentLightningConfig] = None):
+        super().__init__(config)
+        self.reward_file = self.data_dir / "rewards.jsonl"
+        self.snapshot_file = self.data_dir / "snapshot.bin"
+        # ロック順: _compaction_lock -> _lock -> _file_lock
+        self._compaction_lock = FileLock(self.data_dir / "compaction.lock")
+        with self._file_lock:
+            self._log = SegmentedLog(
+                self.data_dir / "segments",
+                max_bytes=self.config.segment_max_bytes,
+                max_age_seconds=self.config.segment_max_age_hours * 3600,
+            )
+        # 直近 max_samples 件のインタラクション
+        self.interactions: Deque[Interaction] = deque(maxlen=self.config.max_samples)
+        # ID -> Interaction の索引（メモリ上のウィンドウのみ）
+        self._index: Dict[str, Interaction] = {}
+        # (timestamp, id) の索引と task_type ごとの二次索引（メモリ上のウィンドウのみ）
+        self._time_index = TimeIndex()
+        # コンパクション前の報酬ジャーナル ID -> (reward, feedback)
+        self._pending_rewards: Dict[str, Tuple[float, Optional[str]]] = {}
+        # task_type ごとの件数・報酬の累計（書き込み時に更新）
+        self._stats = RunningStats()
+        self._lock = threading.Lock()
+        self._journal_entries = 0
+        # 報酬ジャーナルの読み込み済みバイト位置と inode（他プロセスの追記・置き換えの検知用）
+        self._journal_offset = 0
+        self._journal_inode: Optional[int] = None
+        self._compacting = False
+        # 起動時の末尾再生中に記録された件数
+        self._live_appends = 0
+        self._load_existing_data()
+        self._start_writer()
+
+    def close(self):
+        """未コミットの書き込みを反映し、スナップショットを保存"""
+        super().close()
+        if self.config.snapshot_enabled:
+            self.save_snapshot()
+
+    def _load_existing_data(self):
+        """既存のデータを読み込む"""
+        with self._lock, self._file_lock:
+            legacy_file = self.data_dir / "interactions.jsonl"
+            if legacy_file.exists() and self._log.total_count() == 0:
+                self._log.import_legacy(legacy_file)
+
+            if self.config.snapshot_enabled and self._load_snapshot():
+                return
+
+            self._reload_window()
+            print(f"Loaded {len(self.interactions)} of {self._log.total_count()} existing interactions")
+            self._ready.set()
+        self._maybe_compact()
+
+    def _reload_window(self):
+        """ウィンドウをセグメントの末尾から読み直し、報酬ジャーナルを再生（ロック内で呼び出す）"""
+        self._log.refresh()
+        self.interactions.clear()
+        self._index = {}
+        self._time_index.clear()
+        for data in self._log.tail_records(self.config.max_samples):
+            self._remember(Interaction(**data))
+        self._replay_reward_journal()
+
+    def _load_snapshot(self) -> bool:
+        """
+        スナップショットからウィンドウを復元し、末尾の再生をバックグラウンドで開始
+
+        Returns:
+            スナップショットを使用できた場合 True
+        """
+        snapshot = read_snapshot(self.snapshot_file)
+        if snapshot is None:
+            return False
+
+        total = self._log.total_count()
+        watermark = snapshot["watermark"]
+        columns = snapshot["columns"]
+        if any(name not in columns for name in INTERACTION_FIELDS):
+            print("Snapshot does not match the interaction fields, falling back to full load")
+            return False
+        size = len(columns["id"])
+        # ログが巻き戻っている、またはウィンドウが設定より小さい場合は使わない
+        if watermark > total or size < min(self.config.max_samples, watermark):
+            print("Snapshot is stale, falling back to full load")
+            return False
+
+        rows = zip(*(columns[name] for name in INTERACTION_FIELDS))
+        for row in rows:
+            self._remember(Interaction(*row))
+        print(f"Loaded {len(self.interactions)} interactions from snapshot, replaying {total - watermark} in background")
+
+        thread = threading.Thread(
+            target=self._replay_tail,
+            args=(watermark, total, _inode(self.reward_file)),
+            name="agl-replay",
+            daemon=True,
+        )
+        thread.start()
+        return True
+
+    def _replay_tail(self, watermark: int, total: int, journal_inode: Optional[int]):
+        """スナップショット以降に追記されたログとジャーナルを再生"""
+        try:
+            tail = [Interaction(**data) for data in self._log.iter_records(start=watermark, limit=total - watermark)]
+
+            with self._lock, self._file_lock:
+                # 再生中に記録されたインタラクションは末尾の後ろに並べる
+                window = list(self.interactions)
+                live = min(self._live_appends, len(window))
+                merged = window[:len(window) - live] + tail + window[len(window) - live:]
+                self.interactions = deque(merged, maxlen=self.config.max_samples)
+                self._index = {interaction.id: interaction for interaction in self.interactions}
+                self._time_index.rebuild(
+                    (interaction.timestamp, interaction.id, interaction.task_type)
+                    for interaction in self.interactions
+                )
+                if _inode(self.reward_file) != journal_inode:
+                    # 再生中に他のプロセスがコンパクションした
+                    self._reload_window()
+                else:
+                    self._replay_reward_journal()
+                self._ready.set()
+
+            print(f"Replayed {len(tail)} interactions after snapshot")
+        except Exception as e:
+            print(f"Warning: Failed to replay interaction log: {e}")
+            self._ready.set()
+
+        self._maybe_compact()
+
+    def save_snapshot(self):
+        """メモリ上のウィンドウをスナップショットとして保存"""
+        if not self._ready.is_set():
+            return
+
+        with self._lock, self._file_lock:
+            self._sync()
+            window = list(self.interactions)
+            watermark = self._log.total_count()
+            columns = {
+                name: [getattr(interaction, name) for interaction in window]
+                for name in INTERACTION_FIELDS
+            }
+        with DISK_WRITE_SECONDS.time(backend="segments", operation="snapshot"):
+            write_snapshot(self.snapshot_file, columns, watermark)
+
+    def _remember(self, interaction: Interaction):
+        """ウィンドウに追加し、押し出された古いインタラクションを索引から外す"""
+        if self.interactions.maxlen == 0:
+            return
+        if len(self.interactions) == self.interactions.maxlen:
+            evicted = self.interactions[0]
+            self._index.pop(evicted.id, None)
+            self._time_index.remove(evicted.timestamp, evicted.id, evicted.task_type)
+        self.interactions.append(interaction)
+        self._index[interaction.id] = interaction
+        self._time_index.add(interaction.timestamp, interaction.id, interaction.task_type)
+
+    def _replay_reward_journal(self):
+        """
+        報酬ジャーナルを再生して最新の報酬を反映（ロック内で呼び出す）
+
+        集計はセグメントに書かれた値での集計から始め、ジャーナルの
+        各エントリの previous_reward -> reward の差分を積み上げて復元する。
+        """
+        self._pending_rewards = {}
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._journal_inode = None
+        self._stats = self._log.stats()
+        if not self.reward_file.exists():
+            return
+
+        self._read_reward_journal()
+        print(f"Replayed {self._journal_entries} reward journal entries")
+
+    def _read_reward_journal(self):
+        """報酬ジャーナルの読み込み済み位置以降のエントリを反映（ロック内で呼び出す）"""
+        with open(self.reward_file, "rb") as f:
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._journal_offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            # 追記はプロセス間ロックの中で行うので、改行で終わっていない末尾は
+            # クラッシュで中断されたもの。次の追記と1行につながらないよう切り詰める
+            os.truncate(self.reward_file, self._journal_offset + complete)
+            print(f"Warning: Discarded {len(data) - complete} bytes of a partially written reward journal entry")
+            data = data[:complete]
+        self._journal_offset += len(data)
+
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            self._journal_entries += 1
+            self._pending_rewards[entry["id"]] = (entry["reward"], entry.get("feedback"))
+            if "task_type" in entry:
+                self._stats.update_reward(entry["task_type"], entry.get("previous_reward"), entry["reward"])
+            interaction = self._index.get(entry["id"])
+            if interaction is not None:
+                interaction.reward = entry["reward"]
+                interaction.feedback = entry.get("feedback")
+
+    def _sync(self):
+        """
+        他のワーカープロセスが書き込んだインタラクションと報酬を取り込む
+
+        _lock と _file_lock の中で呼び出す。単一プロセスでは stat だけで戻る。
+        """
+        for data in self._log.refresh():
+            interaction = Interaction(**data)
+            self._remember(interaction)
+            self._stats.add(interaction.task_type, interaction.reward)
+            if not self._ready.is_set():
+                self._live_appends += 1
+
+        # 起動時の再生中は、完了時にジャーナル全体を再生する
+        # （報酬を読む書き込み (set_reward) は再生の完了を待ってから呼ばれる）
+        if not self._ready.is_set():
+            return
+
+        signature = file_signature(self.reward_file)
+        if self._journal_inode is not None and (signature is None or signature[0] != self._journal_inode):
+            # 他のプロセスがコンパクションでジャーナルを置き換えた。
+            # 畳み込まれた報酬はセグメントから読み直す
+            self._reload_window()
+        elif signature is not None and signature[2] > self._journal_offset:
+            self._read_reward_journal()
+
+    def _commit_interactions(self, interactions: List[Interaction]):
+        """バッチをセグメントログに書き込む"""
+        records = [asdict(interaction) for interaction in interactions]
+        with self._lock, self._file_lock:
+            self._sync()
+            segment_count = len(self._log.segments)
+            with DISK_WRITE_SECONDS.time(backend="segments", operation="interactions"):
+                self._log.append_many(records, fsync=self.config.fsync)
+            if len(self._log.segments) != segment_count:
+                print(f"Rotated interaction log to {self._log.active.name}")
+
+            for interaction in interactions:
+                self._remember(interaction)
+                self._stats.add(interaction.task_type, interaction.reward)
+            if not self._ready.is_set():
+                self._live_appends += len(interactions)
+
+    def set_reward(self, interaction_id: str, reward: float, feedback: Optional[str] = None):
+        """既存のインタラクションに報酬を設定（報酬ジャーナルに追記）"""
+        # 起動時の再生中はジャーナルが未反映で、ジャーナルに書く previous_reward が
+        # 古いスナップショットやセグメントの値になってしまうので完了を待つ
+        self._ready.wait()
+        with self._lock, self._file_lock:
+            self._sync()
+            interaction = self._index.get(interaction_id)
+            if interaction is not None:
+                task_type = interaction.task_type
+                previous_reward = interaction.reward
+                interaction.reward = reward
+                interaction.feedback = feedback
+            else:
+                # メモリ外の古いインタラクションはセグメントを遅延検索
+                record = self._log.find(interaction_id)
+                if record is None:
+                    raise ValueError(f"Interaction {interaction_id} not found")
+                task_type = record["task_type"]
+                previous_reward = self._pending_rewards.get(interaction_id, (record["reward"],))[0]
+
+            self._append_reward(interaction_id, task_type, previous_reward, reward, feedback)
+            self._stats.update_reward(task_type, previous_reward, reward)
+
+        # Agent Lightningに報酬を発行（バックグラウンドキュー経由）
+        self._emit_reward(interaction_id, reward, feedback)
+
+        self._maybe_compact()
+
+    def _append_reward(
+        self,
+        interaction_id: str,
+        task_type: str,
+        previous_reward: Optional[float],
+        reward: float,
+        feedback: Optional[str],
+    ):
+        """報酬ジャーナルに1行追記"""
+        entry = {
+            "id": interaction_id,
+            "task_type": task_type,
+            "previous_reward": previous_reward,
+            "reward": reward,
+            "feedback": feedback,
+            "timestamp": datetime.now().isoformat(),
+        }
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with DISK_WRITE_SECONDS.time(backend="segments", operation="reward"), open(self.reward_file, "ab") as f:
+            f.write(data)
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+        self._journal_offset += len(data)
+        self._pending_rewards[interaction_id] = (reward, feedback)
+        self._journal_entries += 1
+
+    def _maybe_compact(self):
+        """ジャーナルが閾値を超えたらバックグラウンドでコンパクション"""
+        with self._lock:
+            if not self._ready.is_set():
+                return
+            if self._compacting or self._journal_entries < self.config.reward_compact_threshold:
+                return
+            self._compacting = True
+
+        thread = threading.Thread(target=self._run_compaction, name="agl-compaction", daemon=True)
+        thread.start()
+
+    def _run_compaction(self):
+        try:
+            with self._compaction_lock:
+                # 待っている間に他のプロセスがコンパクションを済ませていれば何もしない
+                with self._lock, self._file_lock:
+                    self._sync()
+                    due = self._journal_entries >= self.config.reward_compact_threshold
+                if due:
+                    self.compact()
+        except Exception as e:
+            print(f"Warning: Failed to compact reward journal: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """
+        報酬ジャーナルをセグメントに畳み込む
+
+        対象IDを含むセグメントだけを書き直す。アクティブセグメントが
+        対象に含まれる場合は先にローテーションしてクローズ済みにする。
+        書き直し中に追記された報酬はジャーナル末尾として引き継ぐ。
+        コンパクションは compaction.lock で全プロセスを通じて1つずつ行う。
+        """
+        with self._compaction_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock, self._file_lock:
+            self._sync()
+            pending = dict(self._pending_rewards)
+            journal_offset = self._journal_offset
+            if any(self._log.active in self._log.candidate_segments(i) for i in pending):
+                self._log.rotate()
+            segments = [s for s in self._log.segments if s.closed]
+
+        def apply(record: Dict[str, Any]) -> Dict[str, Any]:
+            if record["id"] in pending:
+                record["reward"], record["feedback"] = pending[record["id"]]
+            return record
+
+        targets = {
+            segment.name: segment
+            for interaction_id in pending
+            for segment in self._log.candidate_segments(interaction_id)
+            if segment.closed
+        }
+        rewritten = []
+        for segment in segments:
+            if segment.name in targets:
+                with DISK_WRITE_SECONDS.time(backend="segments", operation="compaction"):
+                    self._log.rewrite_segment(segment, apply)
+                rewritten.append(segment)
+
+        # ジャーナルを切り詰める前にスナップショットを更新しておく
+        if self.config.snapshot_enabled:
+            self.save_snapshot()
+
+        with self._lock, self._file_lock:
+            # 他のプロセスのローテーションでマニフェストを読み直していたら書き直し結果を反映し直す
+            self._sync()
+            for segment in rewritten:
+                current = self._log.get_segment(segment.name)
+                if current is not None:
+                    current.size, current.stats = segment.size, segment.stats
+            self._log.save()
+
+            # 畳み込み済みのジャーナルを切り詰める
+            tail = b""
+            if self.reward_file.exists():
+                with open(self.reward_file, "rb") as src:
+                    src.seek(journal_offset)
+                    tail = src.read()
+            journal_tmp = self.reward_file.with_suffix(".jsonl.tmp")
+            with open(journal_tmp, "wb") as dst:
+                dst.write(tail)
+                self._journal_inode = os.fstat(dst.fileno()).st_ino
+            os.replace(journal_tmp, self.reward_file)
+            self._journal_offset = len(tail)
+            self._journal_entries = tail.count(b"\n")
+
+            for interaction_id, value in pending.items():
+                if self._pending_rewards.get(interaction_id) == value:
+                    del self._pending_rewards[interaction_id]
+
+        print(f"Compacted {len(pending)} reward journal entries into {len(targets)} segments")
+
+    def iter_interactions(self, min_reward: Optional[float] = None) -> Iterator[Interaction]:
+        """
+        インタラクションを古い順に返す
+
+        メモリ上のウィンドウより古いものはセグメントから遅延読み込みし、
+        未コンパクションの報酬を反映してから返す。
+        """
+        self._ready.wait()
+        with self._lock, self._file_lock:
+            self._sync()
+            window = list(self.interactions)
+            on_disk = self._log.total_count() - len(window)
+            pending = dict(self._pending_rewards)
+
+        def iter_all() -> Iterator[Interaction]:
+            for data in self._log.iter_records(limit=on_disk):
+                interaction = Interaction(**data)
+                if interaction.id in pending:
+                    interaction.reward, interaction.feedback = pending[interaction.id]
+                yield interaction
+            yield from window
+
+        for interaction in iter_all():
+            if min_reward is not None and (interaction.reward is None or interaction.reward < min_reward):
+                continue
+            yield interaction
+
+    def _committed_after(
+        self,
+        position: int,
+        min_reward: Optional[float],
+    ) -> Tuple[Iterator[Interaction], int]:
+        """
+        ログ上の位置 position 以降のインタラクション
+
+        セグメントログへの追記はプロセス間ロックの中で行うので、ログ上の
+        位置の順がそのままコミットの順になる。ウィンドウより前の部分は
+        セグメントから読み、未コンパクションの報酬を反映する。
+
+        Returns:
+            (インタラクションのイテレータ, 読み込み時点のログの件数)
+        """
+        self._ready.wait()
+        with self._lock, self._file_lock:
+            self._sync()
+            window = list(self.interactions)
+            total = self._log.total_count()
+            on_disk = total - len(window)
+            pending = dict(self._pending_rewards)
+
+        def iter_after() -> Iterator[Interaction]:
+            if position < on_disk:
+                for data in self._log.iter_records(start=position, limit=on_disk - position):
+                    interaction = Interaction(**data)
+                    if interaction.id in pending:
+                        interaction.reward, interaction.feedback = pending[interaction.id]
+                    yield interaction
+            yield from window[max(0, position - on_disk):]
+
+        matched = (
+            interaction for interaction in iter_after()
+            if min_reward is None or (interaction.reward is not None and interaction.reward >= min_reward)
+        )
+        return matched, total
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """データ統計を取得（書き込み時に更新している累計から O(1) で返す）"""
+        self._ready.wait()
+        with self._lock, self._file_lock:
+            self._sync()
+            return self._stats.to_statistics()
+
+    def storage_metrics(self) -> Dict[str, Any]:
+        """
+        /metrics 用に保存先の状態を取得
+
+        メモリ使用量は直近のインタラクションを標本にした1件あたりの
+        サイズと、索引のコンテナのサイズから見積もる。
+        """
+        with self._lock:
+            window = len(self.interactions)
+            sample = list(itertools.islice(reversed(self.interactions), MEMORY_SAMPLE_SIZE))
+            total = self._log.total_count()
+            index_bytes = sys.getsizeof(self.interactions) + sys.getsizeof(self._index)
+            index_bytes += sys.getsizeof(self._time_index.keys) + window * TIME_INDEX_KEY_BYTES
+            index_bytes += sum(sys.getsizeof(keys) for keys in self._time_index.by_task.values())
+            segments_bytes = sum(segment.size for segment in self._log.segments)
+
+        per_interaction = sum(_interaction_size(i) for i in sample) / len(sample) if sample else 0
+        return {
+            "interactions": total,
+            "window_interactions": window,
+            "memory_bytes": int(window * per_interaction) + index_bytes,
+            "disk_bytes": {
+                "segments": segments_bytes,
+                "rewards": _file_size(self.reward_file),
+                "snapshot": _file_size(self.snapshot_file),
             },
-            "data": training_data,
         }
 
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+    def _query(self, query: InteractionQuery, after: Optional[Tuple[str, str]], limit: int) -> List[Interaction]:
+        """
+        条件に合うインタラクションを (timestamp, id) の昇順に最大 limit 件返す
+
+        メモリ上のウィンドウは時刻と task_type の索引で引く。それより古い
+        データは、時刻範囲と task_type ごとの集計で候補を絞ったセグメントを
+        古い順に読み、それ以上読んでも結果が変わらなくなったら打ち切る。
+        """
+        self._ready.wait()
+        with self._lock, self._file_lock:
+            self._sync()
+            results: List[Interaction] = []
+            for _, interaction_id in self._time_index.range(query.task_type, after, query.since, query.until):
+                interaction = self._index[interaction_id]
+                if query.matches(interaction):
+                    results.append(replace(interaction))
+                    if len(results) == limit:
+                        break
+            on_disk = self._log.total_count() - len(self.interactions)
+            pending = dict(self._pending_rewards)
+            segments = list(self._log.segments)
+
+        # ウィンドウより前（ログ上の位置が on_disk 未満）のレコードを含むセグメント
+        candidates: List[Tuple[Segment, int]] = []
+        start = 0
+        for segment in segments:
+            if start >= on_disk:
+                break
+            if _segment_may_match(segment, query, after):
+                candidates.append((segment, start))
+            start += segment.count
+        candidates.sort(key=lambda candidate: candidate[0].first_timestamp)
+
+        for segment, start in candidates:
+            if len(results) >= limit and segment.first_timestamp > results[limit - 1].timestamp:
+                break
+            for position, data in enumerate(self._log.read_segment(segment), start):
+                if position >= on_disk:
+                    break
+                interaction = Interaction(**data)
+                if interaction.id in pending:
+                    interaction.reward, interaction.feedback = pending[interaction.id]
+                if (after is None or _sort_key(interaction) > after) and query.matches(interaction):
+                    results.append(interaction)
+            results.sort(key=_sort_key)
+            del results[limit:]
+
+        return results
+
+
+class SQLiteCollector(BaseCollector):
+    """
+    インタラクションを SQLite に保存するコレクター (AGL_STORAGE=sqlite)
+
+    training_data/interactions.db に WAL モードで保存し、min_reward での
+    絞り込みや task_type ごとの集計はインデックスを使ったクエリで行う。
+    初回起動時に既存のセグメントログ（または旧形式の interactions.jsonl）と
+    報酬ジャーナルを一度だけ取り込む。
+    """
+
+    def __init__(self, config: Optional[AgentLightningConfig] = None):
+        super().__init__(config)
+        self.db_file = self.data_dir / "interactions.db"
+        with self._file_lock:
+            self._store = SQLiteStore(self.db_file, fsync=self.config.fsync)
+            self._migrate()
+        self._ready.set()
+        self._start_writer()
+
+    def close(self):
+        """未コミットの書き込みを反映し、データベースを閉じる"""
+        super().close()
+        self._store.close()
+
+    def _migrate(self):
+        """既存のデータを一度だけ取り込む（プロセス間ロック内で呼び出す）"""
+        if self._store.get_meta("migrated_at") is not None:
+            return
+
+        source, records = self._existing_records()
+        count = self._store.insert_many(records, meta={
+            "migrated_at": datetime.now().isoformat(),
+            "migrated_from": source or "",
+        })
+        if source:
+            print(f"Migrated {count} interactions from {source} to {self.db_file}")
+
+    def _existing_records(self) -> Tuple[Optional[str], Iterator[Dict[str, Any]]]:
+        """取り込み元と、報酬ジャーナルを反映したレコード"""
+        manifest_file = self.data_dir / "segments" / "manifest.json"
+        legacy_file = self.data_dir / "interactions.jsonl"
+        if manifest_file.exists():
+            source = str(manifest_file.parent)
+            log = SegmentedLog(
+                manifest_file.parent,
+                max_bytes=self.config.segment_max_bytes,
+                max_age_seconds=self.config.segment_max_age_hours * 3600,
+            )
+            records = log.iter_records()
+        elif legacy_file.exists():
+            source = str(legacy_file)
+            records = _read_jsonl(legacy_file)
+        else:
+            return None, iter(())
+
+        rewards: Dict[str, Tuple[float, Optional[str]]] = {}
+        reward_file = self.data_dir / "rewards.jsonl"
+        if reward_file.exists():
+            with open(reward_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    # 改行で終わっていない末尾はクラッシュで書き込みが中断されたもの
+                    if line.strip() and line.endswith("\n"):
+                        entry = json.loads(line)
+                        rewards[entry["id"]] = (entry["reward"], entry.get("feedback"))
+
+        def apply() -> Iterator[Dict[str, Any]]:
+            for record in records:
+                if record["id"] in rewards:
+                    record["reward"], record["feedback"] = rewards[record["id"]]
+                yield record
+
+        return source, apply()
+
+    def _commit_interactions(self, interactions: List[Interaction]):
+        """バッチを1トランザクションで追加"""
+        with DISK_WRITE_SECONDS.time(backend="sqlite", operation="interactions"):
+            self._store.insert_many(asdict(interaction) for interaction in interactions)
+
+    def set_reward(self, interaction_id: str, reward: float, feedback: Optional[str] = None):
+        """既存のインタラクションに報酬を設定（id のインデックスで更新）"""
+        with DISK_WRITE_SECONDS.time(backend="sqlite", operation="reward"):
+            updated = self._store.update_reward(interaction_id, reward, feedback)
+        if not updated:
+            raise ValueError(f"Interaction {interaction_id} not found")
+        self._emit_reward(interaction_id, reward, feedback)
+
+    def iter_interactions(self, min_reward: Optional[float] = None) -> Iterator[Interaction]:
+        """インタラクションを古い順に返す（min_reward は reward のインデックスで絞り込む）"""
+        for data in self._store.iter_records(min_reward):
+            yield Interaction(**data)
+
+    def _committed_after(
+        self,
+        position: int,
+        min_reward: Optional[float],
+    ) -> Tuple[Iterator[Interaction], int]:
+        """
+        seq が position より大きいインタラクション
+
+        書き込みは BEGIN IMMEDIATE で1つずつ行うので、seq の順がそのまま
+        コミットの順になる。先に最後の seq を読み、それ以下に限って返す。
+        """
+        last_seq = self._store.last_seq()
+        records = self._store.iter_records(min_reward, after_seq=position, until_seq=last_seq)
+        return (Interaction(**data) for data in records), last_seq
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """データ統計を取得（(task_type, reward) のインデックスで集計）"""
+        return RunningStats(self._store.stats_by_task()).to_statistics()
+
+    def storage_metrics(self) -> Dict[str, Any]:
+        """/metrics 用に保存先の状態を取得（メモリ上にウィンドウは持たない）"""
+        return {
+            "interactions": self.get_statistics()["total_interactions"],
+            "window_interactions": 0,
+            "memory_bytes": 0,
+            "disk_bytes": {
+                "database": _file_size(self.db_file),
+                "wal": _file_size(self.db_file.with_name(self.db_file.name + "-wal")),
+            },
+        }
+
+    def _query(self, query: InteractionQuery, after: Optional[Tuple[str, str]], limit: int) -> List[Interaction]:
+        """条件に合うインタラクションを (timestamp, id) のインデックス順に返す"""
+        return [Interaction(**data) for data in self._store.query(after=after, limit=limit, **asdict(query))]
+
+
+def _sort_key(interaction: Interaction) -> Tuple[str, str]:
+    return (interaction.timestamp, interaction.id)
+
+
+def _training_record(interaction: Interaction, with_id: bool = False) -> Dict[str, Any]:
+    """インタラクションを get_training_data の形式に変換"""
+    record = {
+        "input": interaction.user_message,
+        "output": interaction.bot_response,
+        "task_type": interaction.task_type,
+        "reward": interaction.reward or 0.0,
+        "context": interaction.context,
+    }
+    if with_id:
+        record["id"] = interaction.id
+        record["timestamp"] = interaction.timestamp
+    return record
+
+
+def _segment_may_match(segment: Segment, query: InteractionQuery, after: Optional[Tuple[str, str]]) -> bool:
+    """セグメントの時刻範囲と task_type ごとの集計から、条件に合うレコードを含み得るか判定"""
+    if segment.first_timestamp is None:
+        return False
+    if query.task_type is not None and not segment.stats.get(query.task_type, {}).get("count"):
+        return False
+    if after is not None and segment.last_timestamp < after[0]:
+        return False
+    if query.since is not None and segment.last_timestamp < query.since:
+        return False
+    if query.until is not None and segment.first_timestamp >= query.until:
+        return False
+    return True
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    """ISO 8601 の時刻を記録時と同じローカル時刻の isoformat に揃える"""
+    if not value:
+        return None
+    try:
+        at = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}")
+    if at.tzinfo is not None:
+        at = at.astimezone().replace(tzinfo=None)
+    return at.isoformat()
+
+
+def _encode_cursor(interaction: Interaction) -> str:
+    data = json.dumps(list(_sort_key(interaction)), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, interaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return (timestamp, interaction_id)
+
+
+def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _interaction_size(interaction: Interaction) -> int:
+    """インタラクション1件のおおよそのメモリ使用量（インターン済みの user_id / task_type は除く）"""
+    size = sys.getsizeof(interaction)
+    for value in (interaction.id, interaction.timestamp, interaction.user_message,
+                  interaction.bot_response, interaction.reward, interaction.feedback):
+        if value is not None:
+            size += sys.getsizeof(value)
+    size += sys.getsizeof(interaction.context)
+    for key, value in interaction.context.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _inode(path: Path) -> Optional[int]:
+    signature = file_signature(path)
+    return signature[0] if signature else None
+
+
+def _format_from_path(path: Optional[str]) -> Optional[str]:
+    """出力パスの拡張子からエクスポート形式を判定"""
+    if not path:
+        return None
+    for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if path.endswith(f".{fmt}"):
+            return fmt
+    return None
+
+
+# AGL_STORAGE で選択できる保存先
+STORAGE_BACKENDS = {
+    "segments": DataCollector,
+    "sqlite": SQLiteCollector,
+}
+
 
-        print(f"Exported {len(training_data)} samples to {output_path}")
-        return output_path
+def create_collector(config: Optional[AgentLightningConfig] = None) -> BaseCollector:
+    """設定の storage に応じたコレクターを作成"""
+    config = config or AgentLightningConfig.from_env()
+    if config.storage not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {config.storage}")
+    return STORAGE_BACKENDS[config.storage](config)
 
 
 # シングルトンインスタンス
-_collector: Optional[DataCollector] = None
+_collector: Optional[BaseCollector] = None
+_collector_lock = threading.Lock()
 
 
-def get_collector() -> DataCollector:
-    """DataCollectorのシングルトンインスタンスを取得"""
+def get_collector() -> BaseCollector:
+    """コレクターのシングルトンインスタンスを取得"""
     global _collector
-    if _collector is None:
-        _collector = DataCollector()
-    return _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = create_collector()
+        return _collector
 
 
 if __name__ == "__main__":
@@ -22,12 +22,46 @@ class AgentLightningConfig:
 
     # データ収集設定
     data_dir: str = "training_data"
+    storage: str = "segments"  # 保存先: segments（JSONL セグメントログ）/ sqlite
     max_samples: int = 10000
+    reward_compact_threshold: int = 1000  # 報酬ジャーナルをコンパクションする行数
+    segment_max_bytes: int = 16 * 1024 * 1024  # セグメントのローテーションサイズ
+    segment_max_age_hours: float = 24.0  # セグメントのローテーション間隔
+    snapshot_enabled: bool = True  # 起動高速化用のスナップショットを使用するか
+    fsync: bool = True  # コミットごとに fsync するか
+    group_commit_interval_ms: float = 0.0  # グループコミットで書き込みを待ち合わせる時間
+    group_commit_max_batch: int = 256  # 1回のコミットにまとめる最大件数
+    record_batch_limit: int = 1000  # /api/record/batch で受け付ける最大件数
+    query_max_limit: int = 1000  # /api/training-data の1ページの最大件数
+    analyze_batch_limit: int = 1000  # /api/analyze/batch で受け付ける最大件数
+    analyze_cache_size: int = 10000  # 応答分析の結果をキャッシュする件数
+    dedup_mode: str = "off"  # ほぼ同じインタラクションの扱い: off / drop / weight
+    dedup_threshold: float = 0.8  # 同じとみなす文字 n-gram の Jaccard 係数
+    dedup_num_perm: int = 64  # MinHash のハッシュ関数の数
+    dedup_ngram: int = 3  # 比較に使う文字 n-gram の長さ
 
     # 報酬設定
     success_reward: float = 1.0
     partial_reward: float = 0.5
     failure_reward: float = -0.5
+    scoring_workers: int = 1  # 報酬計算のプロセス数（1 なら呼び出し元で計算、0 なら CPU 数）
+    scoring_chunk_size: int = 20000  # プロセスプールに渡す1チャンクの応答数
+    reward_cache_size: int = 100000  # 報酬キャッシュ (reward_cache.json) に保持するサンプル数
+
+    # Agent Lightning 発行キュー設定
+    emit_queue_size: int = 10000  # キューに積めるイベント数
+    emit_batch_size: int = 100  # フラッシャーが1回に取り出すイベント数
+    emit_max_retries: int = 3  # 発行失敗時の再試行回数
+    emit_retry_backoff: float = 0.5  # 再試行の初回待ち時間（秒、以降倍々）
+    emit_drop_policy: str = "drop_oldest"  # キューが満杯のとき: drop_oldest / drop_newest
+
+    # 最適化ジョブ設定
+    max_concurrent_jobs: int = 1  # 同時に実行する最適化ジョブ数
+    max_queued_jobs: int = 4  # 実行待ちにできる最適化ジョブ数
+    max_job_history: int = 100  # メモリ上に残す終了済みジョブ数
+    optimization_profile: str = "off"  # 最適化のプロファイリング: off / phases / cprofile
+    prompt_reload_interval: float = 1.0  # optimized_prompts.json の変更を確認する間隔（秒）
+    incremental_optimization: bool = True  # 前回のチェックポイント以降のデータだけを最適化するか
 
     # API設定
     api_host: str = "0.0.0.0"
@@ -43,7 +77,37 @@ class AgentLightningConfig:
             learning_rate=float(os.getenv("AGL_LEARNING_RATE", "1e-4")),
             num_epochs=int(os.getenv("AGL_NUM_EPOCHS", "3")),
             data_dir=os.getenv("AGL_DATA_DIR", "training_data"),
+            storage=os.getenv("AGL_STORAGE", "segments"),
             max_samples=int(os.getenv("AGL_MAX_SAMPLES", "10000")),
+            reward_compact_threshold=int(os.getenv("AGL_REWARD_COMPACT_THRESHOLD", "1000")),
+            segment_max_bytes=int(os.getenv("AGL_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024))),
+            segment_max_age_hours=float(os.getenv("AGL_SEGMENT_MAX_AGE_HOURS", "24")),
+            snapshot_enabled=os.getenv("AGL_SNAPSHOT", "true").lower() == "true",
+            fsync=os.getenv("AGL_FSYNC", "true").lower() == "true",
+            group_commit_interval_ms=float(os.getenv("AGL_GROUP_COMMIT_INTERVAL_MS", "0")),
+            group_commit_max_batch=int(os.getenv("AGL_GROUP_COMMIT_MAX_BATCH", "256")),
+            record_batch_limit=int(os.getenv("AGL_RECORD_BATCH_LIMIT", "1000")),
+            query_max_limit=int(os.getenv("AGL_QUERY_MAX_LIMIT", "1000")),
+            analyze_batch_limit=int(os.getenv("AGL_ANALYZE_BATCH_LIMIT", "1000")),
+            analyze_cache_size=int(os.getenv("AGL_ANALYZE_CACHE_SIZE", "10000")),
+            dedup_mode=os.getenv("AGL_DEDUP_MODE", "off"),
+            dedup_threshold=float(os.getenv("AGL_DEDUP_THRESHOLD", "0.8")),
+            dedup_num_perm=int(os.getenv("AGL_DEDUP_NUM_PERM", "64")),
+            dedup_ngram=int(os.getenv("AGL_DEDUP_NGRAM", "3")),
+            scoring_workers=int(os.getenv("AGL_SCORING_WORKERS", "1")),
+            scoring_chunk_size=int(os.getenv("AGL_SCORING_CHUNK_SIZE", "20000")),
+            reward_cache_size=int(os.getenv("AGL_REWARD_CACHE_SIZE", "100000")),
+            emit_queue_size=int(os.getenv("AGL_EMIT_QUEUE_SIZE", "10000")),
+            emit_batch_size=int(os.getenv("AGL_EMIT_BATCH_SIZE", "100")),
+            emit_max_retries=int(os.getenv("AGL_EMIT_MAX_RETRIES", "3")),
+            emit_retry_backoff=float(os.getenv("AGL_EMIT_RETRY_BACKOFF", "0.5")),
+            emit_drop_policy=os.getenv("AGL_EMIT_DROP_POLICY", "drop_oldest"),
+            max_concurrent_jobs=int(os.getenv("AGL_MAX_CONCURRENT_JOBS", "1")),
+            max_queued_jobs=int(os.getenv("AGL_MAX_QUEUED_JOBS", "4")),
+            max_job_history=int(os.getenv("AGL_MAX_JOB_HISTORY", "100")),
+            optimization_profile=os.getenv("AGL_OPTIMIZATION_PROFILE", "off"),
+            prompt_reload_interval=float(os.getenv("AGL_PROMPT_RELOAD_INTERVAL", "1.0")),
+            incremental_optimization=os.getenv("AGL_INCREMENTAL_OPTIMIZATION", "true").lower() == "true",
             api_host=os.getenv("AGL_API_HOST", "0.0.0.0"),
             api_port=int(os.getenv("AGL_API_PORT", "8081")),
         )
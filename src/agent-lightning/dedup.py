@@ -0,0 +1,184 @@
+"""
+Near-Duplicate Detection
+MinHash / LSH で文字 n-gram が似ているインタラクションをまとめる
+"""
+
+import unicodedata
+import zlib
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 重複の扱い
+DEDUP_OFF = "off"
+DEDUP_DROP = "drop"  # 代表の1件だけを残す
+DEDUP_WEIGHT = "weight"  # 代表の1件に、まとめた件数を weight として付ける
+
+DEDUP_MODES = (DEDUP_OFF, DEDUP_DROP, DEDUP_WEIGHT)
+
+# MinHash のハッシュ関数 (a * x + b) mod p の法（2^32 未満の最大の素数）。
+# a, b, x が 2^32 未満なので a * x + b は uint64 に収まる
+_PRIME = np.uint64(4294967291)
+
+# ハッシュ関数の係数を決める乱数のシード（プロセス間で同じ署名になるよう固定）
+DEFAULT_SEED = 1
+
+
+def normalize_dedup_mode(value: Any) -> str:
+    """
+    リクエストや環境変数の値を重複の扱いに変換
+
+    Raises:
+        ValueError: 不明な値の場合
+    """
+    mode = str(value).lower() if value else DEDUP_OFF
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unsupported dedup mode: {value} (expected one of {', '.join(DEDUP_MODES)})")
+    return mode
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    """全角・半角と大文字・小文字を揃え、空白を除く"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(text.split())
+
+
+def _lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    LSH のバンド数と1バンドの行数を選ぶ
+
+    候補になる類似度の目安 (1/bands)^(1/rows) が threshold 以下で最も近い
+    組み合わせにする（取りこぼしを減らし、候補は署名で確認する）。
+    """
+    best = (num_perm, 1)
+    best_threshold = 0.0
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        candidate = (1 / bands) ** (1 / rows)
+        if best_threshold < candidate <= threshold:
+            best, best_threshold = (bands, rows), candidate
+    return best
+
+
+class NearDuplicateDetector:
+    """
+    ほぼ同じ内容のインタラクションを見つける
+
+    user_message と bot_response の文字 n-gram（それぞれ別の集合として区別する）
+    から MinHash の署名を作り、LSH のバンドが一致した代表との推定 Jaccard 係数が
+    threshold 以上なら同じグループとみなす。グループは先に来たものを代表にして
+    逐次作るので、データを1回流すだけで判定できる。task_type が異なるものは
+    別のグループにする。
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, ngram: int = 3, seed: int = DEFAULT_SEED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.bands, self.rows = _lsh_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+
+        self._buckets: Dict[Tuple[str, int, bytes], List[Hashable]] = {}
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    @classmethod
+    def from_config(cls, config) -> "NearDuplicateDetector":
+        return cls(threshold=config.dedup_threshold, num_perm=config.dedup_num_perm, ngram=config.dedup_ngram)
+
+    def _shingles(self, field: str, text: Optional[str]) -> List[int]:
+        """文字 n-gram のハッシュ値（n 文字に満たない場合は全体を1つの n-gram とする）"""
+        text = _normalize_text(text)
+        n = self.ngram
+        grams = [text[i:i + n] for i in range(len(text) - n + 1)] or [text]
+        return [zlib.crc32(f"{field}\x00{gram}".encode("utf-8")) for gram in grams]
+
+    def signature(self, user_message: Optional[str], bot_response: Optional[str]) -> np.ndarray:
+        """MinHash の署名 (num_perm 個の uint32)"""
+        hashes = np.array(
+            self._shingles("u", user_message) + self._shingles("b", bot_response),
+            dtype=np.uint64,
+        )
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def similarity(self, a: np.ndarray, b: np.ndarray) -> float:
+        """署名から推定した Jaccard 係数"""
+        return float(np.count_nonzero(a == b)) / self.num_perm
+
+    def assign(
+        self,
+        key: Hashable,
+        user_message: Optional[str],
+        bot_response: Optional[str],
+        group: str = "",
+    ) -> Hashable:
+        """
+        インタラクションをグループに割り当てる
+
+        Args:
+            key: インタラクションを識別するキー
+            group: この値が同じものどうしだけを比べる（task_type）
+
+        Returns:
+            代表のキー（似ているものが無ければ key 自身が新しい代表になる）
+        """
+        signature = self.signature(user_message, bot_response)
+        band_keys = [
+            (group, i, signature[i * self.rows:(i + 1) * self.rows].tobytes())
+            for i in range(self.bands)
+        ]
+
+        checked = set()
+        for band_key in band_keys:
+            for representative in self._buckets.get(band_key, ()):
+                if representative in checked:
+                    continue
+                checked.add(representative)
+                if self.similarity(signature, self._signatures[representative]) >= self.threshold:
+                    return representative
+
+        self._signatures[key] = signature
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        return key
+
+
+def deduplicate(
+    records: List[Dict[str, Any]],
+    detector: NearDuplicateDetector,
+    mode: str = DEDUP_DROP,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    get_training_data 形式のレコードから重複を除く
+
+    Args:
+        records: input / output / task_type を持つレコードのリスト
+        detector: 判定に使う NearDuplicateDetector
+        mode: drop なら代表だけを残し、weight なら代表にまとめた件数を weight として付ける
+            （既に weight を持つレコードはその値を足し合わせる）
+
+    Returns:
+        (代表のレコードのリスト（元の順序）, 除いた件数)
+    """
+    if mode == DEDUP_OFF:
+        return records, 0
+
+    representatives: List[Hashable] = []
+    weights: Dict[Hashable, int] = {}
+    for i, record in enumerate(records):
+        representative = detector.assign(i, record["input"], record["output"], record.get("task_type") or "")
+        representatives.append(representative)
+        weights[representative] = weights.get(representative, 0) + record.get("weight", 1)
+
+    kept = []
+    for i, record in enumerate(records):
+        if representatives[i] != i:
+            continue
+        if mode == DEDUP_WEIGHT:
+            record = dict(record, weight=weights[i])
+        kept.append(record)
+    return kept, len(records) - len(kept)
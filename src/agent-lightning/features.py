@@ -0,0 +1,132 @@
+"""
+Response Features for LINE Calendar Bot
+応答テキストから報酬計算と応答分析に使う特徴量を取り出す
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+# 報酬計算と応答分析で共通のキーワード
+SUCCESS_KEYWORDS = ["完了", "登録", "作成", "設定", "追加", "削除"]
+ERROR_KEYWORDS = ["エラー", "失敗", "できません", "見つかりません"]
+EMOJI_CHARS = ["✅", "📅", "⏰", "📝", "🔔", "👍"]
+
+# バッチ内の応答を連結するときの区切り文字（どのキーワードにも含まれない）
+_SEPARATOR = "\x00"
+
+
+def keyword_pattern(keywords: Sequence[str]) -> "re.Pattern[str]":
+    """キーワード群を1つの正規表現にまとめる（長いものを優先）"""
+    return re.compile("|".join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)))
+
+
+def _batch_pattern(keywords: Sequence[str]) -> "re.Pattern[str]":
+    """
+    連結テキスト用の正規表現
+
+    最初のヒットから区切り文字までを読み飛ばすので、1つの応答に
+    つきヒットは高々1回になる。
+    """
+    return re.compile(f"(?:{keyword_pattern(keywords).pattern})[^{_SEPARATOR}]*")
+
+
+# 正規表現はインポート時に1回だけコンパイルする。
+# キーワード群ごとに別の正規表現にしているのは、re がリテラルの先頭文字で
+# 候補位置を絞り込めるため。全キーワードを1つの選択にまとめると、絞り込みが
+# 効かず3回検索するより遅くなる。
+SUCCESS_PATTERN = keyword_pattern(SUCCESS_KEYWORDS)
+ERROR_PATTERN = keyword_pattern(ERROR_KEYWORDS)
+EMOJI_PATTERN = keyword_pattern(EMOJI_CHARS)
+
+_SUCCESS_BATCH = _batch_pattern(SUCCESS_KEYWORDS)
+_ERROR_BATCH = _batch_pattern(ERROR_KEYWORDS)
+_EMOJI_BATCH = _batch_pattern(EMOJI_CHARS)
+
+
+@dataclass(frozen=True, slots=True)
+class ResponseFeatures:
+    """1件の応答の特徴量"""
+    length: int
+    blank: bool  # 空または空白のみ
+    has_success: bool
+    has_error: bool
+    has_emoji: bool
+
+
+@dataclass(frozen=True)
+class BatchFeatures:
+    """応答のリストの特徴量（各フィールドは応答と同じ順序の配列）"""
+    length: np.ndarray
+    blank: np.ndarray
+    has_success: np.ndarray
+    has_error: np.ndarray
+    has_emoji: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.length)
+
+    def __getitem__(self, i: int) -> ResponseFeatures:
+        return ResponseFeatures(
+            length=int(self.length[i]),
+            blank=bool(self.blank[i]),
+            has_success=bool(self.has_success[i]),
+            has_error=bool(self.has_error[i]),
+            has_emoji=bool(self.has_emoji[i]),
+        )
+
+
+def extract_features(text: Optional[str]) -> ResponseFeatures:
+    """
+    応答1件の特徴量を取り出す
+
+    各キーワード群の検索は最初のヒットで止まる。
+    """
+    text = text or ""
+    return ResponseFeatures(
+        length=len(text),
+        blank=not text.strip(),
+        has_success=SUCCESS_PATTERN.search(text) is not None,
+        has_error=ERROR_PATTERN.search(text) is not None,
+        has_emoji=EMOJI_PATTERN.search(text) is not None,
+    )
+
+
+def _presence(pattern: "re.Pattern[str]", text: str, starts: np.ndarray, n: int) -> np.ndarray:
+    """連結テキスト中のヒット位置を応答ごとの有無に変換"""
+    positions = np.fromiter((m.start() for m in pattern.finditer(text)), dtype=np.int64)
+    present = np.zeros(n, dtype=bool)
+    if positions.size:
+        present[np.searchsorted(starts, positions, side="right") - 1] = True
+    return present
+
+
+def extract_batch_features(responses: Sequence[Optional[str]]) -> BatchFeatures:
+    """
+    応答のリストの特徴量をまとめて取り出す
+
+    応答を区切り文字で連結した1本の文字列に対してキーワード群ごとの
+    正規表現を1回ずつ走らせ、ヒット位置から応答のインデックスを求める。
+    正規表現は応答内の最初のヒットで残りを読み飛ばすので、ヒット数は
+    応答数を超えない。結果は extract_features を1件ずつ呼んだものと一致する。
+    """
+    texts = [r or "" for r in responses]
+    n = len(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    starts = np.zeros(n, dtype=np.int64)
+    if n > 1:
+        np.cumsum(lengths[:-1] + len(_SEPARATOR), out=starts[1:])
+    joined = _SEPARATOR.join(texts)
+
+    # 空白のみの応答（str.strip() で空になるものと同じ）
+    blank = (lengths == 0) | np.fromiter(map(str.isspace, texts), dtype=bool, count=n)
+
+    return BatchFeatures(
+        length=lengths,
+        blank=blank,
+        has_success=_presence(_SUCCESS_BATCH, joined, starts, n),
+        has_error=_presence(_ERROR_BATCH, joined, starts, n),
+        has_emoji=_presence(_EMOJI_BATCH, joined, starts, n),
+    )
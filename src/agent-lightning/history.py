@@ -0,0 +1,201 @@
+"""
+Optimization History
+最適化結果ごとの要約を index.jsonl に追記し、履歴をページ単位で返す
+"""
+
+import json
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from storage import FileLock, file_signature
+
+# 履歴を並べ替えられるキー
+HISTORY_SORT_KEYS = ("start_time", "end_time", "best_reward", "avg_final_reward", "num_samples")
+
+# 要約に含める結果のキー（rewards などの大きな値は含めない）
+SUMMARY_FIELDS = (
+    "start_time",
+    "end_time",
+    "num_samples",
+    "num_iterations",
+    "scored_samples",
+    "cached_samples",
+    "duplicate_samples",
+    "incremental",
+    "delta_samples",
+    "best_reward",
+    "avg_final_reward",
+    "cancelled",
+)
+
+RUN_ID_PATTERN = re.compile(r"^[0-9A-Za-z_]+$")
+
+
+def _finite_or_none(constant: str) -> None:
+    """
+    以前のバージョンが書いた -Infinity / Infinity / NaN を None として読む
+
+    イテレーション前にキャンセルされた実行の best_reward が -Infinity として
+    保存されていた。そのまま返すと API のレスポンスが不正な JSON になる。
+    """
+    return None
+
+
+def new_run_id() -> str:
+    """同じ秒に複数の最適化が終わっても重ならない実行ID"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+
+
+def summarize_results(run_id: str, results: Dict[str, Any]) -> Dict[str, Any]:
+    """最適化結果から履歴の1行分の要約を作る"""
+    summary: Dict[str, Any] = {"run_id": run_id}
+    for key in SUMMARY_FIELDS:
+        if key in results:
+            summary[key] = results[key]
+    summary["cancelled"] = bool(results.get("cancelled"))
+    profile = results.get("profile")
+    if profile:
+        # 関数ごとの内訳は詳細でだけ返す
+        summary["profile"] = {key: value for key, value in profile.items() if key != "top_functions"}
+    return summary
+
+
+class OptimizationHistory:
+    """
+    最適化履歴
+
+    結果は optimization_results/result_<run_id>.json に1件ずつ保存し、
+    要約を index.jsonl に追記する。一覧は索引だけを読み、報酬の推移を含む
+    詳細は get() で個別に読み込む。索引は追記された分だけを読み足して
+    メモリ上に保持する。index.jsonl が無い場合は既存の結果ファイルから作り直す。
+    """
+
+    def __init__(self, results_dir: Path):
+        self.results_dir = Path(results_dir)
+        self.index_file = self.results_dir / "index.jsonl"
+        self._file_lock = FileLock(self.results_dir / "index.lock")
+        self._lock = threading.Lock()
+        self._rows: List[Dict[str, Any]] = []
+        self._offset = 0
+        self._inode: Optional[int] = None
+
+    def result_file(self, run_id: str) -> Path:
+        return self.results_dir / f"result_{run_id}.json"
+
+    def save(self, run_id: str, results: Dict[str, Any]) -> Path:
+        """結果ファイルを書き込み、要約を索引に追記"""
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        path = self.result_file(run_id)
+        line = json.dumps(summarize_results(run_id, results), ensure_ascii=False) + "\n"
+        with self._file_lock:
+            # 索引を作り直す場合に、この結果が二重に載らないよう先に作っておく
+            self._ensure_index()
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            with open(self.index_file, "a", encoding="utf-8") as f:
+                f.write(line)
+        return path
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """報酬の推移を含む結果全体（見つからなければ None）"""
+        if not RUN_ID_PATTERN.match(run_id):
+            return None
+        path = self.result_file(run_id)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f, parse_constant=_finite_or_none)
+        results.setdefault("run_id", run_id)
+        return results
+
+    def page(
+        self,
+        sort_by: str = "start_time",
+        descending: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        要約をページ単位で取得
+
+        Args:
+            sort_by: 並べ替えのキー (HISTORY_SORT_KEYS)
+            descending: True なら降順
+            offset: 先頭から読み飛ばす件数
+            limit: 最大件数（None なら全件）
+
+        Returns:
+            history（要約のリスト）, total_runs, next_offset（続きが無ければ None）を含む辞書
+
+        Raises:
+            ValueError: sort_by が不正な場合
+        """
+        if sort_by not in HISTORY_SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort_by} (expected one of {', '.join(HISTORY_SORT_KEYS)})")
+
+        rows = self._load()
+        # 値の無い行は昇順・降順どちらでも末尾に置く
+        present = [row for row in rows if row.get(sort_by) is not None]
+        missing = [row for row in rows if row.get(sort_by) is None]
+        present.sort(key=lambda row: (row[sort_by], row["run_id"]), reverse=descending)
+        rows = present + missing
+
+        end = len(rows) if limit is None else offset + limit
+        return {
+            "history": rows[offset:end],
+            "total_runs": len(rows),
+            "next_offset": end if end < len(rows) else None,
+        }
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """索引を読み込み済みの位置から読み足す"""
+        with self._lock:
+            signature = file_signature(self.index_file)
+            if signature is None:
+                if not any(self.results_dir.glob("result_*.json")):
+                    return []
+                with self._file_lock:
+                    self._ensure_index()
+                signature = file_signature(self.index_file)
+
+            if signature[0] != self._inode or signature[2] < self._offset:
+                self._rows, self._offset, self._inode = [], 0, signature[0]
+            if signature[2] > self._offset:
+                with open(self.index_file, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read()
+                # 書き込み途中の行は次回に回す
+                data = data[:data.rfind(b"\n") + 1]
+                self._offset += len(data)
+                self._rows.extend(
+                    json.loads(line, parse_constant=_finite_or_none) for line in data.splitlines() if line.strip()
+                )
+            return list(self._rows)
+
+    def _ensure_index(self):
+        """索引が無ければ既存の結果ファイルから作る（_file_lock 内で呼び出す）"""
+        if self.index_file.exists():
+            return
+
+        lines = []
+        for path in sorted(self.results_dir.glob("result_*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    results = json.load(f, parse_constant=_finite_or_none)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Skipping unreadable result file {path.name}: {e}")
+                continue
+            run_id = results.get("run_id") or path.stem[len("result_"):]
+            lines.append(json.dumps(summarize_results(run_id, results), ensure_ascii=False) + "\n")
+
+        tmp_file = self.index_file.with_suffix(".jsonl.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_file, self.index_file)
+        if lines:
+            print(f"Built optimization history index from {len(lines)} result files")
@@ -141,7 +141,8 @@ export async function triggerOptimization() {
   });
 
   if (result) {
-    console.log('[AgentLightning] Optimization completed:', result);
+    // 最適化はバックグラウンドで実行される（進捗は getOptimizationJob で確認）
+    console.log('[AgentLightning] Optimization job submitted:', result.job_id);
     return result;
   }
 
@@ -0,0 +1,413 @@
+"""
+Optimization Jobs for LINE Calendar Bot
+最適化をバックグラウンドで実行し、進捗を問い合わせられるようにする
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import AgentLightningConfig
+from metrics import JOB_DURATION_SECONDS
+from storage import FileLock
+
+# ジョブの状態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+NO_TRAINING_DATA = "No training data available"
+WORKER_EXITED = "Worker process exited before the job finished"
+
+# 実行中のジョブの進捗を共有ストアに書き込み、他のワーカーからのキャンセルを確認する間隔（秒）
+JOB_SYNC_INTERVAL = 0.5
+
+# このプロセスの識別子。コンテナやワーカーの再起動後は同じ pid（コンテナでは
+# 1 など）が使われることが多いので、pid が同じでも識別子が違うジョブは以前の
+# プロセスのものとして扱う。fork した子プロセスでは作り直す。
+_worker_token = uuid.uuid4().hex
+
+
+def _reset_worker_token():
+    global _worker_token
+    _worker_token = uuid.uuid4().hex
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_worker_token)
+
+
+class JobQueueFull(Exception):
+    """実行待ちのジョブが上限に達している"""
+
+
+@dataclass
+class OptimizationJob:
+    """最適化ジョブ"""
+    id: str
+    num_iterations: int
+    min_reward: Optional[float]
+    profile: Optional[str] = None
+    full_recompute: bool = False
+    status: str = JOB_QUEUED
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    iteration: int = 0
+    avg_reward: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    done_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    # 所要時間の計測用（time.monotonic の値）
+    started_monotonic: Optional[float] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """API レスポンス用の辞書に変換"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "num_iterations": self.num_iterations,
+            "min_reward": self.min_reward,
+            "profile": self.profile,
+            "full_recompute": self.full_recompute,
+            "iteration": self.iteration,
+            "progress": self.iteration / self.num_iterations if self.num_iterations else 1.0,
+            "avg_reward": self.avg_reward,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OptimizationJob":
+        """to_dict の出力（共有ストアに保存した状態）から復元"""
+        names = {f.name for f in fields(cls) if f.repr}
+        job = cls(id=data["job_id"], **{key: value for key, value in data.items() if key in names and key != "id"})
+        if job.finished:
+            job.done_event.set()
+        return job
+
+
+class JobStore:
+    """
+    optimization_results/jobs.json にジョブの状態を保存し、ワーカープロセス間で共有する
+
+    ジョブは投入を受けたワーカーで実行し、そのワーカーが状態を書き込む。
+    他のワーカーはここからジョブを読み、キャンセルは cancel_requested を
+    立てて実行中のワーカーに伝える。各ジョブには実行するワーカーの pid・
+    起動時刻・プロセスの識別子を記録し、終了せずにワーカーが居なくなった
+    （pid が別のプロセスに再利用された場合を含む）ジョブは失敗として扱う。
+    """
+
+    def __init__(self, results_dir: Path):
+        self.results_dir = Path(results_dir)
+        self.path = self.results_dir / "jobs.json"
+        self._file_lock = FileLock(self.results_dir / "jobs.lock")
+
+    def add(self, job: OptimizationJob, max_active: int, max_history: int) -> bool:
+        """
+        ジョブを追加
+
+        Args:
+            max_active: 全ワーカーを通じた実行中・実行待ちのジョブの上限
+            max_history: 残す終了済みジョブの数
+
+        Returns:
+            追加したか（上限に達していた場合は False）
+        """
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        with self._file_lock:
+            records = self._read()
+            active = sum(1 for record in records.values() if record["status"] not in FINISHED_STATES)
+            if active >= max_active:
+                return False
+            records[job.id] = dict(
+                job.to_dict(),
+                worker_pid=os.getpid(),
+                worker_started=_process_start_time(os.getpid()),
+                worker_token=_worker_token,
+                cancel_requested=False,
+            )
+
+            finished = [job_id for job_id, record in records.items() if record["status"] in FINISHED_STATES]
+            for job_id in finished[:max(0, len(finished) - max_history)]:
+                del records[job_id]
+            self._write(records)
+        return True
+
+    def update(self, job: OptimizationJob) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を書き込み、保存されている記録（cancel_requested を含む）を返す"""
+        return self._modify(job.id, lambda record: record.update(job.to_dict()))
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """キャンセルを要求（終了済みなら何もしない）"""
+        def request(record: Dict[str, Any]):
+            if record["status"] not in FINISHED_STATES:
+                record["cancel_requested"] = True
+
+        return self._modify(job_id, request)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._read().get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """古い順にジョブの記録を返す"""
+        return list(self._read().values())
+
+    def _modify(self, job_id: str, change: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        with self._file_lock:
+            records = self._read()
+            record = records.get(job_id)
+            if record is None:
+                return None
+            change(record)
+            self._write(records)
+            return record
+
+    def _read(self) -> "OrderedDict[str, Dict[str, Any]]":
+        if not self.path.exists():
+            return OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Failed to load optimization jobs: {e}")
+            return OrderedDict()
+
+        for record in records.values():
+            if record["status"] not in FINISHED_STATES and not _worker_alive(record):
+                record["status"] = JOB_FAILED
+                record["error"] = WORKER_EXITED
+        return records
+
+    def _write(self, records: Dict[str, Dict[str, Any]]):
+        """ファイルに書き込む（_file_lock 内で呼び出す）"""
+        tmp_file = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_file, self.path)
+
+
+class OptimizationJobManager:
+    """
+    最適化ジョブの実行管理
+
+    ジョブはスレッドプールで実行し、同時実行数はワーカーごとに
+    max_concurrent_jobs、実行中・実行待ちの数は全ワーカーを通じて
+    max_concurrent_jobs + max_queued_jobs で制限する。状態は JobStore で
+    共有するので、どのワーカーからでも取得・キャンセルできる。
+    """
+
+    def __init__(self, optimizer, collector, config: Optional[AgentLightningConfig] = None):
+        self.config = config or AgentLightningConfig.from_env()
+        self.optimizer = optimizer
+        self.collector = collector
+        self.store = JobStore(optimizer.results_dir)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.max_concurrent_jobs,
+            thread_name_prefix="agl-job",
+        )
+        # このワーカーで実行するジョブ
+        self._jobs: "OrderedDict[str, OptimizationJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        num_iterations: int = 100,
+        min_reward: Optional[float] = None,
+        profile: Optional[str] = None,
+        full_recompute: bool = False,
+    ) -> OptimizationJob:
+        """
+        最適化ジョブを投入
+
+        Args:
+            profile: プロファイリングのモード（省略時は設定値）
+            full_recompute: True ならチェックポイントを使わずに全件を処理
+
+        Raises:
+            JobQueueFull: 実行中・実行待ちのジョブが上限に達している場合
+        """
+        job = OptimizationJob(
+            id=uuid.uuid4().hex,
+            num_iterations=num_iterations,
+            min_reward=min_reward,
+            profile=profile,
+            full_recompute=full_recompute,
+        )
+        limit = self.config.max_concurrent_jobs + self.config.max_queued_jobs
+        with self._lock:
+            if not self.store.add(job, limit, self.config.max_job_history):
+                raise JobQueueFull(f"Too many optimization jobs in progress ({limit})")
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[OptimizationJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = self.store.get(job_id)
+        return OptimizationJob.from_dict(record) if record is not None else None
+
+    def list(self) -> List[OptimizationJob]:
+        """新しい順にジョブを返す（このワーカーのジョブは最新の進捗で返す）"""
+        with self._lock:
+            local = dict(self._jobs)
+        return [
+            local.get(record["job_id"]) or OptimizationJob.from_dict(record)
+            for record in reversed(self.store.list())
+        ]
+
+    def cancel(self, job_id: str) -> Optional[OptimizationJob]:
+        """
+        ジョブをキャンセル
+
+        実行待ちのジョブは開始されず、実行中のジョブは次のイテレーションの
+        区切りで停止する。他のワーカーのジョブは、そのワーカーが次に
+        状態を同期したときに停止する。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            if not job.finished:
+                job.cancel_event.set()
+                self.store.request_cancel(job_id)
+            return job
+        record = self.store.request_cancel(job_id)
+        return OptimizationJob.from_dict(record) if record is not None else None
+
+    def _prune(self):
+        """終了済みジョブを max_job_history 件まで残して削除（ロック内で呼び出す）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.config.max_job_history)]:
+            del self._jobs[job_id]
+
+    def _sync(self, job: OptimizationJob):
+        """状態を共有ストアに書き込み、他のワーカーからのキャンセル要求を反映"""
+        record = self.store.update(job)
+        if record is not None and record.get("cancel_requested"):
+            job.cancel_event.set()
+
+    def _finish(self, job: OptimizationJob, status: str):
+        job.status = status
+        job.finished_at = datetime.now().isoformat()
+        if job.started_monotonic is not None:
+            JOB_DURATION_SECONDS.observe(time.monotonic() - job.started_monotonic, status=status)
+        self.store.update(job)
+        job.done_event.set()
+
+    def _run(self, job: OptimizationJob):
+        record = self.store.get(job.id)
+        if job.cancel_event.is_set() or (record is not None and record.get("cancel_requested")):
+            self._finish(job, JOB_CANCELLED)
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now().isoformat()
+        job.started_monotonic = time.monotonic()
+        self._sync(job)
+        last_sync = time.monotonic()
+
+        def on_progress(iteration: int, avg_reward: float):
+            nonlocal last_sync
+            job.iteration = iteration + 1
+            job.avg_reward = avg_reward
+            if time.monotonic() - last_sync >= JOB_SYNC_INTERVAL:
+                self._sync(job)
+                last_sync = time.monotonic()
+
+        try:
+            results = self.optimizer.run_incremental_optimization(
+                self.collector,
+                min_reward=job.min_reward,
+                full_recompute=job.full_recompute,
+                num_iterations=job.num_iterations,
+                callback=on_progress,
+                cancel_event=job.cancel_event,
+                profile=job.profile,
+            )
+            if results is None:
+                job.error = NO_TRAINING_DATA
+                self._finish(job, JOB_FAILED)
+                return
+
+            job.result = {
+                "run_id": results["run_id"],
+                "num_samples": results["num_samples"],
+                "delta_samples": results["delta_samples"],
+                "duplicate_samples": results["duplicate_samples"],
+                "incremental": results["incremental"],
+                "best_reward": results["best_reward"],
+                "avg_final_reward": results["avg_final_reward"],
+                "start_time": results["start_time"],
+                "end_time": results["end_time"],
+            }
+            if "profile" in results:
+                job.result["profile"] = results["profile"]
+            self._finish(job, JOB_CANCELLED if results.get("cancelled") else JOB_COMPLETED)
+        except Exception as e:
+            print(f"Warning: Optimization job {job.id} failed: {e}")
+            job.error = str(e)
+            self._finish(job, JOB_FAILED)
+
+
+def _worker_alive(record: Dict[str, Any]) -> bool:
+    """ジョブを実行するワーカーがまだ動いているか"""
+    pid = record.get("worker_pid")
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return record.get("worker_token") == _worker_token
+    if not _pid_alive(pid):
+        return False
+    # 起動時刻が違えば、pid が別のプロセスに再利用されている
+    started = record.get("worker_started")
+    current = _process_start_time(pid)
+    return started is None or current is None or started == current
+
+
+def _process_start_time(pid: int) -> Optional[str]:
+    """プロセスの起動時刻（/proc/<pid>/stat の starttime。取得できなければ None）"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # プロセス名 (comm) は空白や括弧を含みうるので、最後の ')' より後ろを数える
+    return stat[stat.rindex(b")") + 2:].split()[19].decode()
+
+
+def _pid_alive(pid: int) -> bool:
+    """同じホストのプロセスが生きているか"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
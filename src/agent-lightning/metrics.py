@@ -0,0 +1,256 @@
+"""
+In-process Metrics
+Prometheus のテキスト形式で出力できる軽量なカウンター・ヒストグラム・ゲージ
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# レイテンシ用の既定のバケット（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """メトリクスの共通部分（名前・説明・ラベル名）"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """単調増加するカウンター"""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """
+    値の分布を固定バケットで数えるヒストグラム
+
+    observe はバケットを二分探索して1つだけ加算する（累積は出力時に計算）。
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(name, help, labels, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル -> (バケットごとの件数 + 上限超え, 合計, 件数)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """with ブロックの所要時間（秒）を記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+class Gauge(Metric):
+    """
+    現在値を表すゲージ
+
+    set で値を設定するか、set_function で出力時に値を取得する関数を登録する。
+    関数はラベルなしなら数値を、ラベルありなら {ラベル値のタプル: 数値} を返す。
+    """
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], object]] = None
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], object]):
+        self._function = function
+
+    def samples(self) -> Iterator[str]:
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                print(f"Warning: Failed to collect metric {self.name}: {e}")
+                return
+            values = result.items() if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Registry:
+    """メトリクスの登録先"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式 (version 0.0.4) で出力"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# 既定の登録先
+REGISTRY = Registry()
+
+
+# アプリケーションのメトリクス
+
+# 報酬値の分布用のバケット (-1.0 ~ 1.0)
+REWARD_BUCKETS = (-1.0, -0.75, -0.5, -0.25, 0.0, 0.25, 0.5, 0.75, 1.0)
+
+# 最適化ジョブの所要時間用のバケット（秒）
+JOB_DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+HTTP_REQUESTS = Counter(
+    "agl_http_requests_total",
+    "HTTP requests by route, method and status code.",
+    labels=("route", "method", "status"),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "agl_http_request_duration_seconds",
+    "HTTP request latency by route and method.",
+    labels=("route", "method"),
+)
+DISK_WRITE_SECONDS = Histogram(
+    "agl_disk_write_duration_seconds",
+    "Latency of collector disk writes (including fsync) by operation.",
+    labels=("backend", "operation"),
+)
+JOB_DURATION_SECONDS = Histogram(
+    "agl_optimization_job_duration_seconds",
+    "Duration of optimization jobs by final status.",
+    labels=("status",),
+    buckets=JOB_DURATION_BUCKETS,
+)
+REWARDS = Histogram(
+    "agl_reward",
+    "Distribution of reward values by source (record, feedback, analyze).",
+    labels=("source",),
+    buckets=REWARD_BUCKETS,
+)
+COLLECTOR_INTERACTIONS = Gauge(
+    "agl_collector_interactions",
+    "Number of stored interactions.",
+)
+COLLECTOR_WINDOW_INTERACTIONS = Gauge(
+    "agl_collector_window_interactions",
+    "Number of interactions held in memory.",
+)
+COLLECTOR_MEMORY_BYTES = Gauge(
+    "agl_collector_memory_bytes",
+    "Estimated memory used by the in-memory interaction window.",
+)
+COLLECTOR_DISK_BYTES = Gauge(
+    "agl_collector_disk_bytes",
+    "Size of collector data files on disk by kind.",
+    labels=("kind",),
+)
+ANALYZE_CACHE_REQUESTS = Counter(
+    "agl_analyze_cache_requests_total",
+    "Response analysis cache lookups by result (hit, miss).",
+    labels=("result",),
+)
+ANALYZE_CACHE_ENTRIES = Gauge(
+    "agl_analyze_cache_entries",
+    "Number of analyses held in the response analysis cache.",
+)
+TELEMETRY_EVENTS = Gauge(
+    "agl_telemetry_events",
+    "Agent Lightning emission queue counters (queued, sent, dropped, ...).",
+    labels=("counter",),
+)
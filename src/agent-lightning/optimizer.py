@@ -3,42 +3,56 @@ Agent Optimizer using Agent Lightning
 LINE Calendar Bot の応答を強化学習で最適化
 """
 
+import hashlib
 import json
+import multiprocessing
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Callable
+from typing import Any, Dict, List, Optional, Callable, Tuple
 import agentlightning as agl
 
+from checkpoint import CHECKPOINT_FORMAT, CheckpointStore, OptimizationCheckpoint
 from config import AgentLightningConfig, PROMPT_TEMPLATES
+from dedup import DEDUP_OFF, NearDuplicateDetector, deduplicate, normalize_dedup_mode
+from history import OptimizationHistory, new_run_id
+from profiling import OptimizationProfiler, normalize_profile_mode
+from prompts import get_prompt_store
+from scoring import BatchRewardScorer, score_in_parallel, score_response
+from telemetry import get_emitter
+
+# 報酬関数のロジックを変更したら上げる（永続化した報酬キャッシュを無効化）
+REWARD_FN_VERSION = 1
+
+
+def sample_key(user_input: str, bot_output: str, task_type: Optional[str]) -> str:
+    """報酬キャッシュ用にサンプルの内容からハッシュキーを作る"""
+    content = "\x00".join([task_type or "", user_input, bot_output])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
 class LineCalendarAgent:
     """
     LINE Calendar Bot のエージェント
     Agent Lightning で最適化可能なラッパー
+
+    最適化済みプロンプトはデータディレクトリごとに共有する PromptStore から
+    引くので、同じプロセス内の他のインスタンスや他のワーカーが更新した
+    プロンプトも再起動せずに反映される。
     """
 
     def __init__(self, config: Optional[AgentLightningConfig] = None):
         self.config = config or AgentLightningConfig.from_env()
         self.system_prompt = PROMPT_TEMPLATES["system"]
-        self.optimized_prompts: Dict[str, str] = {}
-        self._load_optimized_prompts()
-
-    def _load_optimized_prompts(self):
-        """最適化済みプロンプトを読み込む"""
-        prompt_file = Path(self.config.data_dir) / "optimized_prompts.json"
-        if prompt_file.exists():
-            with open(prompt_file, "r", encoding="utf-8") as f:
-                self.optimized_prompts = json.load(f)
-            print(f"Loaded {len(self.optimized_prompts)} optimized prompts")
-
-    def _save_optimized_prompts(self):
-        """最適化済みプロンプトを保存"""
-        prompt_file = Path(self.config.data_dir) / "optimized_prompts.json"
-        prompt_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(prompt_file, "w", encoding="utf-8") as f:
-            json.dump(self.optimized_prompts, f, ensure_ascii=False, indent=2)
+        self.prompt_store = get_prompt_store(self.config)
+
+    @property
+    def optimized_prompts(self) -> Dict[str, str]:
+        """task_type -> 最適化済みプロンプト"""
+        return self.prompt_store.prompts()
 
     def get_system_prompt(self, task_type: Optional[str] = None) -> str:
         """
@@ -51,14 +65,12 @@ class LineCalendarAgent:
         Returns:
             システムプロンプト
         """
-        if task_type and task_type in self.optimized_prompts:
-            return self.optimized_prompts[task_type]
-        return self.system_prompt
+        prompt, optimized, _ = self.prompt_store.get(task_type)
+        return prompt if optimized else self.system_prompt
 
     def update_optimized_prompt(self, task_type: str, prompt: str):
         """最適化されたプロンプトを更新"""
-        self.optimized_prompts[task_type] = prompt
-        self._save_optimized_prompts()
+        self.prompt_store.update(task_type, prompt)
 
 
 class AgentOptimizer:
@@ -70,21 +82,40 @@ class AgentOptimizer:
         self.config = config or AgentLightningConfig.from_env()
         self.agent = LineCalendarAgent(config)
         self.training_history: List[Dict[str, Any]] = []
+        self.results_dir = Path(self.config.data_dir) / "optimization_results"
+        self.history = OptimizationHistory(self.results_dir)
+        self.checkpoints = CheckpointStore(self.results_dir)
+        self.reward_cache_file = self.results_dir / "reward_cache.json"
+        # 内容ハッシュ -> 報酬（最近使った順、同時に実行されるジョブで共有）
+        self._reward_cache: "Optional[OrderedDict[str, float]]" = None
+        self._reward_cache_lock = threading.Lock()
+        self.emitter = get_emitter(self.config)
+        self._scoring_executor: Optional[ProcessPoolExecutor] = None
+        self._scoring_executor_lock = threading.Lock()
 
     def prepare_training_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Agent Lightning用のトレーニングデータを準備
 
+        dedup_mode が off 以外なら、ほぼ同じインタラクションを代表の1件にまとめる
+        （weight では代表にまとめた件数を weight として付ける）。
+
         Args:
             data: collector.get_training_data() の出力
 
         Returns:
             Agent Lightning用にフォーマットされたデータ
         """
+        dedup = normalize_dedup_mode(self.config.dedup_mode)
+        if dedup != DEDUP_OFF:
+            data, duplicates = deduplicate(data, NearDuplicateDetector.from_config(self.config), dedup)
+            if duplicates:
+                print(f"Merged {duplicates} near-duplicate samples ({dedup})")
+
         formatted_data = []
 
         for item in data:
-            formatted_data.append({
+            sample = {
                 "messages": [
                     {"role": "system", "content": self.agent.get_system_prompt(item.get("task_type"))},
                     {"role": "user", "content": item["input"]},
@@ -92,7 +123,10 @@ class AgentOptimizer:
                 ],
                 "reward": item.get("reward", 0.0),
                 "task_type": item.get("task_type", "general"),
-            })
+            }
+            if "weight" in item:
+                sample["weight"] = item["weight"]
+            formatted_data.append(sample)
 
         return formatted_data
 
@@ -104,59 +138,159 @@ class AgentOptimizer:
             報酬を計算する関数
         """
         def reward_fn(user_input: str, bot_output: str, context: Dict[str, Any]) -> float:
-            """
-            応答の品質に基づいて報酬を計算
-
-            評価基準:
-            - 日本語の自然さ
-            - タスク完了度
-            - 応答の簡潔さ
-            - エラーハンドリング
-            """
-            reward = 0.0
-
-            # 基本的な応答チェック
-            if not bot_output or len(bot_output.strip()) == 0:
-                return self.config.failure_reward
-
-            # 成功キーワードチェック
-            success_keywords = ["完了", "登録", "作成", "設定", "追加", "削除"]
-            if any(kw in bot_output for kw in success_keywords):
-                reward += 0.3
-
-            # エラー応答チェック
-            error_keywords = ["エラー", "失敗", "できません", "見つかりません"]
-            if any(kw in bot_output for kw in error_keywords):
-                # エラーでも適切に説明していれば部分点
-                if len(bot_output) > 20:
-                    reward += 0.1
-                else:
-                    reward -= 0.2
+            """応答の品質に基づいて報酬を計算（scoring.score_response を参照）"""
+            return score_response(bot_output, self.config.success_reward, self.config.failure_reward)
+
+        return reward_fn
+
+    def create_batch_scorer(self) -> BatchRewardScorer:
+        """
+        報酬関数のバッチ版を作成
 
-            # 応答の長さチェック（適切な長さを評価）
-            output_len = len(bot_output)
-            if 10 <= output_len <= 200:
-                reward += 0.2
-            elif output_len > 500:
-                reward -= 0.1  # 長すぎる応答
+        Returns:
+            応答のリストをまとめて採点するスコアラー（reward_fn と同じ値を返す）
+        """
+        return BatchRewardScorer(self.config.success_reward, self.config.failure_reward)
 
-            # 絵文字使用（親しみやすさ）
-            emoji_chars = ["✅", "📅", "⏰", "📝", "🔔", "👍"]
-            if any(e in bot_output for e in emoji_chars):
-                reward += 0.1
+    def _reward_fingerprint(self) -> str:
+        """報酬関数の設定が変わったらキャッシュを無効にするための識別子"""
+        settings = [REWARD_FN_VERSION, self.config.success_reward, self.config.failure_reward]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
 
-            # 正規化
-            reward = max(min(reward, self.config.success_reward), self.config.failure_reward)
+    def _checkpoint_fingerprint(self) -> str:
+        """
+        チェックポイントの累計が使えるかを判定する識別子
 
-            return reward
+        報酬関数と重複除去の設定に加え、ウォーターマークの形式と保存先
+        （コミット順の位置の意味が保存先ごとに違う）を含む。
+        """
+        settings = [
+            CHECKPOINT_FORMAT,
+            self.config.storage,
+            self._reward_fingerprint(),
+            normalize_dedup_mode(self.config.dedup_mode),
+            self.config.dedup_threshold,
+            self.config.dedup_num_perm,
+            self.config.dedup_ngram,
+        ]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+    def _load_reward_cache(self) -> "OrderedDict[str, float]":
+        """永続化された報酬キャッシュを読み込む（_reward_cache_lock 内で呼び出す）"""
+        if self._reward_cache is not None:
+            return self._reward_cache
+
+        self._reward_cache = OrderedDict()
+        if self.reward_cache_file.exists():
+            try:
+                with open(self.reward_cache_file, "r", encoding="utf-8") as f:
+                    cache = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Failed to load reward cache: {e}")
+                return self._reward_cache
+            if cache.get("fingerprint") == self._reward_fingerprint():
+                self._reward_cache.update(cache["rewards"])
+                print(f"Loaded {len(self._reward_cache)} cached rewards")
+        return self._reward_cache
+
+    def _save_reward_cache(self):
+        """
+        報酬キャッシュを optimization_results に保存（_reward_cache_lock 内で呼び出す）
 
-        return reward_fn
+        ワーカープロセスごとに別の一時ファイルに書いてから置き換えるので、
+        同時に保存しても壊れたファイルは残らない（最後に保存したものが残る）。
+        """
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.reward_cache_file.with_name(f"{self.reward_cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self._reward_fingerprint(),
+                "rewards": self._reward_cache,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, self.reward_cache_file)
+
+    def score_samples(self, formatted_data: List[Dict[str, Any]]) -> Tuple[List[float], int]:
+        """
+        サンプルごとの報酬を計算（内容ハッシュでキャッシュ）
+
+        同じ内容のサンプルは1回だけ採点し、キャッシュに無い新規・変更
+        サンプルだけをバッチスコアラーでまとめて評価する。キャッシュは
+        最近使った順に reward_cache_size 件まで保持する。同時に実行される
+        ジョブと共有するので、参照・更新は _reward_cache_lock の中で行い、
+        採点自体はロックの外で行う。
+
+        Returns:
+            (formatted_data と同じ順序の報酬リスト, 新たに採点した件数)
+        """
+        keys = [
+            sample_key(item["messages"][1]["content"], item["messages"][2]["content"], item.get("task_type"))
+            for item in formatted_data
+        ]
+
+        rewards: Dict[str, float] = {}
+        missing: Dict[str, str] = {}
+        with self._reward_cache_lock:
+            cache = self._load_reward_cache()
+            for key, item in zip(keys, formatted_data):
+                if key in rewards or key in missing:
+                    continue
+                if key in cache:
+                    rewards[key] = cache[key]
+                    cache.move_to_end(key)
+                else:
+                    missing[key] = item["messages"][2]["content"]
+
+        if missing:
+            scores = self._score_responses(list(missing.values()))
+            rewards.update(zip(missing.keys(), scores.tolist()))
+            with self._reward_cache_lock:
+                for key in missing:
+                    cache[key] = rewards[key]
+                    cache.move_to_end(key)
+                while len(cache) > self.config.reward_cache_size:
+                    cache.popitem(last=False)
+                self._save_reward_cache()
+
+        return [rewards[key] for key in keys], len(missing)
+
+    def _score_responses(self, responses: List[str]):
+        """
+        応答をまとめて採点
+
+        scoring_workers が 2 以上で、応答が1チャンクに収まらない場合は
+        プロセスプールで並列に採点する（結果と順序は直列の場合と同じ）。
+        """
+        workers = self.config.scoring_workers or os.cpu_count() or 1
+        chunk_size = max(1, self.config.scoring_chunk_size)
+        if workers <= 1 or len(responses) <= chunk_size:
+            return self.create_batch_scorer().score(responses)
+        return score_in_parallel(
+            responses,
+            self.config.success_reward,
+            self.config.failure_reward,
+            self._get_scoring_executor(workers),
+            chunk_size,
+        )
+
+    def _get_scoring_executor(self, workers: int) -> ProcessPoolExecutor:
+        """採点用のプロセスプール（初回に作って使い回す）"""
+        with self._scoring_executor_lock:
+            if self._scoring_executor is None:
+                # スレッドを使うサーバー内で fork しないよう forkserver / spawn で起動する
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._scoring_executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            return self._scoring_executor
 
     def run_optimization(
         self,
         training_data: List[Dict[str, Any]],
         num_iterations: int = 100,
         callback: Optional[Callable[[int, float], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        profile: Optional[str] = None,
+        checkpoint: Optional[OptimizationCheckpoint] = None,
+        watermark: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
         強化学習による最適化を実行
@@ -165,23 +299,55 @@ class AgentOptimizer:
             training_data: トレーニングデータ
             num_iterations: イテレーション数
             callback: 進捗コールバック (iteration, reward) -> None
+            cancel_event: セットされるとイテレーションの区切りで中断する
+            profile: プロファイリングのモード (off / phases / cprofile、省略時は設定値)
+            checkpoint: 指定した場合、training_data はそのウォーターマークより後の差分として扱う。
+                報酬はチェックポイントの累計に差分を足して求め、最後まで実行できたら
+                差分を取り込んだチェックポイントを保存する
+            watermark: training_data を読み込んだ時点のコミット順の位置（checkpoint 指定時）
 
         Returns:
-            最適化結果
+            最適化結果（プロファイリング時は profile に要約を含む）
         """
         print(f"Starting optimization with {len(training_data)} samples...")
 
-        formatted_data = self.prepare_training_data(training_data)
-        reward_fn = self.create_reward_function()
+        profiler = OptimizationProfiler(normalize_profile_mode(profile or self.config.optimization_profile))
+        profiler.start()
+
+        with profiler.phase("prepare_training_data"):
+            formatted_data = self.prepare_training_data(training_data)
+
+        # 報酬はイテレーション間で変わらないので、一意なサンプルごとに1回だけ計算する
+        with profiler.phase("score_samples"):
+            sample_rewards, scored = self.score_samples(formatted_data)
+        run_id = new_run_id()
+        # 重複を weight でまとめたサンプルは、まとめた件数で重み付けして平均する
+        weights = [item.get("weight", 1) for item in formatted_data]
+        if checkpoint is not None:
+            merged = checkpoint.merge(sample_rewards, watermark, run_id, weights)
+            num_samples, avg_reward = merged.num_samples, merged.avg_reward
+        else:
+            num_samples = len(training_data)
+            total_weight = sum(weights)
+            avg_reward = sum(w * r for w, r in zip(weights, sample_rewards)) / total_weight if total_weight else 0
 
         results = {
+            "run_id": run_id,
             "start_time": datetime.now().isoformat(),
-            "num_samples": len(training_data),
+            "num_samples": num_samples,
             "num_iterations": num_iterations,
+            "scored_samples": scored,
+            "cached_samples": len(formatted_data) - scored,
+            "duplicate_samples": len(training_data) - len(formatted_data),
             "rewards": [],
-            "best_reward": float("-inf"),
+            "best_reward": None,  # イテレーションを1回も実行しなければ None のまま
             "final_prompts": {},
         }
+        if checkpoint is not None:
+            results["incremental"] = checkpoint.watermark is not None
+            results["delta_samples"] = len(training_data)
+        completed = False
+        emitting = True
 
         try:
             # Agent Lightning トレーサーを初期化
@@ -193,47 +359,47 @@ class AgentOptimizer:
                 }
             ) as tracer:
                 for iteration in range(num_iterations):
-                    total_reward = 0.0
-
-                    for item in formatted_data:
-                        # ステップを発行
-                        agl.emit_step(
-                            name=f"train_{item.get('task_type', 'general')}",
-                            input=item["messages"][1]["content"],
-                            output=item["messages"][2]["content"],
-                        )
-
-                        # 報酬を計算して発行
-                        reward = reward_fn(
-                            item["messages"][1]["content"],
-                            item["messages"][2]["content"],
-                            {"task_type": item.get("task_type")},
-                        )
-                        agl.emit_reward(reward=reward)
-                        total_reward += reward
-
-                    avg_reward = total_reward / len(formatted_data) if formatted_data else 0
+                    if cancel_event is not None and cancel_event.is_set():
+                        print(f"Optimization cancelled at iteration {iteration}/{num_iterations}")
+                        results["cancelled"] = True
+                        break
+
+                    # emit は1サンプルにつきステップと報酬の2回
+                    if emitting:
+                        with profiler.phase("emit", calls=2 * len(formatted_data)):
+                            for item, reward in zip(formatted_data, sample_rewards):
+                                # トレーサーの中で直接発行する（キューを通すとトレースとの関連が
+                                # 失われ、記録やフィードバックのイベントを押し出してしまう）
+                                sent = self.emitter.emit_step_now(
+                                    name=f"train_{item.get('task_type', 'general')}",
+                                    input=item["messages"][1]["content"],
+                                    output=item["messages"][2]["content"],
+                                ) and self.emitter.emit_reward_now(reward=reward)
+                                if not sent:
+                                    # Agent Lightning に届かなければ、この実行では以降の発行をやめる
+                                    print("Warning: Skipping Agent Lightning events for the rest of this run")
+                                    emitting = False
+                                    results["emit_failed"] = True
+                                    break
+
                     results["rewards"].append(avg_reward)
 
-                    if avg_reward > results["best_reward"]:
+                    if results["best_reward"] is None or avg_reward > results["best_reward"]:
                         results["best_reward"] = avg_reward
 
                     if callback:
-                        callback(iteration, avg_reward)
+                        with profiler.phase("callback"):
+                            callback(iteration, avg_reward)
 
                     if (iteration + 1) % 10 == 0:
                         print(f"Iteration {iteration + 1}/{num_iterations}, Avg Reward: {avg_reward:.4f}")
 
+            completed = not results.get("cancelled")
+
         except Exception as e:
             print(f"Warning: Agent Lightning optimization error: {e}")
             # フォールバック: 基本的な統計のみ計算
-            for item in formatted_data:
-                reward = reward_fn(
-                    item["messages"][1]["content"],
-                    item["messages"][2]["content"],
-                    {"task_type": item.get("task_type")},
-                )
-                results["rewards"].append(reward)
+            results["rewards"].extend(sample_rewards)
 
             if results["rewards"]:
                 results["best_reward"] = max(results["rewards"])
@@ -241,34 +407,86 @@ class AgentOptimizer:
         results["end_time"] = datetime.now().isoformat()
         results["avg_final_reward"] = sum(results["rewards"][-10:]) / min(10, len(results["rewards"])) if results["rewards"] else 0
 
-        # 結果を保存
+        # 差分を最後まで処理できた場合だけウォーターマークを進める
+        if checkpoint is not None:
+            results["checkpoint_saved"] = completed and self.checkpoints.save(merged, checkpoint.watermark)
+            results["watermark"] = merged.watermark
+
+        # 結果を保存（cProfile の結果は同じ名前の .prof として隣に置く）
+        results_file = self.history.result_file(results["run_id"])
+        profiler.stop()
+        if profiler.enabled:
+            results["profile"] = profiler.summary()
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+            profile_file = profiler.save(results_file.with_suffix(".prof"))
+            if profile_file is not None:
+                results["profile"]["cprofile_file"] = profile_file.name
+                print(f"Profile saved to {profile_file}")
         self._save_results(results)
 
         return results
 
-    def _save_results(self, results: Dict[str, Any]):
-        """最適化結果を保存"""
-        results_dir = Path(self.config.data_dir) / "optimization_results"
-        results_dir.mkdir(parents=True, exist_ok=True)
+    def run_incremental_optimization(
+        self,
+        collector,
+        min_reward: Optional[float] = None,
+        full_recompute: bool = False,
+        **kwargs,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        前回のチェックポイント以降にコミットされたデータだけで最適化を実行
 
-        filename = f"result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(results_dir / filename, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        チェックポイントは min_reward ごとに保存する。チェックポイントが無い場合や
+        報酬関数の設定が変わった場合、full_recompute が指定された場合、
+        incremental_optimization が無効な場合は全件を処理してチェックポイントを
+        作り直す。記録後に報酬が設定されて min_reward を満たすようになった
+        インタラクションなど、ウォーターマークより前の変更は全件の再計算で反映される。
+        重複除去は差分の中だけで行うので、前回までのデータとほぼ同じものも
+        全件の再計算で初めてまとめられる。
 
-        print(f"Results saved to {results_dir / filename}")
+        Args:
+            collector: データの取得元のコレクター
+            min_reward: 最小報酬値
+            full_recompute: True なら全件を処理
+            **kwargs: run_optimization に渡す引数
 
-    def get_optimization_history(self) -> List[Dict[str, Any]]:
-        """最適化履歴を取得"""
-        results_dir = Path(self.config.data_dir) / "optimization_results"
-        if not results_dir.exists():
-            return []
+        Returns:
+            最適化結果（処理するデータが1件も無ければ None）
+        """
+        checkpoint = None
+        if not full_recompute and self.config.incremental_optimization:
+            checkpoint = self.checkpoints.load(min_reward, self._checkpoint_fingerprint())
+        if checkpoint is None:
+            checkpoint = OptimizationCheckpoint(min_reward=min_reward, fingerprint=self._checkpoint_fingerprint())
+
+        training_data, watermark = collector.get_training_data_after(checkpoint.watermark, min_reward=min_reward)
+        if not training_data and not checkpoint.num_samples:
+            return None
+        return self.run_optimization(training_data, checkpoint=checkpoint, watermark=watermark, **kwargs)
 
-        history = []
-        for result_file in sorted(results_dir.glob("result_*.json")):
-            with open(result_file, "r", encoding="utf-8") as f:
-                history.append(json.load(f))
+    def _save_results(self, results: Dict[str, Any]):
+        """最適化結果を保存し、要約を履歴の索引に追記"""
+        results_file = self.history.save(results["run_id"], results)
+        print(f"Results saved to {results_file}")
+
+    def get_optimization_history(
+        self,
+        sort_by: str = "start_time",
+        descending: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        最適化履歴の要約を取得（報酬の推移は含まない）
+
+        Returns:
+            history, total_runs, next_offset を含む辞書（OptimizationHistory.page を参照）
+        """
+        return self.history.page(sort_by=sort_by, descending=descending, offset=offset, limit=limit)
 
-        return history
+    def get_optimization_result(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """報酬の推移を含む最適化結果（見つからなければ None）"""
+        return self.history.get(run_id)
 
 
 if __name__ == "__main__":
@@ -315,5 +533,6 @@ if __name__ == "__main__":
     )
 
     print("\n=== Optimization Results ===")
-    print(f"Best Reward: {results['best_reward']:.4f}")
+    if results["best_reward"] is not None:
+        print(f"Best Reward: {results['best_reward']:.4f}")
     print(f"Final Avg Reward: {results['avg_final_reward']:.4f}")
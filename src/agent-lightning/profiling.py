@@ -0,0 +1,133 @@
+"""
+Optimization Profiling
+最適化の各フェーズの所要時間・呼び出し回数と cProfile の結果を記録する
+"""
+
+import cProfile
+import pstats
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# プロファイリングのモード
+PROFILE_OFF = "off"
+PROFILE_PHASES = "phases"  # フェーズごとの所要時間と呼び出し回数
+PROFILE_CPROFILE = "cprofile"  # phases に加えて cProfile の結果を保存
+
+PROFILE_MODES = (PROFILE_OFF, PROFILE_PHASES, PROFILE_CPROFILE)
+
+# 要約に載せる関数の数（累積時間の長い順）
+TOP_FUNCTIONS = 15
+
+
+def normalize_profile_mode(value: Any) -> str:
+    """
+    リクエストや環境変数の値をプロファイリングのモードに変換
+
+    true は phases、false / None は off として扱う。
+
+    Raises:
+        ValueError: 不明なモードの場合
+    """
+    if value is None or value is False:
+        return PROFILE_OFF
+    if value is True:
+        return PROFILE_PHASES
+    mode = str(value).lower()
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unsupported profile mode: {value} (expected one of {', '.join(PROFILE_MODES)})")
+    return mode
+
+
+class OptimizationProfiler:
+    """
+    最適化1回分のプロファイラー
+
+    phase() で囲んだ区間の壁時計時間と呼び出し回数を集計する。mode が off の
+    ときは何も記録しない。cProfile は呼び出したスレッドだけを計測し、
+    他のプロファイラーが動いている場合は phases にフォールバックする。
+    """
+
+    def __init__(self, mode: str = PROFILE_OFF):
+        self.mode = mode
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._started: Optional[float] = None
+        self._elapsed = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != PROFILE_OFF
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._started = time.perf_counter()
+        if self.mode == PROFILE_CPROFILE:
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError as e:
+                print(f"Warning: cProfile is not available ({e}), recording phases only")
+                self._cprofile = None
+                self.mode = PROFILE_PHASES
+
+    def stop(self):
+        if self._started is None:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self._elapsed = time.perf_counter() - self._started
+        self._started = None
+
+    @contextmanager
+    def phase(self, name: str, calls: int = 1):
+        """with ブロックの所要時間を name のフェーズに加算（calls は呼び出し回数として数える）"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += time.perf_counter() - start
+            entry["calls"] += calls
+
+    def save(self, path: Path) -> Optional[Path]:
+        """cProfile の結果を pstats 形式で保存（cprofile モード以外は何もしない）"""
+        if self._cprofile is None:
+            return None
+        self._cprofile.dump_stats(str(path))
+        return path
+
+    def summary(self) -> Dict[str, Any]:
+        """最適化結果に含める要約"""
+        phases = {
+            name: {"seconds": round(entry["seconds"], 6), "calls": entry["calls"]}
+            for name, entry in self.phases.items()
+        }
+        accounted = sum(entry["seconds"] for entry in self.phases.values())
+        summary: Dict[str, Any] = {
+            "mode": self.mode,
+            "total_seconds": round(self._elapsed, 6),
+            "phases": phases,
+            "unaccounted_seconds": round(max(0.0, self._elapsed - accounted), 6),
+        }
+        if self._cprofile is not None:
+            summary["top_functions"] = self._top_functions()
+        return summary
+
+    def _top_functions(self) -> list:
+        stats = pstats.Stats(self._cprofile)
+        rows = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{Path(filename).name}:{line}({name})",
+                "calls": calls,
+                "own_seconds": round(own, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            })
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:TOP_FUNCTIONS]
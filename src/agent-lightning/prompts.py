@@ -0,0 +1,138 @@
+"""
+Prompt Store
+最適化済みプロンプトをメモリ上に保持し、ファイルの変更を検知して読み直す
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import AgentLightningConfig, PROMPT_TEMPLATES
+from storage import FileLock, file_signature
+
+
+class PromptStore:
+    """
+    optimized_prompts.json の共有キャッシュ
+
+    読み込みはメモリ上の辞書から行い、ファイルの (inode, mtime, size) は
+    最短でも prompt_reload_interval 秒に1回だけ確認する。他のプロセスや
+    インスタンスが書き換えたプロンプトは、再起動しなくても次の確認で反映される。
+    version はファイル内容のハッシュで、ワーカープロセス間でも同じ値になる。
+    """
+
+    def __init__(self, config: Optional[AgentLightningConfig] = None):
+        self.config = config or AgentLightningConfig.from_env()
+        self.path = Path(self.config.data_dir) / "optimized_prompts.json"
+        self.default_prompt = PROMPT_TEMPLATES["system"]
+        self._file_lock = FileLock(self.path.with_name("optimized_prompts.lock"))
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, str] = {}
+        self._version = _content_version(b"")
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at = float("-inf")
+        with self._lock:
+            self._reload()
+        if self._prompts:
+            print(f"Loaded {len(self._prompts)} optimized prompts")
+
+    @property
+    def version(self) -> str:
+        self._maybe_reload()
+        return self._version
+
+    def prompts(self) -> Dict[str, str]:
+        """task_type -> 最適化済みプロンプト（コピー）"""
+        self._maybe_reload()
+        return dict(self._prompts)
+
+    def get(self, task_type: Optional[str] = None) -> Tuple[str, bool, str]:
+        """
+        プロンプトを取得
+
+        Returns:
+            (プロンプト, 最適化済みか, version)
+        """
+        self._maybe_reload()
+        prompts, version = self._prompts, self._version
+        if task_type and task_type in prompts:
+            return prompts[task_type], True, version
+        return self.default_prompt, False, version
+
+    def update(self, task_type: str, prompt: str):
+        """プロンプトを更新してファイルに書き込む（他のプロセスの更新を取り込んでから書く）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, self._file_lock:
+            self._reload()
+            prompts = dict(self._prompts)
+            prompts[task_type] = prompt
+            data = json.dumps(prompts, ensure_ascii=False, indent=2).encode("utf-8")
+
+            tmp_file = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, self.path)
+
+            self._prompts = prompts
+            self._version = _content_version(data)
+            self._signature = file_signature(self.path)
+            self._checked_at = time.monotonic()
+
+    def _maybe_reload(self):
+        """前回の確認から prompt_reload_interval 秒経っていればファイルの変更を確認"""
+        if time.monotonic() - self._checked_at < self.config.prompt_reload_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.config.prompt_reload_interval:
+                self._reload()
+
+    def _reload(self):
+        """ファイルが変わっていれば読み直す（_lock 内で呼び出す）"""
+        self._checked_at = time.monotonic()
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+
+        data = b""
+        prompts: Dict[str, str] = {}
+        if signature is not None:
+            try:
+                data = self.path.read_bytes()
+                prompts = json.loads(data) if data.strip() else {}
+            except (OSError, ValueError) as e:
+                # 書き込み途中などで読めなければ、今のプロンプトのまま次回に読み直す
+                print(f"Warning: Failed to load optimized prompts: {e}")
+                return
+
+        self._prompts = prompts
+        self._version = _content_version(data)
+        self._signature = signature
+
+
+def _content_version(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def prompt_etag(task_type: Optional[str], version: str) -> str:
+    """/api/prompt のレスポンスの ETag（引用符なし。プロンプトの version と task_type で決まる）"""
+    task_hash = hashlib.sha256((task_type or "").encode("utf-8")).hexdigest()[:8]
+    return f"{version}-{task_hash}"
+
+
+# データディレクトリごとのインスタンス
+_stores: Dict[Path, PromptStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_prompt_store(config: Optional[AgentLightningConfig] = None) -> PromptStore:
+    """データディレクトリごとに共有する PromptStore を取得"""
+    config = config or AgentLightningConfig.from_env()
+    path = Path(config.data_dir).resolve()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = PromptStore(config)
+        return _stores[path]
@@ -0,0 +1,130 @@
+"""
+Reward Scoring for LINE Calendar Bot
+応答の報酬をまとめて計算するバッチスコアラー
+"""
+
+from concurrent.futures import Executor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from features import BatchFeatures, ResponseFeatures, extract_batch_features, extract_features
+
+
+def score_response(bot_output: Optional[str], success_reward: float, failure_reward: float) -> float:
+    """応答の品質に基づいて報酬を計算"""
+    return score_features(extract_features(bot_output), success_reward, failure_reward)
+
+
+def score_features(features: ResponseFeatures, success_reward: float, failure_reward: float) -> float:
+    """
+    特徴量から報酬を計算
+
+    評価基準:
+    - 日本語の自然さ
+    - タスク完了度
+    - 応答の簡潔さ
+    - エラーハンドリング
+    """
+    reward = 0.0
+
+    # 基本的な応答チェック
+    if features.blank:
+        return failure_reward
+
+    # 成功キーワードチェック
+    if features.has_success:
+        reward += 0.3
+
+    # エラー応答チェック
+    if features.has_error:
+        # エラーでも適切に説明していれば部分点
+        if features.length > 20:
+            reward += 0.1
+        else:
+            reward -= 0.2
+
+    # 応答の長さチェック（適切な長さを評価）
+    output_len = features.length
+    if 10 <= output_len <= 200:
+        reward += 0.2
+    elif output_len > 500:
+        reward -= 0.1  # 長すぎる応答
+
+    # 絵文字使用（親しみやすさ）
+    if features.has_emoji:
+        reward += 0.1
+
+    # 正規化
+    return max(min(reward, success_reward), failure_reward)
+
+
+class BatchRewardScorer:
+    """
+    応答のリストをまとめて採点する
+
+    特徴量は features.extract_batch_features でまとめて取り出し、
+    報酬の計算は NumPy 配列で行う。score_features と同じ順序で
+    加算するので結果は完全に一致する。
+    """
+
+    def __init__(self, success_reward: float, failure_reward: float):
+        self.success_reward = success_reward
+        self.failure_reward = failure_reward
+
+    def score(self, responses: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        応答ごとの報酬を計算
+
+        Args:
+            responses: ボットの応答のリスト
+
+        Returns:
+            score_response と同じ値の float64 配列
+        """
+        return self.score_features(extract_batch_features(responses))
+
+    def score_features(self, features: BatchFeatures) -> np.ndarray:
+        """取り出し済みの特徴量から報酬を計算"""
+        lengths = features.length
+        error = features.has_error
+
+        reward = np.zeros(len(lengths), dtype=np.float64)
+        reward += np.where(features.has_success, 0.3, 0.0)
+        reward += np.where(error & (lengths > 20), 0.1, 0.0)
+        reward -= np.where(error & (lengths <= 20), 0.2, 0.0)
+        reward += np.where((lengths >= 10) & (lengths <= 200), 0.2, 0.0)
+        reward -= np.where(lengths > 500, 0.1, 0.0)
+        reward += np.where(features.has_emoji, 0.1, 0.0)
+
+        reward = np.maximum(np.minimum(reward, self.success_reward), self.failure_reward)
+        reward[features.blank] = self.failure_reward
+        return reward
+
+
+def _score_chunk(args: Tuple[List[Optional[str]], float, float]) -> np.ndarray:
+    """プロセスプールのワーカーで1チャンクを採点"""
+    responses, success_reward, failure_reward = args
+    return BatchRewardScorer(success_reward, failure_reward).score(responses)
+
+
+def score_in_parallel(
+    responses: Sequence[Optional[str]],
+    success_reward: float,
+    failure_reward: float,
+    executor: Executor,
+    chunk_size: int,
+) -> np.ndarray:
+    """
+    応答を chunk_size 件ずつに分けてプロセスプールで採点
+
+    チャンクは executor.map で入力順に結合するので、結果は分割の仕方や
+    ワーカー数によらず BatchRewardScorer.score と同じ値・同じ順序になる。
+    """
+    chunks = [
+        (list(responses[i:i + chunk_size]), success_reward, failure_reward)
+        for i in range(0, len(responses), chunk_size)
+    ]
+    if not chunks:
+        return np.zeros(0, dtype=np.float64)
+    return np.concatenate(list(executor.map(_score_chunk, chunks)))
@@ -0,0 +1,241 @@
+"""
+SQLite Interaction Store
+インタラクションを WAL モードの SQLite に保存し、絞り込みと集計をインデックスで行う
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SCHEMA_VERSION = 1
+
+# 保存する列（Interaction のフィールドと同じ順序）
+COLUMNS = ("id", "timestamp", "user_id", "task_type", "user_message", "bot_response", "context", "reward", "feedback")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    timestamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    context TEXT NOT NULL,
+    reward REAL,
+    feedback TEXT
+);
+-- (task_type, reward) は task_type での絞り込みと task_type ごとの集計を兼ねる（集計はインデックスだけで完結）
+CREATE INDEX IF NOT EXISTS idx_interactions_task_reward ON interactions (task_type, reward);
+CREATE INDEX IF NOT EXISTS idx_interactions_reward ON interactions (reward);
+-- query() のページングは (timestamp, id) 順。task_type / user_id での絞り込みは複合インデックスで引く
+DROP INDEX IF EXISTS idx_interactions_timestamp;
+CREATE INDEX IF NOT EXISTS idx_interactions_timestamp_id ON interactions (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_interactions_task_timestamp ON interactions (task_type, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_interactions_user_timestamp ON interactions (user_id, timestamp, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStore:
+    """
+    インタラクションを保存する SQLite データベース
+
+    接続はスレッドごとに作り、書き込みは BEGIN IMMEDIATE のトランザクションで
+    行う。WAL モードなので、書き込み中も他のスレッド・プロセスから読み込める。
+    """
+
+    def __init__(self, path: Path, fsync: bool = True, busy_timeout: float = 30.0):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if self.get_meta("schema_version") is None:
+            self.set_meta("schema_version", str(SCHEMA_VERSION))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """呼び出し元スレッド用の接続"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                # 閉じる前にクエリプランナー用の統計を更新しておく
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self._connection().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _row(record: Dict[str, Any]) -> tuple:
+        return tuple(
+            json.dumps(record[name] or {}, ensure_ascii=False) if name == "context" else record.get(name)
+            for name in COLUMNS
+        )
+
+    def insert_many(self, records: Iterable[Dict[str, Any]], meta: Optional[Dict[str, str]] = None) -> int:
+        """
+        レコードを1トランザクションで追加
+
+        Args:
+            records: Interaction と同じキーを持つ辞書
+            meta: 同じトランザクションで meta テーブルに書き込む値
+
+        Returns:
+            追加した件数
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.executemany(
+                f"INSERT INTO interactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                (self._row(record) for record in records),
+            )
+            for key, value in (meta or {}).items():
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def update_reward(self, interaction_id: str, reward: float, feedback: Optional[str]) -> bool:
+        """報酬を上書き（IDが存在しなければ False）"""
+        cursor = self._connection().execute(
+            "UPDATE interactions SET reward = ?, feedback = ? WHERE id = ?",
+            (reward, feedback, interaction_id),
+        )
+        return cursor.rowcount > 0
+
+    def last_seq(self) -> int:
+        """コミット済みの最後の seq（空なら 0）"""
+        row = self._connection().execute("SELECT MAX(seq) FROM interactions").fetchone()
+        return row[0] or 0
+
+    def iter_records(
+        self,
+        min_reward: Optional[float] = None,
+        after_seq: Optional[int] = None,
+        until_seq: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        記録順にレコードを遅延読み込みする
+
+        ストリーミング中に他のスレッドの接続を占有しないよう、
+        専用の接続を開いて読み切ったら閉じる。
+
+        Args:
+            min_reward: 最小報酬値
+            after_seq: この seq より後ろだけを返す
+            until_seq: この seq までを返す
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        for clause, value in (
+            ("reward >= ?", min_reward),
+            ("seq > ?", after_seq),
+            ("seq <= ?", until_seq),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM interactions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq"
+
+        conn = self._connect()
+        try:
+            for row in conn.execute(sql, params):
+                record = dict(zip(COLUMNS, row))
+                record["context"] = json.loads(record["context"])
+                yield record
+        finally:
+            conn.close()
+
+    def query(
+        self,
+        task_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        min_reward: Optional[float] = None,
+        max_reward: Optional[float] = None,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """条件に合うレコードを (timestamp, id) の昇順に after より後ろから最大 limit 件返す"""
+        where: List[str] = []
+        params: List[Any] = []
+        for clause, value in (
+            ("task_type = ?", task_type),
+            ("user_id = ?", user_id),
+            ("timestamp >= ?", since),
+            ("timestamp < ?", until),
+            ("reward >= ?", min_reward),
+            ("reward <= ?", max_reward),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        if after is not None:
+            where.append("(timestamp, id) > (?, ?)")
+            params.extend(after)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM interactions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp, id LIMIT ?"
+        params.append(limit)
+
+        records = []
+        for row in self._connection().execute(sql, params):
+            record = dict(zip(COLUMNS, row))
+            record["context"] = json.loads(record["context"])
+            records.append(record)
+        return records
+
+    def stats_by_task(self) -> Dict[str, Dict[str, float]]:
+        """task_type ごとの件数と報酬の合計（RunningStats.by_task 形式）"""
+        rows = self._connection().execute(
+            "SELECT task_type, COUNT(*), COALESCE(SUM(reward), 0.0), COUNT(reward)"
+            " FROM interactions GROUP BY task_type"
+        )
+        return {
+            task_type: {"count": count, "reward_sum": reward_sum, "reward_count": reward_count}
+            for task_type, count, reward_sum, reward_count in rows
+        }
@@ -8,6 +8,9 @@ cd "$SCRIPT_DIR"
 export AGL_API_HOST="${AGL_API_HOST:-0.0.0.0}"
 export AGL_API_PORT="${AGL_API_PORT:-8081}"
 export AGL_DATA_DIR="${AGL_DATA_DIR:-training_data}"
+export AGL_WORKERS="${AGL_WORKERS:-1}"
+export AGL_THREADS="${AGL_THREADS:-8}"
+export AGL_SERVER="${AGL_SERVER:-wsgi}"
 
 echo "=========================================="
 echo "  Agent Lightning API Server"
@@ -15,6 +18,8 @@ echo "=========================================="
 echo "  Host: $AGL_API_HOST"
 echo "  Port: $AGL_API_PORT"
 echo "  Data: $AGL_DATA_DIR"
+echo "  Server: $AGL_SERVER"
+echo "  Workers: $AGL_WORKERS (threads: $AGL_THREADS)"
 echo "=========================================="
 
 # 依存関係の確認
@@ -24,4 +29,23 @@ if ! python3 -c "import agentlightning" 2>/dev/null; then
 fi
 
 # サーバー起動
-python3 api_server.py
+# AGL_SERVER=asgi では Starlette 版 (asgi_server.py) を uvicorn で起動する
+if [ "$AGL_SERVER" = "asgi" ]; then
+    exec uvicorn \
+        --workers "$AGL_WORKERS" \
+        --host "$AGL_API_HOST" \
+        --port "$AGL_API_PORT" \
+        asgi_server:app
+fi
+
+# 複数ワーカーは同じデータディレクトリをファイルロックで共有する。
+# 各ワーカーが自分のコレクターを持つように --preload は付けない
+# （最適化ジョブの状態は optimization_results/jobs.json で共有される）
+if [ "$AGL_WORKERS" -gt 1 ]; then
+    exec gunicorn \
+        --workers "$AGL_WORKERS" \
+        --threads "$AGL_THREADS" \
+        --bind "$AGL_API_HOST:$AGL_API_PORT" \
+        api_server:app
+fi
+exec python3 api_server.py
@@ -0,0 +1,735 @@
+"""
+Segmented Interaction Log
+インタラクションをサイズ/時間でローテーションする JSONL セグメントに保存
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間ロックなし（単一プロセスでのみ使用）
+    fcntl = None
+
+MANIFEST_VERSION = 1
+SNAPSHOT_MAGIC = b"AGLSNAP2"
+
+# IDに埋め込まれた時刻とレコードの timestamp のずれの許容幅
+ID_TIMESTAMP_SLACK = timedelta(seconds=1)
+
+
+def id_timestamp(interaction_id: str) -> Optional[datetime]:
+    """インタラクションID ({user_id}_{%Y%m%d%H%M%S%f}) から記録時刻を取り出す"""
+    suffix = interaction_id.rsplit("_", 1)[-1]
+    try:
+        return datetime.strptime(suffix, "%Y%m%d%H%M%S%f")
+    except ValueError:
+        return None
+
+
+class FileLock:
+    """
+    プロセス間の排他ロック（flock）
+
+    同じデータディレクトリを共有する複数のワーカープロセスの書き込みを
+    直列化する。プロセス内ではスレッドごとに再入可能で、最も外側の
+    with を抜けたときにだけ flock を解放する。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """ファイルの (inode, mtime_ns, size)。アトミックに置き換えられたかの判定に使う"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class RunningStats:
+    """
+    task_type ごとの件数と報酬の累計
+
+    by_task は {task_type: {"count", "reward_sum", "reward_count"}} の形で、
+    そのままマニフェストやスナップショットに保存できる。
+    """
+
+    def __init__(self, by_task: Optional[Dict[str, Dict[str, float]]] = None):
+        self.by_task: Dict[str, Dict[str, float]] = by_task if by_task is not None else {}
+
+    def _entry(self, task_type: str) -> Dict[str, float]:
+        entry = self.by_task.get(task_type)
+        if entry is None:
+            entry = self.by_task[task_type] = {"count": 0, "reward_sum": 0.0, "reward_count": 0}
+        return entry
+
+    def add(self, task_type: str, reward: Optional[float]):
+        """インタラクション1件を加算"""
+        entry = self._entry(task_type)
+        entry["count"] += 1
+        if reward is not None:
+            entry["reward_sum"] += reward
+            entry["reward_count"] += 1
+
+    def update_reward(self, task_type: str, old: Optional[float], new: Optional[float]):
+        """既存インタラクションの報酬の上書きを反映"""
+        entry = self._entry(task_type)
+        if old is not None:
+            entry["reward_sum"] -= old
+            entry["reward_count"] -= 1
+        if new is not None:
+            entry["reward_sum"] += new
+            entry["reward_count"] += 1
+
+    def merge(self, other: "RunningStats"):
+        for task_type, other_entry in other.by_task.items():
+            entry = self._entry(task_type)
+            for key, value in other_entry.items():
+                entry[key] += value
+
+    def to_statistics(self) -> Dict[str, Any]:
+        """get_statistics() 形式の辞書に変換"""
+        total_reward = sum(e["reward_sum"] for e in self.by_task.values())
+        rewarded = sum(e["reward_count"] for e in self.by_task.values())
+        return {
+            "total_interactions": sum(e["count"] for e in self.by_task.values()),
+            "interactions_by_task": {t: e["count"] for t, e in self.by_task.items() if e["count"]},
+            "average_reward": total_reward / rewarded if rewarded > 0 else 0.0,
+            "rewarded_count": rewarded,
+            "average_reward_by_task": {
+                t: e["reward_sum"] / e["reward_count"]
+                for t, e in self.by_task.items()
+                if e["reward_count"] > 0
+            },
+        }
+
+
+class TimeIndex:
+    """
+    (timestamp, id) の昇順に並べたキーの索引
+
+    全体の索引と task_type ごとの二次索引を持ち、時刻範囲と
+    カーソルの位置を二分探索で求める。
+    """
+
+    def __init__(self):
+        self.keys: List[Tuple[str, str]] = []
+        self.by_task: Dict[str, List[Tuple[str, str]]] = {}
+
+    def add(self, timestamp: str, interaction_id: str, task_type: str):
+        key = (timestamp, interaction_id)
+        bisect.insort(self.keys, key)
+        bisect.insort(self.by_task.setdefault(task_type, []), key)
+
+    def remove(self, timestamp: str, interaction_id: str, task_type: str):
+        key = (timestamp, interaction_id)
+        _discard_sorted(self.keys, key)
+        keys = self.by_task.get(task_type)
+        if keys is not None:
+            _discard_sorted(keys, key)
+            if not keys:
+                del self.by_task[task_type]
+
+    def clear(self):
+        self.keys = []
+        self.by_task = {}
+
+    def rebuild(self, entries: Iterable[Tuple[str, str, str]]):
+        """(timestamp, id, task_type) の並びから索引を作り直す"""
+        self.clear()
+        for timestamp, interaction_id, task_type in sorted(entries):
+            key = (timestamp, interaction_id)
+            self.keys.append(key)
+            self.by_task.setdefault(task_type, []).append(key)
+
+    def range(
+        self,
+        task_type: Optional[str] = None,
+        after: Optional[Tuple[str, str]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        条件に合うキーを昇順に返す
+
+        Args:
+            task_type: 指定した場合は task_type の二次索引を使う
+            after: このキーより後ろ（カーソル）
+            since: この時刻以降
+            until: この時刻より前
+        """
+        keys = self.keys if task_type is None else self.by_task.get(task_type, [])
+        lo = 0
+        if after is not None:
+            lo = bisect.bisect_right(keys, after)
+        if since is not None:
+            lo = max(lo, bisect.bisect_left(keys, (since,)))
+        hi = len(keys) if until is None else bisect.bisect_left(keys, (until,))
+        for i in range(lo, hi):
+            yield keys[i]
+
+
+def _discard_sorted(keys: List[Tuple[str, str]], key: Tuple[str, str]):
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+@dataclass
+class Segment:
+    """セグメントファイルのメタデータ"""
+    name: str
+    created_at: str
+    count: int = 0
+    size: int = 0
+    first_timestamp: Optional[str] = None
+    last_timestamp: Optional[str] = None
+    closed: bool = False
+    # task_type ごとの集計（RunningStats.by_task 形式）
+    stats: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def may_contain(self, at: datetime) -> bool:
+        """指定時刻に記録されたインタラクションを含み得るか"""
+        if self.first_timestamp is None:
+            return False
+        first = datetime.fromisoformat(self.first_timestamp) - ID_TIMESTAMP_SLACK
+        last = datetime.fromisoformat(self.last_timestamp) + ID_TIMESTAMP_SLACK
+        return first <= at <= last
+
+
+class SegmentedLog:
+    """
+    JSONL セグメントとマニフェストからなる追記専用ログ
+
+    アクティブセグメントがサイズまたは経過時間の上限を超えると
+    クローズして新しいセグメントに切り替える。クローズ済みの
+    セグメントは必要になったときだけディスクから読み込む。
+
+    複数プロセスで共有する場合、書き込みは呼び出し側がプロセス間
+    ロックを取った上で refresh() してから行う。アクティブセグメントの
+    Segment.size はこのプロセスが読み込み済みのバイト位置を兼ねる。
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, max_age_seconds: float):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.directory / "manifest.json"
+        self.max_bytes = max_bytes
+        self.max_age = timedelta(seconds=max_age_seconds)
+        self.segments: List[Segment] = []
+        self._next_seq = 1
+        self._manifest_signature: Optional[Tuple[int, int, int]] = None
+        self._load_manifest()
+
+    @property
+    def active(self) -> Segment:
+        return self.segments[-1]
+
+    def path(self, segment: Segment) -> Path:
+        return self.directory / segment.name
+
+    def total_count(self) -> int:
+        return sum(segment.count for segment in self.segments)
+
+    def stats(self) -> RunningStats:
+        """ディスク上のレコードに書かれた値での集計を返す"""
+        total = RunningStats()
+        for segment in list(self.segments):
+            total.merge(RunningStats(segment.stats))
+        return total
+
+    def _read_manifest(self) -> Tuple[List[Segment], int]:
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._manifest_signature = file_signature(self.manifest_file)
+        return [Segment(**s) for s in manifest["segments"]], manifest["next_seq"]
+
+    def _load_manifest(self):
+        """マニフェストを読み込み、アクティブセグメントの状態を実ファイルから復元"""
+        if self.manifest_file.exists():
+            self.segments, self._next_seq = self._read_manifest()
+
+            # 集計を持たない古いマニフェストのセグメントは一度だけ走査し直す
+            stale = [s for s in self.segments if s.closed and s.count and not s.stats]
+            for segment in stale:
+                self._rescan(segment)
+            if stale:
+                self._save_manifest()
+
+        if not self.segments or self.active.closed:
+            self._open_segment()
+        else:
+            self._truncate_partial_record(self.active)
+            self._rescan(self.active)
+
+    def _save_manifest(self):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "next_seq": self._next_seq,
+            "segments": [asdict(s) for s in self.segments],
+        }
+        tmp_file = self.manifest_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+        self._manifest_signature = file_signature(self.manifest_file)
+
+    def _open_segment(self):
+        segment = Segment(
+            name=f"segment_{self._next_seq:06d}.jsonl",
+            created_at=datetime.now().isoformat(),
+        )
+        self._next_seq += 1
+        self.segments.append(segment)
+        self._save_manifest()
+
+    def _truncate_partial_record(self, segment: Segment):
+        """
+        クラッシュで書き込み途中のまま残った末尾の行を切り詰める
+
+        書き込みはプロセス間ロックの中で行い、ログはロックの中で開くので、
+        改行で終わっていない末尾は書き込み中ではなく中断されたもの。
+        残すと読み込みに失敗し、次の追記とも1行につながってしまう。
+        """
+        path = self.path(segment)
+        if not path.exists() or path.stat().st_size == 0:
+            return
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+            keep = data.rfind(b"\n") + 1
+            f.truncate(keep)
+        print(f"Warning: Discarded {len(data) - keep} bytes of a partially written record in {segment.name}")
+
+    def _rescan(self, segment: Segment):
+        """セグメントファイルを走査して件数・サイズ・時刻範囲を再計算"""
+        segment.count = 0
+        segment.size = 0
+        segment.first_timestamp = None
+        segment.last_timestamp = None
+        segment.stats = {}
+        path = self.path(segment)
+        if not path.exists():
+            return
+
+        segment.size = path.stat().st_size
+        for record in self.read_segment(segment):
+            self._track(segment, record)
+
+    @staticmethod
+    def _track(segment: Segment, record: Dict[str, Any]):
+        # 複数プロセスから追記されると timestamp 順に並ぶとは限らないので最小・最大を取る
+        # （isoformat の文字列は辞書順で比較できる）
+        timestamp = record["timestamp"]
+        segment.count += 1
+        if segment.first_timestamp is None or timestamp < segment.first_timestamp:
+            segment.first_timestamp = timestamp
+        if segment.last_timestamp is None or timestamp > segment.last_timestamp:
+            segment.last_timestamp = timestamp
+        RunningStats(segment.stats).add(record["task_type"], record.get("reward"))
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """
+        他のプロセスが追記したレコードを取り込む（プロセス間ロック内で呼び出す）
+
+        マニフェストが置き換えられていれば読み直し、他のプロセスが
+        ローテーションしたセグメントは既知の件数以降を、アクティブ
+        セグメントは読み込み済みのバイト位置以降を読む。
+
+        Returns:
+            新しく見つかったレコード（ログ上の順）
+        """
+        new_records: List[Dict[str, Any]] = []
+
+        if self.manifest_file.exists() and file_signature(self.manifest_file) != self._manifest_signature:
+            known = {s.name: s for s in self.segments}
+            segments, self._next_seq = self._read_manifest()
+            for i, segment in enumerate(segments):
+                old = known.get(segment.name)
+                if not segment.closed:
+                    # アクティブセグメントの件数は追記のたびには保存されないので、
+                    # 手元の値を引き継ぐか先頭から読み直す
+                    segments[i] = old if old is not None else Segment(name=segment.name, created_at=segment.created_at)
+                elif old is None:
+                    new_records.extend(self.read_segment(segment))
+                elif not old.closed:
+                    # 手元ではアクティブだったセグメント。コンパクションで書き直されて
+                    # いる可能性があるのでバイト位置ではなく件数で読み飛ばす
+                    records = self.read_segment(segment)
+                    new_records.extend(record for n, record in enumerate(records) if n >= old.count)
+            self.segments = segments
+            if self.active.closed:
+                self._open_segment()
+
+        active = self.active
+        path = self.path(active)
+        if path.exists() and path.stat().st_size > active.size:
+            with open(path, "rb") as f:
+                f.seek(active.size)
+                data = f.read()
+            # 書き込み途中の行は次回に回す
+            data = data[:data.rfind(b"\n") + 1]
+            active.size += len(data)
+            for line in data.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    self._track(active, record)
+                    new_records.append(record)
+
+        return new_records
+
+    def import_legacy(self, legacy_file: Path):
+        """旧形式の interactions.jsonl を最初のセグメントとして取り込む"""
+        segment = self.active
+        os.replace(legacy_file, self.path(segment))
+        self._rescan(segment)
+        self.rotate()
+        print(f"Migrated {segment.count} interactions from {legacy_file} to {segment.name}")
+
+    def _should_rotate(self, incoming: int) -> bool:
+        segment = self.active
+        if segment.count == 0:
+            return False
+        if segment.size + incoming > self.max_bytes:
+            return True
+        return datetime.now() - datetime.fromisoformat(segment.created_at) > self.max_age
+
+    def rotate(self):
+        """アクティブセグメントをクローズして新しいセグメントを開く"""
+        if self.active.count == 0:
+            return
+        self.active.closed = True
+        self._open_segment()
+
+    def append(self, record: Dict[str, Any]) -> Segment:
+        """レコードを1行追記し、書き込んだセグメントを返す"""
+        self.append_many([record])
+        return self.active
+
+    def append_many(self, records: List[Dict[str, Any]], fsync: bool = False):
+        """
+        複数のレコードをまとめて追記
+
+        途中でローテーションが必要になった場合はセグメントを切り替えて続ける。
+        fsync=True の場合は書き込んだセグメントごとに1回だけ fsync する。
+        """
+        f = None
+        try:
+            for record in records:
+                data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                if self._should_rotate(len(data)):
+                    if f is not None:
+                        self._close(f, fsync)
+                        f = None
+                    self.rotate()
+
+                if f is None:
+                    f = open(self.path(self.active), "ab")
+                f.write(data)
+                self.active.size += len(data)
+                self._track(self.active, record)
+        finally:
+            if f is not None:
+                self._close(f, fsync)
+
+    @staticmethod
+    def _close(f, fsync: bool):
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        f.close()
+
+    def read_segment(self, segment: Segment) -> Iterator[Dict[str, Any]]:
+        """セグメントのレコードを先頭から順に読み込む"""
+        path = self.path(segment)
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_records(self, start: int = 0, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        古い順に全レコードを遅延読み込みする
+
+        Args:
+            start: 先頭からスキップする件数（マニフェストの件数でセグメント単位に読み飛ばす）
+            limit: 返す最大件数
+        """
+        remaining = limit
+        skip = start
+        for segment in list(self.segments):
+            if remaining is not None and remaining <= 0:
+                return
+            if skip >= segment.count and segment.closed:
+                skip -= segment.count
+                continue
+
+            path = self.path(segment)
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    if remaining is not None:
+                        if remaining <= 0:
+                            return
+                        remaining -= 1
+                    yield json.loads(line)
+
+    def tail_records(self, n: int) -> List[Dict[str, Any]]:
+        """末尾 n 件のレコードを古い順に返す"""
+        if n <= 0:
+            return []
+
+        needed: List[Segment] = []
+        covered = 0
+        for segment in reversed(self.segments):
+            if covered >= n:
+                break
+            needed.append(segment)
+            covered += segment.count
+
+        records: List[Dict[str, Any]] = []
+        for segment in reversed(needed):
+            records.extend(self.read_segment(segment))
+        return records[-n:]
+
+    def candidate_segments(self, interaction_id: str) -> List[Segment]:
+        """IDに含まれる時刻から、そのIDを含み得るセグメントを絞り込む"""
+        at = id_timestamp(interaction_id)
+        if at is None:
+            return list(self.segments)
+        return [s for s in self.segments if s.may_contain(at)]
+
+    def find(self, interaction_id: str) -> Optional[Dict[str, Any]]:
+        """ディスク上のレコードをIDで検索"""
+        for segment in self.candidate_segments(interaction_id):
+            for record in self.read_segment(segment):
+                if record["id"] == interaction_id:
+                    return record
+        return None
+
+    def rewrite_segment(self, segment: Segment, transform: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """
+        クローズ済みセグメントを1レコードずつ変換して書き直す
+
+        置き換えはアトミックなので、並行して読み込み中のリーダーは
+        古いファイルを最後まで読み切れる。
+        """
+        path = self.path(segment)
+        tmp_file = path.with_suffix(".jsonl.tmp")
+        size = 0
+        stats = RunningStats()
+        with open(tmp_file, "wb") as f:
+            for record in self.read_segment(segment):
+                record = transform(record)
+                data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(data)
+                size += len(data)
+                stats.add(record["task_type"], record.get("reward"))
+        os.replace(tmp_file, path)
+        segment.size = size
+        segment.stats = stats.by_task
+
+    def get_segment(self, name: str) -> Optional[Segment]:
+        for segment in self.segments:
+            if segment.name == name:
+                return segment
+        return None
+
+    def save(self):
+        """マニフェストを保存"""
+        self._save_manifest()
+
+
+class GroupCommitWriter:
+    """
+    複数スレッドからの書き込みをまとめてコミットするライター
+
+    submit されたアイテムはキューに溜まり、ライタースレッドが
+    まとめて commit 関数に渡す。コミット中に届いた書き込みは次の
+    バッチにまとめられるので、負荷が高いほど1回の fsync で
+    コミットされる件数が増える。interval を指定すると最初の
+    書き込みからその時間だけ待ってからコミットする。
+    """
+
+    def __init__(self, commit: Callable[[List[Any]], None], interval: float = 0.0, max_batch: int = 256):
+        self._commit = commit
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue: List[Tuple[List[Any], Future]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="agl-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, items: List[Any]) -> Future:
+        """アイテムをキューに追加し、コミット完了で解決される Future を返す"""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("GroupCommitWriter is closed")
+            self._queue.append((items, future))
+            self._cond.notify()
+        return future
+
+    def write(self, items: List[Any]):
+        """アイテムを書き込み、コミットされるまで待つ"""
+        self.submit(items).result()
+
+    def close(self):
+        """キューに残っている書き込みをコミットしてライターを停止"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _take_batch(self) -> List[Tuple[List[Any], Future]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self.interval > 0 and not self._closed:
+                deadline = time.monotonic() + self.interval
+                while sum(len(items) for items, _ in self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch: List[Tuple[List[Any], Future]] = []
+            size = 0
+            while self._queue and (not batch or size + len(self._queue[0][0]) <= self.max_batch):
+                items, future = self._queue.pop(0)
+                batch.append((items, future))
+                size += len(items)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            try:
+                self._commit([item for items, _ in batch for item in items])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+
+def write_snapshot(path: Path, columns: Dict[str, List[Any]], watermark: int):
+    """
+    メモリ上のウィンドウを列指向のスナップショットとして保存
+
+    形式は SNAPSHOT_MAGIC、本体の CRC32（4バイト、ビッグエンディアン）、
+    zlib で圧縮した JSON の順。読み込みでコードが実行されることはない。
+
+    Args:
+        path: 出力パス
+        columns: フィールド名 -> 値のリスト
+        watermark: スナップショット時点のログ全体の件数
+    """
+    payload = {
+        "created_at": datetime.now().isoformat(),
+        "watermark": watermark,
+        "columns": columns,
+    }
+    body = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 1)
+    # 複数のプロセスが同時に保存しても一時ファイルがぶつからないようにする
+    tmp_file = Path(path).with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(zlib.crc32(body).to_bytes(4, "big"))
+        f.write(body)
+    os.replace(tmp_file, path)
+
+
+def read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    """
+    スナップショットを一括で読み込む
+
+    存在しない・形式が違う（以前の形式を含む）・壊れている場合は None。
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            return None
+        header = len(SNAPSHOT_MAGIC) + 4
+        body = data[header:]
+        if zlib.crc32(body) != int.from_bytes(data[len(SNAPSHOT_MAGIC):header], "big"):
+            raise ValueError("checksum mismatch")
+        snapshot = json.loads(zlib.decompress(body))
+
+        columns = snapshot["columns"]
+        if not isinstance(snapshot["watermark"], int) or not isinstance(columns, dict):
+            raise ValueError("unexpected snapshot layout")
+        if not all(isinstance(values, list) for values in columns.values()):
+            raise ValueError("unexpected snapshot layout")
+        if len({len(values) for values in columns.values()}) > 1:
+            raise ValueError("column lengths differ")
+        return snapshot
+    except Exception as e:
+        print(f"Warning: Failed to read snapshot {path}: {e}")
+        return None
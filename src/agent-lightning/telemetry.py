@@ -0,0 +1,207 @@
+"""
+Agent Lightning Telemetry Queue
+Agent Lightning へのイベント発行をリクエスト処理から切り離すバックグラウンドキュー
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import agentlightning as agl
+
+from config import AgentLightningConfig
+
+try:
+    # agentlightning のトレーサーは OpenTelemetry の上に作られている
+    from opentelemetry import trace as otel_trace
+except ImportError:  # 入っていなければトレース ID は記録しない
+    otel_trace = None
+
+# キューが満杯のときの挙動
+DROP_OLDEST = "drop_oldest"  # 古いイベントを捨てて新しいイベントを入れる
+DROP_NEWEST = "drop_newest"  # 新しいイベントを捨てる
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+@dataclass
+class QueuedEvent:
+    """
+    キューに積んだイベント
+
+    フラッシャースレッドはトレーサーのコンテキストの外で発行するので、積んだ
+    時点のコンテキスト (contextvars) を保存しておき、その中で発行する。
+    trace_id / span_id はその時点で有効だったスパン（無ければ None）。
+    """
+    kind: str
+    kwargs: Dict[str, Any]
+    context: contextvars.Context = field(default_factory=contextvars.copy_context, repr=False)
+    trace_id: Optional[str] = None
+    span_id: Optional[str] = None
+
+
+def current_trace_ids() -> Tuple[Optional[str], Optional[str]]:
+    """有効なスパンの (trace_id, span_id)（16進文字列、無ければ (None, None)）"""
+    if otel_trace is None:
+        return None, None
+    span_context = otel_trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None, None
+    return format(span_context.trace_id, "032x"), format(span_context.span_id, "016x")
+
+
+class EmissionQueue:
+    """
+    Agent Lightning へのイベント発行キュー
+
+    emit_step / emit_reward はイベントをキューに積むだけで即座に戻る。
+    フラッシャースレッドがまとめて取り出して発行し、失敗した
+    イベントは指数バックオフで再試行する。キューが満杯のときは
+    drop_policy に従ってイベントを捨てるので、呼び出し側が待つことはない。
+
+    最適化のようにトレーサーの中で大量に発行するものは emit_step_now /
+    emit_reward_now で呼び出し元のスレッドから直接発行する。トレースとの
+    関連が保たれ、記録やフィードバックのイベントをキューから押し出さない。
+    こちらは再試行せず、失敗したかどうかを返す。
+    """
+
+    def __init__(self, config: Optional[AgentLightningConfig] = None):
+        self.config = config or AgentLightningConfig.from_env()
+        if self.config.emit_drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown emit drop policy: {self.config.emit_drop_policy}")
+
+        self._queue: Deque[QueuedEvent] = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._counters = {
+            "enqueued": 0,
+            "sent": 0,
+            "dropped": 0,
+            "failed": 0,
+            "retries": 0,
+        }
+        self._thread = threading.Thread(target=self._run, name="agl-emitter", daemon=True)
+        self._thread.start()
+
+    def emit_step(self, **kwargs):
+        """agl.emit_step をキューに積む"""
+        self._put("step", kwargs)
+
+    def emit_reward(self, **kwargs):
+        """agl.emit_reward をキューに積む"""
+        self._put("reward", kwargs)
+
+    def emit_step_now(self, **kwargs) -> bool:
+        """agl.emit_step を呼び出し元のスレッドで発行（再試行しない）"""
+        return self._send_now("step", kwargs)
+
+    def emit_reward_now(self, **kwargs) -> bool:
+        """agl.emit_reward を呼び出し元のスレッドで発行（再試行しない）"""
+        return self._send_now("reward", kwargs)
+
+    def _send_now(self, kind: str, kwargs: Dict[str, Any]) -> bool:
+        # 呼び出し元を待たせないよう、バックオフを挟んだ再試行はしない
+        sent = self._send(QueuedEvent(kind, kwargs), max_retries=0)
+        with self._cond:
+            self._counters["sent" if sent else "failed"] += 1
+        return sent
+
+    def _put(self, kind: str, kwargs: Dict[str, Any]):
+        trace_id, span_id = current_trace_ids()
+        event = QueuedEvent(kind, kwargs, trace_id=trace_id, span_id=span_id)
+        with self._cond:
+            if len(self._queue) >= self.config.emit_queue_size:
+                self._counters["dropped"] += 1
+                if self.config.emit_drop_policy == DROP_NEWEST:
+                    return
+                self._queue.popleft()
+
+            self._queue.append(event)
+            self._counters["enqueued"] += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """キューのカウンターを取得"""
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "in_flight": self._in_flight,
+                "capacity": self.config.emit_queue_size,
+                "drop_policy": self.config.emit_drop_policy,
+                **self._counters,
+            }
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューが空になるまで待つ（テストや終了処理用）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _take_batch(self) -> List[QueuedEvent]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            batch = []
+            while self._queue and len(batch) < self.config.emit_batch_size:
+                batch.append(self._queue.popleft())
+            self._in_flight = len(batch)
+            return batch
+
+    def _send(self, event: QueuedEvent, max_retries: Optional[int] = None) -> bool:
+        """
+        1件をイベントのコンテキストの中で発行し、失敗したら指数バックオフで再試行
+
+        max_retries を省略すると config.emit_max_retries 回まで再試行する。
+        """
+        emit = agl.emit_step if event.kind == "step" else agl.emit_reward
+        if max_retries is None:
+            max_retries = self.config.emit_max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                event.context.run(emit, **event.kwargs)
+                return True
+            except Exception as e:
+                if attempt == max_retries:
+                    trace = f" (trace {event.trace_id}, span {event.span_id})" if event.trace_id else ""
+                    print(f"Warning: Failed to emit {event.kind} to Agent Lightning{trace}: {e}")
+                    return False
+                with self._cond:
+                    self._counters["retries"] += 1
+                time.sleep(self.config.emit_retry_backoff * (2 ** attempt))
+        return False
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            sent = failed = 0
+            for event in batch:
+                if self._send(event):
+                    sent += 1
+                else:
+                    failed += 1
+
+            with self._cond:
+                self._counters["sent"] += sent
+                self._counters["failed"] += failed
+                self._in_flight = 0
+                self._cond.notify_all()
+
+
+# シングルトンインスタンス
+_emitter: Optional[EmissionQueue] = None
+_emitter_lock = threading.Lock()
+
+
+def get_emitter(config: Optional[AgentLightningConfig] = None) -> EmissionQueue:
+    """EmissionQueueのシングルトンインスタンスを取得"""
+    global _emitter
+    with _emitter_lock:
+        if _emitter is None:
+            _emitter = EmissionQueue(config)
+        return _emitter
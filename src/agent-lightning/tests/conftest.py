@@ -0,0 +1,37 @@
+"""
+pytest の共通設定
+
+src/agent-lightning を import パスに加え、agentlightning が入っていない
+環境ではベンチマーク用の代替モジュール (benchmarks/stub) を使う。
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+MODULE_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(MODULE_DIR))
+if importlib.util.find_spec("agentlightning") is None:
+    sys.path.insert(0, str(MODULE_DIR / "benchmarks" / "stub"))
+
+from config import AgentLightningConfig  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path):
+    """一時ディレクトリにデータを置く設定（fsync なし）"""
+    return AgentLightningConfig(data_dir=str(tmp_path / "training_data"), fsync=False)
+
+
+@pytest.fixture(params=["segments", "sqlite"])
+def collector(config, request):
+    """AGL_STORAGE の各保存先のコレクター"""
+    from collector import create_collector
+
+    config.storage = request.param
+    instance = create_collector(config)
+    yield instance
+    instance.close()
@@ -0,0 +1,63 @@
+"""
+ResponseAnalyzer（応答分析の LRU キャッシュ）のテスト
+"""
+
+import pytest
+
+from analyzer import ResponseAnalyzer
+from optimizer import AgentOptimizer
+from scoring import score_response
+
+
+def _score(config, response):
+    return score_response(response, config.success_reward, config.failure_reward)
+
+
+@pytest.fixture
+def analyzer(config):
+    config.analyze_cache_size = 2
+    return ResponseAnalyzer(AgentOptimizer(config))
+
+
+def _item(bot_response, task_type="calendar_create"):
+    return {"user_message": "明日の予定を追加して", "bot_response": bot_response, "task_type": task_type}
+
+
+def test_repeated_analysis_is_served_from_the_cache(analyzer, config):
+    first = analyzer.analyze("明日の予定を追加して", "✅ 予定を登録しました", "calendar_create")
+    assert first["reward"] == _score(config, "✅ 予定を登録しました")
+    assert first["has_success_indicator"] and first["has_emoji"]
+
+    assert analyzer.analyze("明日の予定を追加して", "✅ 予定を登録しました", "calendar_create") == first
+    assert analyzer.stats() == {"size": 1, "capacity": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_batch_analyzes_each_unique_response_once(analyzer, config):
+    results = analyzer.analyze_batch([
+        _item("登録しました"),
+        _item("エラー"),
+        _item("登録しました"),
+        _item("登録しました", task_type="task_create"),
+    ])
+    assert [result["reward"] for result in results] == [
+        _score(config, response) for response in ["登録しました", "エラー", "登録しました", "登録しました"]
+    ]
+    assert results[0] == results[2] and results[0] is not results[2]
+    # 同じバッチ内の重複はキャッシュに無いのでミスとして数える
+    stats = analyzer.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (0, 4, 2)
+
+
+def test_least_recently_used_entry_is_evicted(analyzer):
+    analyzer.analyze_batch([_item("a"), _item("b")])
+    analyzer.analyze_batch([_item("a")])
+    analyzer.analyze_batch([_item("c")])
+    analyzer.analyze_batch([_item("a"), _item("b")])
+    stats = analyzer.stats()
+    # a は直前に使ったので残り、b は追い出されていた
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 4, 2)
+
+
+def test_callers_cannot_modify_cached_results(analyzer):
+    analyzer.analyze_batch([_item("登録しました")])[0]["reward"] = 100
+    assert analyzer.analyze_batch([_item("登録しました")])[0]["reward"] != 100
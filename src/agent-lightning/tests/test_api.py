@@ -0,0 +1,154 @@
+"""
+REST API (api_server.py / asgi_server.py) のテスト
+"""
+
+import asyncio
+import importlib
+
+import pytest
+
+from prompts import PromptStore
+
+
+@pytest.fixture(scope="module")
+def servers(tmp_path_factory):
+    """一時ディレクトリのデータで Flask 版と ASGI 版のテストクライアントを作る"""
+    with pytest.MonkeyPatch.context() as patch:
+        # 設定とコレクターはインポート時に環境変数から作られる
+        patch.setenv("AGL_DATA_DIR", str(tmp_path_factory.mktemp("api") / "training_data"))
+        patch.setenv("AGL_FSYNC", "false")
+        patch.setenv("AGL_PROMPT_RELOAD_INTERVAL", "0")
+        api_server = importlib.import_module("api_server")
+        clients = {"wsgi": api_server.app.test_client()}
+        try:
+            from starlette.testclient import TestClient
+
+            clients["asgi"] = TestClient(importlib.import_module("asgi_server").app)
+        except ImportError:  # starlette / httpx が無ければ Flask 版だけ
+            pass
+    return clients
+
+
+@pytest.fixture(params=["wsgi", "asgi"])
+def client(servers, request):
+    if request.param not in servers:
+        pytest.skip("starlette is not installed")
+    return servers[request.param]
+
+
+def _json(response):
+    """Flask (プロパティ) と httpx (メソッド) のレスポンスの JSON"""
+    return response.json() if callable(response.json) else response.json
+
+
+@pytest.mark.parametrize("num_iterations", [0, -1, "10", 1.5, True, None])
+def test_optimize_rejects_invalid_num_iterations(client, num_iterations):
+    response = client.post("/api/optimize", json={"num_iterations": num_iterations})
+    assert response.status_code == 400
+    assert "num_iterations" in _json(response)["error"]
+
+
+def test_optimize_defaults_num_iterations(client):
+    client.post("/api/record", json={
+        "user_id": "user",
+        "task_type": "calendar_create",
+        "user_message": "明日の予定を追加して",
+        "bot_response": "予定を登録しました",
+    })
+    response = client.post("/api/optimize", json={"wait": True})
+    assert response.status_code == 200
+    job = _json(client.get(f"/api/optimize/jobs/{_json(response)['job_id']}"))
+    assert job["num_iterations"] == 100
+
+
+def test_prompt_etag_and_hot_reload(client):
+    url = "/api/prompt?task_type=task_delete"
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+    # 別のワーカーがプロンプトを更新すると、再起動せずに新しいプロンプトを返す
+    api_server = importlib.import_module("api_server")
+    PromptStore(api_server.config).update("task_delete", f"削除用のプロンプト {etag}")
+    updated = client.get(url, headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.headers["ETag"] != etag
+    assert _json(updated)["prompt"] == f"削除用のプロンプト {etag}"
+    assert _json(updated)["is_optimized"] is True
+
+
+def test_metrics_exposition(client):
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+
+    text = response.text
+    assert "# TYPE agl_http_requests_total counter" in text
+    assert 'agl_http_requests_total{route="/health",method="GET",status="200"}' in text
+    assert 'agl_http_request_duration_seconds_bucket{route="/health",method="GET",le="+Inf"}' in text
+    assert "agl_collector_interactions " in text
+    assert 'agl_collector_disk_bytes{kind="' in text
+
+
+def test_asgi_routes_match_flask(servers):
+    pytest.importorskip("starlette")
+    api_server = importlib.import_module("api_server")
+    asgi_server = importlib.import_module("asgi_server")
+
+    flask_routes = {
+        (rule.rule, method)
+        for rule in api_server.app.url_map.iter_rules()
+        if rule.endpoint != "static"
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+    }
+    asgi_routes = {
+        (asgi_server._PATH_PARAM.sub(r"<\1>", route.path), method)
+        for route in asgi_server.routes
+        for method in route.methods - {"HEAD"}
+    }
+    assert asgi_routes == flask_routes
+
+
+def test_asgi_job_endpoints_do_not_block_the_event_loop(servers, monkeypatch):
+    if "asgi" not in servers:
+        pytest.skip("starlette is not installed")
+    jobs = importlib.import_module("asgi_server").jobs
+    on_event_loop = []
+
+    def outside_event_loop(method):
+        def call(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_event_loop.append(method.__name__)
+            except RuntimeError:
+                pass
+            return method(*args, **kwargs)
+        return call
+
+    for name in ("submit", "list", "get", "cancel"):
+        monkeypatch.setattr(jobs, name, outside_event_loop(getattr(jobs, name)))
+
+    client = servers["asgi"]
+    job_id = _json(client.post("/api/optimize", json={"num_iterations": 1}))["job_id"]
+    assert client.get("/api/optimize/jobs").status_code == 200
+    assert client.get(f"/api/optimize/jobs/{job_id}").status_code == 200
+    assert client.post(f"/api/optimize/jobs/{job_id}/cancel").status_code == 200
+    assert on_event_loop == []
+
+
+@pytest.mark.parametrize("entry", [1, True, None, "interaction", ["user"]])
+def test_record_batch_rejects_non_object_entries(client, entry):
+    valid = {
+        "user_id": "user",
+        "task_type": "calendar_create",
+        "user_message": "明日の予定を追加して",
+        "bot_response": "予定を登録しました",
+    }
+    response = client.post("/api/record/batch", json={"interactions": [valid, entry]})
+    assert response.status_code == 400
+    assert _json(response)["error"] == "interactions[1] must be an object"
@@ -0,0 +1,43 @@
+"""
+増分最適化のチェックポイントのテスト
+"""
+
+import json
+
+from checkpoint import CheckpointStore, OptimizationCheckpoint, checkpoint_key
+
+
+def test_merge_accumulates_weighted_rewards():
+    checkpoint = OptimizationCheckpoint(min_reward=None, fingerprint="f")
+    merged = checkpoint.merge([1.0, 0.0], watermark=2, run_id="run1", weights=[3, 1])
+    assert (merged.num_samples, merged.reward_sum, merged.watermark) == (4, 3.0, 2)
+    assert merged.avg_reward == 0.75
+    # 差分が無い実行ではウォーターマークはそのまま
+    assert merged.merge([], watermark=None, run_id="run2").watermark == 2
+    assert checkpoint.num_samples == 0
+
+
+def test_save_refuses_a_checkpoint_advanced_by_another_run(tmp_path):
+    store = CheckpointStore(tmp_path)
+    base = OptimizationCheckpoint(min_reward=0.5, fingerprint="f")
+    assert store.save(base.merge([1.0], 10, "run1"), base_watermark=None)
+
+    loaded = store.load(0.5, "f")
+    assert loaded.watermark == 10
+    assert store.save(loaded.merge([0.0], 12, "run2"), base_watermark=loaded.watermark)
+    # 同じチェックポイントから始めた別の実行は保存しない
+    assert not store.save(loaded.merge([1.0], 13, "run3"), base_watermark=loaded.watermark)
+    assert store.load(0.5, "f").watermark == 12
+    assert store.load(None, "f") is None
+
+
+def test_load_ignores_checkpoints_with_other_settings(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save(OptimizationCheckpoint(min_reward=None, fingerprint="old", watermark=5), base_watermark=None)
+    assert store.load(None, "new") is None
+
+    # 知らない項目が増えていても読み込める
+    data = json.loads(store.path.read_text())
+    data[checkpoint_key(None)]["future_field"] = 1
+    store.path.write_text(json.dumps(data))
+    assert store.load(None, "old").watermark == 5
@@ -0,0 +1,197 @@
+"""
+DataCollector / SQLiteCollector のテスト
+"""
+
+import json
+import threading
+
+import pytest
+
+from collector import DataCollector, Interaction, create_collector
+
+
+def _record(collector, n=1, task_type="calendar_create", reward=None):
+    return [
+        collector.record_interaction("user", task_type, f"予定{i}を追加して", f"予定{i}を登録しました", reward=reward)
+        for i in range(n)
+    ]
+
+
+def _gate_replay(monkeypatch):
+    """起動時の末尾再生を、返したイベントがセットされるまで止める"""
+    release = threading.Event()
+    replay_tail = DataCollector._replay_tail
+
+    def gated(self, *args):
+        release.wait(5)
+        replay_tail(self, *args)
+
+    monkeypatch.setattr(DataCollector, "_replay_tail", gated)
+    return release
+
+
+def test_set_reward_during_replay_waits_for_journal(config, monkeypatch):
+    collector = DataCollector(config)
+    _record(collector)
+    collector.save_snapshot()
+    snapshot = collector.snapshot_file.read_bytes()
+    [interaction_id] = _record(collector)
+    collector.set_reward(interaction_id, 0.5)
+    collector.close()
+    # 報酬を付けたインタラクションがスナップショットより後ろ（再生される末尾）に残るようにする
+    collector.snapshot_file.write_bytes(snapshot)
+
+    release = _gate_replay(monkeypatch)
+    restarted = DataCollector(config)
+    assert not restarted.is_ready()
+
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (restarted.set_reward(interaction_id, 1.0), done.set()))
+    thread.start()
+    assert not done.wait(0.2), "set_reward must wait for the replay to finish"
+    release.set()
+    thread.join(5)
+    assert done.is_set()
+
+    stats = restarted.get_statistics()
+    assert stats["total_interactions"] == 2
+    assert stats["rewarded_count"] == 1
+    assert stats["average_reward"] == 1.0
+    restarted.close()
+
+    # ジャーナルの previous_reward も正しいので、再起動後の集計も一致する
+    reopened = DataCollector(config)
+    assert reopened.get_statistics()["rewarded_count"] == 1
+    assert reopened.get_statistics()["average_reward"] == 1.0
+    reopened.close()
+
+
+def test_training_data_watermark_follows_commit_order(collector):
+    _record(collector, 2, reward=1.0)
+    data, watermark = collector.get_training_data_after(None)
+    assert len(data) == 2
+
+    # 記録時刻はコミット前に払い出すので、先の時刻のインタラクションが後からコミットされることがある
+    late = Interaction(
+        id="late_user_20000101000000000000",
+        timestamp="2000-01-01T00:00:00",
+        user_id="late_user",
+        task_type="calendar_create",
+        user_message="遅れて届いた",
+        bot_response="登録しました",
+        context={},
+        reward=1.0,
+    )
+    collector._writer.submit([late]).result()
+    [newer] = _record(collector, reward=1.0)
+
+    delta, next_watermark = collector.get_training_data_after(watermark)
+    assert [record["id"] for record in delta] == [late.id, newer]
+    assert next_watermark > watermark
+    assert collector.get_training_data_after(next_watermark) == ([], next_watermark)
+
+
+def test_training_data_after_applies_min_reward_and_rewards(collector):
+    low, high = _record(collector, 2, reward=0.0)
+    collector.set_reward(high, 1.0)
+    data, watermark = collector.get_training_data_after(None, min_reward=0.5)
+    assert [record["id"] for record in data] == [high]
+    assert data[0]["reward"] == 1.0
+    # 条件に合わないものも含めてコミット済みの位置まで進む
+    assert collector.get_training_data_after(watermark, min_reward=0.5) == ([], watermark)
+
+
+def test_partially_written_reward_journal_entry_is_discarded(config):
+    config.snapshot_enabled = False
+    collector = DataCollector(config)
+    first, second = _record(collector, 2)
+    collector.set_reward(first, 1.0)
+    collector.close()
+    # 報酬ジャーナルへの追記の途中でクラッシュした
+    with open(collector.reward_file, "ab") as f:
+        f.write(b'{"id": "' + second.encode() + b'", "rew')
+
+    restarted = DataCollector(config)
+    assert restarted.get_statistics()["rewarded_count"] == 1
+    restarted.set_reward(second, 0.0)
+    restarted.close()
+
+    reopened = DataCollector(config)
+    stats = reopened.get_statistics()
+    assert stats["rewarded_count"] == 2
+    assert stats["average_reward"] == 0.5
+    reopened.close()
+
+
+def test_restart_replays_the_log_tail_after_the_snapshot(config):
+    config.max_samples = 5
+    collector = DataCollector(config)
+    ids = _record(collector, 4)
+    collector.set_reward(ids[0], 1.0)
+    collector.save_snapshot()
+    # スナップショットの後に記録・報酬設定してからクラッシュした（close せずに終了）
+    ids += _record(collector, 3, task_type="task_create")
+    collector.set_reward(ids[5], -0.5)
+    collector._writer.close()
+
+    restarted = DataCollector(config)
+    assert restarted.wait_ready(5)
+    stats = restarted.get_statistics()
+    assert stats["total_interactions"] == 7
+    assert stats["interactions_by_task"] == {"calendar_create": 4, "task_create": 3}
+    assert stats["rewarded_count"] == 2
+    assert stats["average_reward"] == 0.25
+    # メモリ上には直近 max_samples 件、古いものはディスクから読む
+    assert [interaction.id for interaction in restarted.interactions] == ids[-5:]
+    assert [interaction.id for interaction in restarted.iter_interactions()] == ids
+    assert [interaction.reward for interaction in restarted.iter_interactions(min_reward=0.0)] == [1.0]
+    restarted.close()
+
+
+@pytest.mark.parametrize("storage", ["segments", "sqlite"])
+def test_cursor_pagination_covers_every_interaction_once(config, storage):
+    # セグメントでは古いものがメモリ上のウィンドウの外（ディスク）にある
+    config.storage = storage
+    config.max_samples = 4
+    config.segment_max_bytes = 1000
+    collector = create_collector(config)
+    ids = _record(collector, 5) + _record(collector, 6, task_type="task_create")
+    collector.set_reward(ids[1], 1.0)
+    if storage == "segments":
+        assert len(collector._log.segments) > 1
+        assert len(collector.interactions) == 4
+
+    def pages(**filters):
+        seen, cursor = [], None
+        while True:
+            page = collector.query_training_data(cursor=cursor, limit=3, **filters)
+            assert len(page["data"]) <= 3
+            seen.extend(item["id"] for item in page["data"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    assert pages() == ids
+    assert pages(task_type="task_create") == ids[5:]
+    assert pages(min_reward=0.5) == [ids[1]]
+    first = collector.query_training_data(limit=2)
+    assert collector.query_training_data(cursor=first["next_cursor"], limit=2)["data"][0]["id"] == ids[2]
+    collector.close()
+
+
+def test_invalid_cursor_is_rejected(collector):
+    with pytest.raises(ValueError):
+        collector.query_training_data(cursor="not-a-cursor")
+
+
+def test_export_with_near_duplicate_weights(collector, tmp_path):
+    collector.record_interaction("user", "calendar_create", "明日の予定を教えて", "明日は会議があります")
+    collector.record_interaction("user", "calendar_create", "明日の予定を教えて", "明日は会議があります")
+    collector.record_interaction("user", "task_create", "明日の予定を教えて", "明日は会議があります")
+    collector.record_interaction("user", "calendar_create", "買い物リストを作って", "タスクを作成しました")
+
+    result = collector.export_training_data(str(tmp_path / "export.jsonl"), min_reward=None, dedup="weight")
+    assert result["total_samples"] == 3
+    assert result["duplicates"] == 1
+    lines = [json.loads(line) for line in open(result["output_path"], encoding="utf-8")]
+    assert [record.get("weight") for record in lines[1:-1]] == [2, 1, 1]
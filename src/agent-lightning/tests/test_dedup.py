@@ -0,0 +1,64 @@
+"""
+MinHash / LSH による重複除去のテスト
+"""
+
+import pytest
+
+from dedup import DEDUP_DROP, DEDUP_OFF, DEDUP_WEIGHT, NearDuplicateDetector, deduplicate, normalize_dedup_mode
+
+
+def _record(user_message, bot_response, task_type="calendar_query", **extra):
+    return {"input": user_message, "output": bot_response, "task_type": task_type, "reward": 0.0, **extra}
+
+
+RECORDS = [
+    _record("明日の予定を教えてください", "明日は10時から会議があります"),
+    _record("明日の予定を教えてください！", "明日は10時から会議があります。"),
+    _record("明日の予定を教えてください", "明日は10時から会議があります", task_type="general_query"),
+    _record("買い物リストにりんごを追加", "タスクを作成しました"),
+]
+
+
+def test_near_duplicates_share_a_representative():
+    detector = NearDuplicateDetector()
+    assert detector.assign("a", RECORDS[0]["input"], RECORDS[0]["output"], "calendar_query") == "a"
+    assert detector.assign("b", RECORDS[1]["input"], RECORDS[1]["output"], "calendar_query") == "a"
+    # task_type が違うもの・内容が違うものは別のグループ
+    assert detector.assign("c", RECORDS[2]["input"], RECORDS[2]["output"], "general_query") == "c"
+    assert detector.assign("d", RECORDS[3]["input"], RECORDS[3]["output"], "calendar_query") == "d"
+
+
+def test_signature_ignores_width_case_and_whitespace():
+    detector = NearDuplicateDetector()
+    a = detector.signature("ＡＢＣ の予定", "OK")
+    b = detector.signature("abc の 予定", "ok")
+    assert detector.similarity(a, b) == 1.0
+
+
+@pytest.mark.parametrize("mode, weights", [
+    (DEDUP_DROP, [None, None, None]),
+    (DEDUP_WEIGHT, [2, 1, 1]),
+])
+def test_deduplicate_modes(mode, weights):
+    kept, removed = deduplicate(RECORDS, NearDuplicateDetector(), mode)
+    assert removed == 1
+    assert [record["input"] for record in kept] == [RECORDS[0]["input"], RECORDS[2]["input"], RECORDS[3]["input"]]
+    assert [record.get("weight") for record in kept] == weights
+
+
+def test_deduplicate_adds_existing_weights():
+    records = [_record("同じ質問", "同じ応答", weight=3), _record("同じ質問", "同じ応答", weight=2)]
+    kept, removed = deduplicate(records, NearDuplicateDetector(), DEDUP_WEIGHT)
+    assert removed == 1
+    assert kept[0]["weight"] == 5
+
+
+def test_deduplicate_off_returns_records_unchanged():
+    assert deduplicate(RECORDS, NearDuplicateDetector(), DEDUP_OFF) == (RECORDS, 0)
+
+
+def test_normalize_dedup_mode():
+    assert normalize_dedup_mode(None) == DEDUP_OFF
+    assert normalize_dedup_mode("WEIGHT") == DEDUP_WEIGHT
+    with pytest.raises(ValueError):
+        normalize_dedup_mode("merge")
@@ -0,0 +1,173 @@
+"""
+OptimizationJobManager のテスト
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import jobs
+from collector import DataCollector
+from jobs import JOB_CANCELLED, JOB_FAILED, JOB_RUNNING, WORKER_EXITED, JobQueueFull, OptimizationJobManager
+from optimizer import AgentOptimizer
+
+
+@pytest.fixture
+def manager(config):
+    collector = DataCollector(config)
+    collector.record_interaction("user", "calendar_create", "明日の予定を追加して", "予定を登録しました")
+    yield OptimizationJobManager(AgentOptimizer(config), collector, config)
+    collector.close()
+
+
+def test_job_cancelled_before_first_iteration_serializes(manager, monkeypatch):
+    run = manager.optimizer.run_incremental_optimization
+
+    def cancel_then_run(*args, cancel_event=None, **kwargs):
+        # 開始直後（イテレーション 0 の前）にキャンセルされた状況
+        cancel_event.set()
+        return run(*args, cancel_event=cancel_event, **kwargs)
+
+    monkeypatch.setattr(manager.optimizer, "run_incremental_optimization", cancel_then_run)
+    job = manager.submit(num_iterations=5)
+    assert job.done_event.wait(10)
+
+    assert job.status == JOB_CANCELLED
+    assert job.result["best_reward"] is None
+    # API のレスポンスは標準の JSON（-Infinity を含まない）
+    json.dumps(job.to_dict(), allow_nan=False)
+    history = manager.optimizer.get_optimization_history()
+    json.dumps(history, allow_nan=False)
+
+
+def test_history_reads_legacy_infinity_as_none(config):
+    optimizer = AgentOptimizer(config)
+    optimizer.results_dir.mkdir(parents=True)
+    legacy = optimizer.results_dir / "result_20260101_000000.json"
+    legacy.write_text('{"start_time": "2026-01-01T00:00:00", "best_reward": -Infinity, "rewards": []}')
+
+    [row] = optimizer.get_optimization_history()["history"]
+    assert row["best_reward"] is None
+    assert optimizer.history.get("20260101_000000")["best_reward"] is None
+
+
+@pytest.fixture
+def workers(config, monkeypatch):
+    """同じデータディレクトリを共有する2つのワーカーのジョブマネージャー"""
+    monkeypatch.setattr(jobs, "JOB_SYNC_INTERVAL", 0)
+    config.max_concurrent_jobs = 1
+    config.max_queued_jobs = 1
+    collector = DataCollector(config)
+    collector.record_interaction("user", "calendar_create", "明日の予定を追加して", "予定を登録しました")
+    managers = [OptimizationJobManager(AgentOptimizer(config), collector, config) for _ in range(2)]
+    yield managers
+    collector.close()
+
+
+def _block_until_cancelled(manager, monkeypatch):
+    """キャンセルされるまでイテレーションを続ける最適化に差し替える"""
+    def run(collector, callback=None, cancel_event=None, **kwargs):
+        iteration = 0
+        while not cancel_event.is_set():
+            callback(iteration, 0.5)
+            iteration += 1
+            time.sleep(0.01)
+        return {
+            "run_id": "blocked", "num_samples": 1, "delta_samples": 1, "duplicate_samples": 0,
+            "incremental": False, "best_reward": 0.5, "avg_final_reward": 0.5,
+            "start_time": "", "end_time": "", "cancelled": True,
+        }
+
+    monkeypatch.setattr(manager.optimizer, "run_incremental_optimization", run)
+
+
+def test_jobs_are_shared_between_workers(workers, monkeypatch):
+    first, second = workers
+    _block_until_cancelled(first, monkeypatch)
+    job = first.submit(num_iterations=1000)
+
+    deadline = time.monotonic() + 5
+    while second.get(job.id).status != JOB_RUNNING and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert second.get(job.id).status == JOB_RUNNING
+    assert [listed.id for listed in second.list()] == [job.id]
+
+    # 上限は全ワーカーを通じて数える (max_concurrent_jobs + max_queued_jobs = 2)
+    _block_until_cancelled(second, monkeypatch)
+    queued = second.submit()
+    with pytest.raises(JobQueueFull):
+        second.submit()
+
+    # 他のワーカーのジョブもキャンセルできる
+    assert second.cancel(job.id) is not None
+    assert job.done_event.wait(5)
+    assert job.status == JOB_CANCELLED
+    assert second.get(job.id).status == JOB_CANCELLED
+    json.dumps(second.get(job.id).to_dict(), allow_nan=False)
+
+    first.cancel(queued.id)
+    assert queued.done_event.wait(5)
+    assert second.get("missing") is None
+    assert second.cancel("missing") is None
+
+
+def test_jobs_of_exited_workers_are_failed(workers):
+    first, second = workers
+    record = jobs.OptimizationJob(id="orphan", num_iterations=10, min_reward=None, status=JOB_RUNNING)
+    assert first.store.add(record, max_active=10, max_history=10)
+    # 終了したワーカーの pid に書き換える
+    first.store._modify("orphan", lambda data: data.update(worker_pid=_exited_pid()))
+
+    orphan = second.get("orphan")
+    assert orphan.status == JOB_FAILED
+    assert orphan.error == WORKER_EXITED
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _stale_job(manager, job_id, **worker):
+    """以前のワーカーが残した実行中のジョブを書き込む"""
+    record = jobs.OptimizationJob(id=job_id, num_iterations=10, min_reward=None, status=JOB_RUNNING)
+    assert manager.store.add(record, max_active=10, max_history=10)
+    manager.store._modify(job_id, lambda data: data.update(worker))
+
+
+def test_jobs_of_a_previous_process_with_the_same_pid_are_failed(workers, monkeypatch):
+    first, second = workers
+    # 再起動後のプロセスが同じ pid（コンテナでは 1 など）で起動した
+    for job_id in ("stale1", "stale2"):
+        _stale_job(first, job_id, worker_pid=os.getpid(), worker_token="previous-process")
+
+    stale = second.get("stale1")
+    assert stale.status == JOB_FAILED
+    assert stale.error == WORKER_EXITED
+    # 残っていたジョブは上限 (max_concurrent_jobs + max_queued_jobs = 2) に数えない
+    _block_until_cancelled(second, monkeypatch)
+    job = second.submit()
+    assert second.get(job.id).status != JOB_FAILED
+    second.cancel(job.id)
+    assert job.done_event.wait(5)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc")
+def test_jobs_of_a_reused_pid_are_failed(workers):
+    first, second = workers
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        started = jobs._process_start_time(process.pid)
+        _stale_job(first, "reused", worker_pid=process.pid, worker_started=str(int(started) - 1))
+        _stale_job(first, "alive", worker_pid=process.pid, worker_started=started)
+
+        assert second.get("reused").status == JOB_FAILED
+        assert second.get("alive").status == JOB_RUNNING
+    finally:
+        process.kill()
+        process.wait()
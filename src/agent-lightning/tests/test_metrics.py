@@ -0,0 +1,58 @@
+"""
+metrics.py（Prometheus テキスト形式のメトリクス）のテスト
+"""
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    requests = Counter("test_requests_total", "Requests.", labels=("route", "status"), registry=registry)
+    requests.inc(route="/api/record", status="200")
+    requests.inc(2, route="/api/record", status="200")
+    requests.inc(route='/a"b\\c\nd', status="500")
+    Gauge("test_entries", "Entries.", registry=registry).set(1.5)
+    Gauge("test_queue", "Queue.", labels=("counter",), registry=registry).set_function(lambda: {("sent",): 3})
+
+    assert registry.render() == "\n".join([
+        "# HELP test_requests_total Requests.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{route="/api/record",status="200"} 3',
+        'test_requests_total{route="/a\\"b\\\\c\\nd",status="500"} 1',
+        "# HELP test_entries Entries.",
+        "# TYPE test_entries gauge",
+        "test_entries 1.5",
+        "# HELP test_queue Queue.",
+        "# TYPE test_queue gauge",
+        'test_queue{counter="sent"} 3',
+    ]) + "\n"
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("test_seconds", "Latency.", labels=("route",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route="/health")
+
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{route="/health",le="0.1"} 2',
+        'test_seconds_bucket{route="/health",le="1"} 3',
+        'test_seconds_bucket{route="/health",le="+Inf"} 4',
+        'test_seconds_sum{route="/health"} 3.65',
+        'test_seconds_count{route="/health"} 4',
+    ]
+
+
+def test_failing_gauge_function_is_skipped():
+    registry = Registry()
+    Gauge("test_broken", "Broken.", registry=registry).set_function(lambda: 1 / 0)
+    assert registry.render() == "# HELP test_broken Broken.\n# TYPE test_broken gauge\n"
+
+
+def test_duplicate_names_are_rejected():
+    registry = Registry()
+    Counter("test_total", "Total.", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("test_total", "Total.", registry=registry)
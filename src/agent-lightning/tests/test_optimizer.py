@@ -0,0 +1,132 @@
+"""
+AgentOptimizer の増分最適化のテスト
+"""
+
+import threading
+import time
+
+import agentlightning as agl
+import pytest
+
+from collector import Interaction
+from optimizer import AgentOptimizer
+
+
+def _record(collector, responses):
+    return [
+        collector.record_interaction("user", "calendar_create", f"予定{i}を追加して", response)
+        for i, response in enumerate(responses)
+    ]
+
+
+@pytest.fixture
+def optimizer(config):
+    return AgentOptimizer(config)
+
+
+def test_incremental_optimization_matches_full_recompute(collector, optimizer):
+    _record(collector, ["登録しました", "エラーが発生しました"])
+    first = optimizer.run_incremental_optimization(collector, num_iterations=2)
+    assert first["incremental"] is False
+    assert first["checkpoint_saved"]
+
+    # 先の時刻のインタラクションが後からコミットされても取りこぼさない
+    collector._writer.submit([Interaction(
+        id="late_user_20000101000000000000",
+        timestamp="2000-01-01T00:00:00",
+        user_id="late_user",
+        task_type="calendar_create",
+        user_message="遅れて届いた",
+        bot_response="✅ 予定を追加しました",
+        context={},
+    )]).result()
+    _record(collector, ["わかりません"])
+
+    second = optimizer.run_incremental_optimization(collector, num_iterations=2)
+    assert second["incremental"] is True
+    assert second["delta_samples"] == 2
+    assert second["num_samples"] == 4
+
+    full = optimizer.run_incremental_optimization(collector, num_iterations=2, full_recompute=True)
+    assert full["num_samples"] == 4
+    assert second["avg_final_reward"] == pytest.approx(full["avg_final_reward"])
+
+
+def test_cancelled_run_does_not_advance_checkpoint(collector, optimizer):
+    _record(collector, ["登録しました"])
+    cancel = threading.Event()
+    cancel.set()
+    cancelled = optimizer.run_incremental_optimization(collector, num_iterations=2, cancel_event=cancel)
+    assert cancelled["cancelled"]
+    assert not cancelled["checkpoint_saved"]
+
+    rerun = optimizer.run_incremental_optimization(collector, num_iterations=2)
+    assert rerun["incremental"] is False
+    assert rerun["delta_samples"] == 1
+
+
+def _samples(optimizer, responses):
+    return optimizer.prepare_training_data([
+        {"input": f"質問{i}", "output": response, "task_type": "general_query", "reward": 0.0}
+        for i, response in enumerate(responses)
+    ])
+
+
+def test_reward_cache_is_bounded_and_persisted(config):
+    config.reward_cache_size = 3
+    optimizer = AgentOptimizer(config)
+    rewards, scored = optimizer.score_samples(_samples(optimizer, ["登録しました", "エラー", "OK", "✅"]))
+    assert scored == 4
+    assert len(rewards) == 4
+
+    reloaded = AgentOptimizer(config)
+    samples = _samples(reloaded, ["登録しました", "エラー", "OK", "✅"])
+    again, scored = reloaded.score_samples(samples)
+    assert again == rewards
+    # 最も古い1件はキャッシュから追い出されている
+    assert scored == 1
+    assert len(reloaded._reward_cache) == 3
+    assert not list(reloaded.results_dir.glob("*.tmp"))
+
+
+def test_reward_cache_shared_between_threads(config):
+    optimizer = AgentOptimizer(config)
+    errors = []
+
+    def score(offset):
+        try:
+            for i in range(20):
+                optimizer.score_samples(_samples(optimizer, [f"応答{offset}-{i}-{j}" for j in range(50)]))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=score, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(AgentOptimizer(config)._load_reward_cache()) == 4 * 20 * 50
+
+
+def test_unreachable_agent_lightning_does_not_stall_the_run(config, monkeypatch):
+    calls = []
+
+    def unavailable(**kwargs):
+        calls.append(kwargs)
+        raise ConnectionError("Agent Lightning is down")
+
+    monkeypatch.setattr(agl, "emit_step", unavailable, raising=False)
+    config.emit_retry_backoff = 0.5
+    optimizer = AgentOptimizer(config)
+    data = [{"input": f"質問{i}", "output": f"応答{i}を登録しました", "task_type": "general_query"} for i in range(50)]
+
+    started = time.monotonic()
+    results = optimizer.run_optimization(data, num_iterations=10)
+    # 再試行のバックオフを待たず、最初の失敗以降は発行しない
+    assert time.monotonic() - started < 1.0
+    assert len(calls) == 1
+    assert results["emit_failed"]
+    assert len(results["rewards"]) == 10
+    assert results["best_reward"] is not None
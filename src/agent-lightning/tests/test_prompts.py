@@ -0,0 +1,57 @@
+"""
+PromptStore（最適化済みプロンプトの共有キャッシュ）のテスト
+"""
+
+import pytest
+
+from prompts import PromptStore, get_prompt_store, prompt_etag
+
+
+@pytest.fixture
+def stores(config):
+    """同じデータディレクトリを使う2つのワーカー"""
+    config.prompt_reload_interval = 0
+    return PromptStore(config), PromptStore(config)
+
+
+def test_update_is_picked_up_by_other_workers(stores):
+    ours, theirs = stores
+    assert ours.get("calendar_create") == (ours.default_prompt, False, ours.version)
+
+    theirs.update("calendar_create", "予定の作成に特化したプロンプト")
+    prompt, is_optimized, version = ours.get("calendar_create")
+    assert (prompt, is_optimized) == ("予定の作成に特化したプロンプト", True)
+    # version は内容から決まるのでワーカー間で一致する
+    assert version == theirs.version
+
+    # 他のワーカーの更新を取り込んでから書き込む
+    ours.update("task_create", "タスク用のプロンプト")
+    assert theirs.prompts() == {
+        "calendar_create": "予定の作成に特化したプロンプト",
+        "task_create": "タスク用のプロンプト",
+    }
+
+
+def test_reload_waits_for_the_interval(config):
+    config.prompt_reload_interval = 3600
+    ours, theirs = PromptStore(config), PromptStore(config)
+    theirs.update("calendar_create", "新しいプロンプト")
+    assert ours.get("calendar_create")[1] is False
+
+
+def test_unreadable_file_keeps_the_current_prompts(stores):
+    ours, theirs = stores
+    theirs.update("calendar_create", "プロンプト")
+    version = ours.version
+    ours.path.write_text('{"calendar_create": ', encoding="utf-8")
+    assert ours.get("calendar_create") == ("プロンプト", True, version)
+
+
+def test_stores_are_shared_per_data_directory(config):
+    assert get_prompt_store(config) is get_prompt_store(config)
+
+
+def test_etag_depends_on_version_and_task_type():
+    assert prompt_etag("calendar_create", "v1") == prompt_etag("calendar_create", "v1")
+    assert prompt_etag("calendar_create", "v1") != prompt_etag("task_create", "v1")
+    assert prompt_etag("calendar_create", "v1") != prompt_etag("calendar_create", "v2")
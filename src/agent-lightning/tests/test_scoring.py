@@ -0,0 +1,71 @@
+"""
+報酬計算（scoring.py）のテスト
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from optimizer import AgentOptimizer
+from scoring import BatchRewardScorer, score_in_parallel, score_response
+
+RESPONSES = [
+    None,
+    "",
+    "   \n\t",
+    "OK",
+    "予定を登録しました",
+    "✅ 明日10時に会議を登録しました 📅",
+    "エラー",
+    "エラーが発生しました。時間を指定してもう一度お試しください。",
+    "予定が見つかりません",
+    "削除に失敗しました。もう一度お試しください。",
+    "あ" * 9,
+    "あ" * 10,
+    "あ" * 200,
+    "あ" * 201,
+    "あ" * 500,
+    "登録" + "あ" * 499,
+    "👍" * 600,
+    "  前後に空白のある応答です（作成しました）  ",
+    "完了\x00エラー",
+]
+
+
+@pytest.mark.parametrize("success_reward, failure_reward", [(1.0, -1.0), (0.4, -0.1), (0.25, 0.0)])
+def test_batch_scorer_matches_score_response_exactly(success_reward, failure_reward):
+    scores = BatchRewardScorer(success_reward, failure_reward).score(RESPONSES)
+    expected = [score_response(response, success_reward, failure_reward) for response in RESPONSES]
+    # 丸めの誤差も含めてビット単位で一致する
+    assert [score.hex() for score in scores.tolist()] == [value.hex() for value in expected]
+
+
+def test_batch_scorer_handles_an_empty_batch():
+    assert BatchRewardScorer(1.0, -1.0).score([]).tolist() == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+def test_parallel_scoring_matches_serial(chunk_size):
+    serial = BatchRewardScorer(1.0, -1.0).score(RESPONSES)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parallel = score_in_parallel(RESPONSES, 1.0, -1.0, executor, chunk_size)
+    assert parallel.tolist() == serial.tolist()
+
+
+def test_optimizer_scores_samples_in_a_process_pool(config):
+    config.scoring_workers = 2
+    config.scoring_chunk_size = 4
+    optimizer = AgentOptimizer(config)
+    data = optimizer.prepare_training_data([
+        {"input": f"予定{i}", "output": response or "", "task_type": "calendar_create", "reward": 0.0}
+        for i, response in enumerate(RESPONSES)
+    ])
+    rewards, scored = optimizer.score_samples(data)
+    # チャンクに収まらないのでプロセスプールで採点した
+    assert optimizer._scoring_executor is not None
+    optimizer._scoring_executor.shutdown()
+
+    assert scored == len(data)
+    assert rewards == BatchRewardScorer(config.success_reward, config.failure_reward).score(
+        [item["messages"][2]["content"] for item in data]
+    ).tolist()
@@ -0,0 +1,184 @@
+"""
+storage.py（セグメントログ・グループコミット・ロック・索引）のテスト
+"""
+
+import pickle
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from conftest import MODULE_DIR
+from storage import FileLock, GroupCommitWriter, SegmentedLog, TimeIndex, read_snapshot, write_snapshot
+
+
+def _log(path, max_bytes=1 << 20):
+    return SegmentedLog(path, max_bytes=max_bytes, max_age_seconds=3600)
+
+
+def _records(n, start=0):
+    return [
+        {"id": f"user_{i}", "timestamp": f"2026-01-01T00:00:{i:02d}", "task_type": "calendar_create", "reward": None}
+        for i in range(start, start + n)
+    ]
+
+
+def test_partially_written_record_is_discarded_on_open(tmp_path):
+    log = _log(tmp_path)
+    log.append_many(_records(3))
+    log.save()
+    # 追記の途中でクラッシュした
+    with open(log.path(log.active), "ab") as f:
+        f.write(b'{"id": "user_3", "timest')
+
+    reopened = _log(tmp_path)
+    assert reopened.total_count() == 3
+    reopened.append_many(_records(1, start=3))
+    assert [record["id"] for record in _log(tmp_path).iter_records()] == ["user_0", "user_1", "user_2", "user_3"]
+
+
+def test_segments_rotate_and_read_from_any_position(tmp_path):
+    log = _log(tmp_path, max_bytes=300)
+    log.append_many(_records(10))
+    assert len(log.segments) > 1
+    assert all(segment.closed for segment in log.segments[:-1])
+    assert log.total_count() == 10
+
+    ids = [record["id"] for record in log.iter_records(start=3, limit=4)]
+    assert ids == ["user_3", "user_4", "user_5", "user_6"]
+    assert [record["id"] for record in log.tail_records(2)] == ["user_8", "user_9"]
+    assert log.find("user_7")["timestamp"] == "2026-01-01T00:00:07"
+
+
+def test_refresh_picks_up_records_appended_by_another_process(tmp_path):
+    lock = FileLock(tmp_path / "collector.lock")
+    with lock:
+        ours = _log(tmp_path, max_bytes=300)
+        theirs = _log(tmp_path, max_bytes=300)
+    with lock:
+        theirs.append_many(_records(6))
+        theirs.save()
+    with lock:
+        assert [record["id"] for record in ours.refresh()] == [f"user_{i}" for i in range(6)]
+        assert ours.total_count() == 6
+        assert ours.refresh() == []
+
+
+def test_group_commit_writer_batches_concurrent_writes():
+    batches = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def commit(items):
+        batches.append(list(items))
+        started.set()
+        release.wait(5)
+
+    writer = GroupCommitWriter(commit, max_batch=100)
+    first = writer.submit([0])
+    assert started.wait(5)
+    # コミット中に届いた書き込みは次のバッチにまとめられる
+    rest = [writer.submit([i]) for i in range(1, 6)]
+    release.set()
+    for future in [first] + rest:
+        future.result(5)
+    writer.close()
+
+    assert batches == [[0], [1, 2, 3, 4, 5]]
+    with pytest.raises(RuntimeError):
+        writer.submit([6])
+
+
+def test_group_commit_writer_reports_commit_errors():
+    def commit(items):
+        raise OSError("disk full")
+
+    writer = GroupCommitWriter(commit)
+    with pytest.raises(OSError):
+        writer.write([1])
+    writer.close()
+
+
+def test_file_lock_is_reentrant_and_excludes_other_processes(tmp_path):
+    path = tmp_path / "test.lock"
+    lock = FileLock(path)
+    child = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(MODULE_DIR)!r})
+        from storage import FileLock
+        with FileLock({str(path)!r}):
+            print("acquired", flush=True)
+    """)
+    with lock:
+        with lock:
+            pass
+        # 内側の with を抜けてもロックは保持したまま
+        process = subprocess.Popen([sys.executable, "-c", child], stdout=subprocess.PIPE, text=True)
+        time.sleep(0.3)
+        assert process.poll() is None
+    output, _ = process.communicate(timeout=10)
+    assert output.strip() == "acquired"
+
+
+def test_time_index_ranges_and_cursors():
+    index = TimeIndex()
+    entries = [
+        ("2026-01-01T00:00:03", "c", "task_create"),
+        ("2026-01-01T00:00:01", "a", "calendar_create"),
+        ("2026-01-01T00:00:02", "b", "calendar_create"),
+        ("2026-01-01T00:00:02", "b2", "task_create"),
+    ]
+    for entry in entries:
+        index.add(*entry)
+
+    assert [key[1] for key in index.range()] == ["a", "b", "b2", "c"]
+    assert [key[1] for key in index.range(after=("2026-01-01T00:00:02", "b"))] == ["b2", "c"]
+    assert [key[1] for key in index.range(since="2026-01-01T00:00:02", until="2026-01-01T00:00:03")] == ["b", "b2"]
+    assert [key[1] for key in index.range(task_type="task_create")] == ["b2", "c"]
+
+    index.remove("2026-01-01T00:00:03", "c", "task_create")
+    assert [key[1] for key in index.range(task_type="task_create")] == ["b2"]
+    rebuilt = TimeIndex()
+    rebuilt.rebuild(entries)
+    assert rebuilt.keys == sorted((timestamp, key) for timestamp, key, _ in entries)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    columns = {"id": ["a", "b"], "context": [{"source": "line"}, {}], "reward": [1.0, None]}
+    write_snapshot(path, columns, watermark=2)
+    snapshot = read_snapshot(path)
+    assert snapshot["watermark"] == 2
+    assert snapshot["columns"] == columns
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    write_snapshot(path, {"id": ["a", "b"]}, watermark=2)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert read_snapshot(path) is None
+
+    path.write_bytes(bytes(data[:20]))
+    assert read_snapshot(path) is None
+
+
+class _Payload:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (open, (str(self.marker), "w"))
+
+
+def test_pickled_snapshot_is_never_loaded(tmp_path):
+    # 以前の形式（pickle）のスナップショットは読まない（データディレクトリに書ける人がコードを実行できないように）
+    path = tmp_path / "snapshot.bin"
+    marker = tmp_path / "executed"
+    path.write_bytes(b"AGLSNAP1" + pickle.dumps(_Payload(marker)))
+    assert read_snapshot(path) is None
+    assert not marker.exists()
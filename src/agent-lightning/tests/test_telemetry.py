@@ -0,0 +1,55 @@
+"""
+EmissionQueue のテスト
+"""
+
+import contextvars
+import threading
+
+import agentlightning as agl
+import pytest
+
+from telemetry import EmissionQueue
+
+TRACE = contextvars.ContextVar("trace", default=None)
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    """発行されたイベントを (kind, 発行時の TRACE, スレッド名) として記録"""
+    events = []
+
+    def recorder(kind):
+        def emit(**kwargs):
+            events.append((kind, TRACE.get(), threading.current_thread().name))
+        return emit
+
+    monkeypatch.setattr(agl, "emit_step", recorder("step"), raising=False)
+    monkeypatch.setattr(agl, "emit_reward", recorder("reward"), raising=False)
+    return events
+
+
+def test_queued_events_keep_the_enqueue_context(config, emitted):
+    queue = EmissionQueue(config)
+    token = TRACE.set("request-1")
+    try:
+        queue.emit_step(name="line_bot_calendar_create")
+    finally:
+        TRACE.reset(token)
+    queue.emit_reward(reward=1.0)
+    assert queue.flush(5)
+
+    assert emitted == [("step", "request-1", "agl-emitter"), ("reward", None, "agl-emitter")]
+
+
+def test_emit_now_does_not_use_the_queue(config, emitted):
+    config.emit_queue_size = 1
+    queue = EmissionQueue(config)
+    queue.emit_reward(reward=1.0)
+    assert queue.flush(5)
+
+    for _ in range(10):
+        assert queue.emit_step_now(name="train_general")
+    assert all(thread == threading.current_thread().name for kind, _, thread in emitted if kind == "step")
+    stats = queue.stats()
+    assert stats["dropped"] == 0
+    assert stats["sent"] == 11